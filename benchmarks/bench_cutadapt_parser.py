@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for the edgen_cutadapt log parser.
+
+   Makes a synthetic log with lots of samples (all concatenated in one file, as
+   cutadapt logs can be) and times the old regex-per-line parser against
+   read_cutadapt_logs(), reporting lines per second for each.
+
+   $ python3 benchmarks/bench_cutadapt_parser.py [samples] [read_length]
+"""
+import sys, os, re
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from multiqc_edgen.modules.edgen_cutadapt.edgen_cutadapt import read_cutadapt_logs
+
+def make_log(samples, read_length=151):
+    """A plausible cutadapt 1.x log for this many samples, as a list of lines.
+    """
+    lines = []
+    for s in range(samples):
+        reads = 1000000 + s
+        lines.extend( l + '\n' for l in [
+            "This is cutadapt 1.16 with Python 3.6.3",
+            "Command line parameters: -a AGATCGGAAGAGC -O 5 -o /dev/null sample_{}.fastq.gz".format(s),
+            "Running on 1 core",
+            "Trimming 1 adapter(s) with at most 10.0% errors in single-end mode ...",
+            "Finished in 10.00 s (10 us/read; 6.00 M reads/minute).",
+            "",
+            "=== Summary ===",
+            "",
+            "Total reads processed:           {:,}".format(reads),
+            "Reads with adapters:                12,345 (1.2%)",
+            "Reads written (passing filters): {:,} (100.0%)".format(reads),
+            "",
+            "Total basepairs processed:   {:,} bp".format(reads * read_length),
+            "Quality-trimmed:                   0 bp (0.0%)",
+            "Total written (filtered):    {:,} bp (99.3%)".format(reads * read_length - 54321),
+            "",
+            "=== Adapter 1 ===",
+            "",
+            "Sequence: AGATCGGAAGAGC; Type: regular 3'; Length: 13; Trimmed: 12345 times.",
+            "",
+            "No. of allowed errors:",
+            "0-9 bp: 0; 10-13 bp: 1",
+            "",
+            "Bases preceding removed adapters:",
+            "  A: 20.0%",
+            "  C: 30.0%",
+            "  G: 30.0%",
+            "  T: 20.0%",
+            "  none/other: 0.0%",
+            "",
+            "Overview of removed sequences",
+            "length\tcount\texpect\tmax.err\terror counts" ] )
+        lines.extend( "{}\t{}\t{:.1f}\t{}\t{}\n".format(l, 1000 // l, reads / 4**min(l, 10), l // 10, 1000 // l)
+                      for l in range(5, read_length + 1) )
+        lines.append("\n")
+    return lines
+
+def legacy_parse(fh):
+    """The parser as it was in MultiQC_EdGen 1.5.1, minus the MultiQC bits.
+    """
+    res = []
+    regexes = {
+            'bp_processed': r"Total basepairs processed:\s*([\d,]+) bp",
+            'bp_written': r"Total written \(filtered\):\s*([\d,]+) bp",
+            'quality_trimmed': r"Quality-trimmed:\s*([\d,]+) bp",
+            'r_processed': r"Total reads processed:\s*([\d,]+)",
+            'r_with_adapters': r"Reads with adapters:\s*([\d,]+)"
+        }
+    s_name = None
+    for l in fh:
+        c_version = re.match(r'^This is cutadapt ([\d\.dev]+)', l)
+        if c_version:
+            s_name = None
+        if l.startswith('Command line parameters'):
+            s_name = l.split()[-1]
+            res.append( (s_name, dict(adapter_count=0), defaultdict(int)) )
+        if s_name is not None:
+            for k, r in regexes.items():
+                match = re.search(r, l)
+                if match:
+                    res[-1][1][k] = int(match.group(1).replace(',', ''))
+            if l.startswith('length\tcount\texpect\tmax.err'):
+                res[-1][1]['adapter_count'] += 1
+                for l in fh:
+                    r_seqs = re.search(r"^(\d+)\s+(\d+)\s+([\d\.]+)", l)
+                    if r_seqs:
+                        res[-1][2][int(r_seqs.group(1))] += int(r_seqs.group(2))
+                    else:
+                        break
+    return res
+
+def bench(func, lines, repeats=3):
+    """Best time of a few runs.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        res = func(iter(lines))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, res
+
+def main(samples=5000, read_length=151):
+    lines = make_log(samples, read_length)
+    print("Synthetic log: {} samples, {} lines".format(samples, len(lines)))
+
+    old_time, old_res = bench(legacy_parse, lines)
+    new_time, new_res = bench(read_cutadapt_logs, lines)
+
+    # The results need to be the same, or the timing is meaningless
+    assert [ (s, d, dict(h)) for s, d, h in old_res ] == [ (s, d, dict(h)) for s, d, h in new_res ]
+
+    print("before: {:10.0f} lines/sec ({:.2f}s)".format(len(lines) / old_time, old_time))
+    print("after:  {:10.0f} lines/sec ({:.2f}s)".format(len(lines) / new_time, new_time))
+    print("speedup: {:.1f}x".format(old_time / new_time))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
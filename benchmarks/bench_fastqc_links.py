@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for building the links in edgen_fastqc_original.
+
+   Makes a synthetic list of FastQC reports (two reads per sample) and times the
+   old way, where every sample filtered the whole list of reports, against indexing
+   the reports by sample and calling sample_links(). No files are copied.
+
+   $ python3 benchmarks/bench_fastqc_links.py [reports]
+"""
+import sys, os
+import time
+from collections import OrderedDict, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from multiqc import config
+from multiqc_edgen.modules.edgen_fastqc_original.edgen_fastqc_original import FQCReport, sample_links
+
+def make_reports(reports):
+    """Reports as found by find_log_files, which come in no particular order.
+    """
+    res = [ FQCReport( "10000AA{:04d}".format(n // 2), n % 2 + 1,
+                       "/fastqc/10000AA{:04d}_{}_fastqc.html".format(n // 2, n % 2 + 1) )
+            for n in range(reports) ]
+    return res[::2] + res[1::2]
+
+def legacy_links(html_reports):
+    """What tack_on_reports() used to do, minus the copying.
+    """
+    links = OrderedDict()
+    for s_name in sorted(set(r.sample for r in html_reports)):
+        reps = sorted( [ r for r in html_reports if r.sample == s_name ],
+                       key = lambda r: r.read )
+        links[s_name] = sample_links(reps)[0]
+    return links
+
+def indexed_links(html_reports):
+    """The new way, including building the index which is done in __init__
+    """
+    by_sample = defaultdict(list)
+    for r in html_reports:
+        by_sample[r.sample].append(r)
+
+    links = OrderedDict()
+    for s_name in sorted(by_sample):
+        links[s_name] = sample_links(sorted(by_sample[s_name], key = lambda r: r.read))[0]
+    return links
+
+def bench(func, reports):
+    start = time.perf_counter()
+    res = func(reports)
+    return time.perf_counter() - start, res
+
+def main(reports=10000):
+    config.data_dir_name = 'multiqc_data'
+    html_reports = make_reports(reports)
+    print("Synthetic input: {} reports".format(len(html_reports)))
+
+    old_time, old_res = bench(legacy_links, html_reports)
+    new_time, new_res = bench(indexed_links, html_reports)
+
+    # The results need to be the same, or the timing is meaningless
+    assert old_res == new_res
+
+    print("before: {:.3f}s".format(old_time))
+    print("after:  {:.3f}s".format(new_time))
+    print("speedup: {:.0f}x".format(old_time / new_time))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for rendering the metadata block in edgen_before_report.
+
+   Makes synthetic metadata with a mix of plain values, hyperlinks and x//y ordering
+   keys, and times yaml_to_html() at increasing sizes against the old version. The
+   time per key should stay flat as the number of keys goes up.
+
+   $ python3 benchmarks/bench_metadata_html.py [max_keys]
+"""
+import sys, os, re
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from multiqc_edgen.multiqc_edgen import edgen_before_report, escape
+
+def make_metadata(keys):
+    """A yaml_flat with this many keys.
+    """
+    res = OrderedDict()
+    for n in range(keys):
+        if n % 10 == 0:
+            res['t{}//Ordered key {}'.format(n % 7, n)] = 'value {}'.format(n)
+        elif n % 10 == 1:
+            res['z{}//Late key {}'.format(n % 5, n)] = 'value {}'.format(n)
+        elif n % 3 == 0:
+            res['Link {}'.format(n)] = ['see [here] for details', 'https://example.com/{}'.format(n)]
+        else:
+            res['Key {}'.format(n)] = 'value <{}>'.format(n)
+    return res
+
+def legacy_yaml_to_html(self, orig_keys=None, skip=(), hide=()):
+    """The old yaml_to_html and linkify, copied from before the change.
+    """
+    def linkify(val):
+        if type(val) is not list or len(val) != 2:
+            return escape(str(val))
+        if val[1] is None:
+            return escape(str(val[0]))
+        mo = re.match(r'(.*)\[(.*)\](.*)', val[0])
+        if mo:
+            label_bits = [ escape(p) for p in mo.groups() ]
+        else:
+            label_bits = [ '', escape(val[0]), '' ]
+        if re.match('https?://', val[1]):
+            return "{lb[0]}<a href='{link}'>{lb[1]}</a>{lb[2]}".format(lb=label_bits, link=val[1])
+        raise NotImplementedError("No files in this benchmark")
+
+    if orig_keys is None:
+        orig_keys = [ (n, n) for n in self.yaml_flat.keys() ]
+    early_keys = [ (x, y, k) for ((x, y), k) in
+                   [ (xy.split('//', 1), k) for (xy, k) in orig_keys if '//' in xy ]
+                   if x < 'n0' ]
+    late_keys =  [ (x, y, k) for ((x, y), k) in
+                   [ (xy.split('//', 1), k) for (xy, k) in orig_keys if '//' in xy ]
+                   if x >= 'n0' ]
+    keys = [ (y, k) for (x, y, k) in sorted(early_keys) ] + \
+           [ (y, k) for y, k in orig_keys if '//' not in y ] + \
+           [ (y, k) for (x, y, k) in sorted(late_keys) ]
+    keys = [ k for k in keys if k[0] not in skip and k[1] not in skip ]
+    res = ['''<div class="well"> <dl class="dl-horizontal" style="margin-bottom:0;">''']
+    for pk, yk in keys:
+        row_html = '<dt>{}</dt><dd>{}</dd>'.format(pk, linkify(self.yaml_flat[yk]))
+        if pk in hide or yk in hide:
+            res.append('<span class="unhideme" style="display: none;">{}</span>'.format(row_html))
+        else:
+            res.append(row_html)
+    res.append('''</dl></div>''')
+    return '\n'.join(res) + '\n'
+
+def bench(func, keys, repeats=5):
+    """Make a fresh object (without running the constructor, which wants a whole
+       MultiQC run) and render the block a few times, as happens once per lane.
+    """
+    obj = edgen_before_report.__new__(edgen_before_report)
+    obj.yaml_flat = make_metadata(keys)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        res = func(obj, skip={'Key 2'}, hide={'Key 4'})
+        times.append(time.perf_counter() - start)
+
+    # The best time is the least noisy
+    return min(times), res
+
+def main(max_keys=32000):
+    print("{:>8} {:>14} {:>14}".format("keys", "before us/key", "after us/key"))
+    keys = 1000
+    while keys <= max_keys:
+        old_time, old_res = bench(legacy_yaml_to_html, keys)
+        new_time, new_res = bench(edgen_before_report.yaml_to_html, keys)
+
+        # The results need to be the same, or the timing is meaningless
+        assert old_res == new_res
+
+        print("{:8d} {:14.2f} {:14.2f}".format(keys, old_time / keys * 1e6, new_time / keys * 1e6))
+        keys *= 2
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
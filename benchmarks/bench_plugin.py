@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Benchmark for the plugin as a whole, on a synthetic run of any size.
+
+   This makes a run folder with benchmarks/synthetic_run.py, then runs the file
+   search, each of our modules and each of our hooks in-process, much as the multiqc
+   command would, timing each one. Everything is run twice, as the first run on a
+   folder has to fill the caches and the second run (which is what happens for each
+   lane report) should be much quicker. gnuplot and apngasm-noopt are replaced by the
+   stubs in benchmarks/stubs unless you say --real-tools, so the interop timings
+   are mostly about our own overheads.
+
+   The results go to a JSON file so you can compare versions:
+
+   $ python3 -m benchmarks.bench_plugin --lanes 8 --samples 96 -o before.json
+   $ git checkout ...
+   $ python3 -m benchmarks.bench_plugin --lanes 8 --samples 96 -o after.json
+"""
+import sys, os
+import argparse
+import json
+import logging
+import platform
+import shutil
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+from .synthetic_run import make_run
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+
+MODULES = ['edgen_interop', 'edgen_cutadapt', 'edgen_unassigned', 'edgen_fastqc_original']
+
+def children_cpu():
+    if not resource:
+        return 0.0
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+def timed(func, *args):
+    """Call func and return a dict of timings, plus an error message if it failed.
+       Child CPU covers the gnuplot and apngasm processes.
+    """
+    start = (time.perf_counter(), time.process_time(), children_cpu())
+    res = dict()
+    try:
+        func(*args)
+    except UserWarning:
+        # This is how MultiQC modules say they found nothing
+        res['error'] = 'no files found'
+    except Exception as e:
+        res['error'] = repr(e)
+    end = (time.perf_counter(), time.process_time(), children_cpu())
+
+    res.update( wall = round(end[0] - start[0], 4),
+                cpu = round(end[1] - start[1], 4),
+                children_cpu = round(end[2] - start[2], 4) )
+    return res
+
+def setup_multiqc(run_dir, work_dir, extra_config):
+    """Set up the MultiQC config as the multiqc command would before running the
+       modules. The output goes under work_dir.
+    """
+    import yaml
+    import multiqc_edgen
+    from multiqc.utils import config, report
+
+    config.analysis_dir = [run_dir]
+    config.output_dir = os.path.join(work_dir, 'out')
+    config.data_dir_name = 'multiqc_data'
+    config.template = 'edgen'
+    config.run_modules = []
+    config.kwargs = dict()
+    config.update(extra_config)
+
+    # The search patterns the pipeline passes in its MultiQC config
+    with open(os.path.join(os.path.dirname(multiqc_edgen.__file__), 'utils', 'search_patterns.yaml')) as sfh:
+        config.update_dict(config.sp, yaml.safe_load(sfh))
+
+    report.edgen_run = dict()
+
+def fresh_output(work_dir, pass_name):
+    """Each pass gets new temp and data dirs, as the modules won't write over old ones.
+    """
+    from multiqc.utils import config
+
+    config.data_tmp_dir = os.path.join(work_dir, pass_name, 'tmp')
+    config.data_dir = os.path.join(work_dir, pass_name, 'multiqc_data')
+    os.makedirs(config.data_tmp_dir)
+    os.makedirs(config.data_dir)
+
+def run_pass(work_dir, pass_name):
+    """Time the file search, then the hooks and modules in the order MultiQC runs them.
+       Returns our timings plus the plugin's own timings of each stage within them.
+    """
+    import importlib
+    from multiqc.utils import config, report
+    from multiqc_edgen import multiqc_edgen
+    from multiqc_edgen.utils.mqc_internals import reset_report
+
+    # MultiQC expects to run once per process, so clear out the last pass
+    reset_report()
+    # MultiQC 1.9 keeps the search results in report.searchfiles, newer versions don't
+    if hasattr(report, 'searchfiles'):
+        del report.searchfiles[:]
+    if hasattr(report, 'files'):
+        report.files.clear()
+    fresh_output(work_dir, pass_name)
+    timings = dict()
+
+    # fastqc is in there because edgen_fastqc_original searches for the fastqc/zip files
+    timings['file_search'] = timed(report.get_filelist, MODULES + ['fastqc'])
+    timings['edgen_before_modules'] = timed(multiqc_edgen.edgen_before_modules)
+
+    for m in MODULES:
+        mod = importlib.import_module('multiqc_edgen.modules.' + m)
+        timings[m] = timed(mod.MultiqcModule)
+
+    timings['edgen_before_report'] = timed(multiqc_edgen.edgen_before_report)
+    timings['edgen_finish'] = timed(multiqc_edgen.edgen_finish)
+
+    # edgen_finish saves these
+    try:
+        with open(os.path.join(config.data_dir, 'multiqc_edgen_timings.json')) as tfh:
+            stages = json.load(tfh)['stages']
+    except FileNotFoundError:
+        stages = None
+
+    return timings, stages
+
+def count_files():
+    from multiqc.utils import report
+    return { k: len(v) for k, v in report.files.items() if v }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the plugin on a synthetic run.")
+    parser.add_argument('--lanes', type=int, default=2)
+    parser.add_argument('--samples', type=int, default=24, help="Samples per lane")
+    parser.add_argument('--cycles', type=int, default=151)
+    parser.add_argument('--barcodes', type=int, default=1000, help="Unassigned barcodes per lane")
+    parser.add_argument('--real-tools', action='store_true', help="Use the real gnuplot and apngasm-noopt")
+    parser.add_argument('--keep', action='store_true', help="Keep the run folder and output")
+    parser.add_argument('-o', '--output', default='bench_plugin.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_plugin_')
+    try:
+        if not args.real_tools:
+            os.environ['PATH'] = STUBS_DIR + os.pathsep + os.environ.get('PATH', '')
+        # Start with empty caches, and don't touch the real ones
+        os.environ['XDG_CACHE_HOME'] = os.path.join(work_dir, 'cache')
+
+        run_dir = os.path.join(work_dir, 'run')
+        start = time.perf_counter()
+        counts = make_run(run_dir, lanes=args.lanes, samples=args.samples,
+                                   cycles=args.cycles, barcodes=args.barcodes)
+        print("Made synthetic run in {:.1f}s".format(time.perf_counter() - start), file=sys.stderr)
+
+        setup_multiqc(run_dir, work_dir, dict())
+
+        from multiqc_edgen.version import __version__
+        results = dict( version = __version__,
+                        python = platform.python_version(),
+                        platform = platform.platform(),
+                        stub_tools = not args.real_tools,
+                        params = counts )
+
+        results['stages'] = dict()
+        results['cold'], results['stages']['cold'] = run_pass(work_dir, 'cold')
+        results['files_found'] = count_files()
+        results['warm'], results['stages']['warm'] = run_pass(work_dir, 'warm')
+    finally:
+        if args.keep:
+            print("Output left in {}".format(work_dir), file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir)
+
+    with open(args.output, 'w') as ofh:
+        json.dump(results, ofh, indent=2)
+        print(file=ofh)
+
+    print("{:24} {:>9} {:>9}".format('', 'cold', 'warm'))
+    for k in results['cold']:
+        print("{:24} {:9.3f} {:9.3f}  {}".format( k, results['cold'][k]['wall'], results['warm'][k]['wall'],
+                                                  results['warm'][k].get('error', '') ))
+    print("Results saved to {}".format(args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Benchmark for how much time the plugin adds to starting MultiQC.
+
+   The hooks and CLI options are registered for every MultiQC run, so their modules
+   get imported whether or not the report uses anything from this plugin. This runs
+   a fresh Python with -X importtime several times, importing MultiQC and the CLI
+   options as the multiqc command does, and adds up the time spent importing multiqc_edgen modules plus
+   anything they pull in that MultiQC had not already loaded.
+
+   $ python3 benchmarks/bench_plugin_import.py [runs]
+"""
+import sys, re
+import subprocess
+from statistics import median
+
+# What the multiqc command does before it gets going, without running anything
+STARTUP = '; '.join([ "import pkg_resources",
+                      "import multiqc.multiqc",
+                      "[ ep.load() for ep in pkg_resources.iter_entry_points('multiqc.cli_options.v1') ]" ])
+
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def plugin_import_time(python=sys.executable):
+    """Run one fresh interpreter and return (microseconds, modules) for the plugin.
+    """
+    res = subprocess.run( [python, '-X', 'importtime', '-c', STARTUP],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True )
+
+    # Each module is listed after the modules it imported, and nesting is shown by
+    # indentation. So go backwards to see the parents first, and only count the
+    # outermost multiqc_edgen modules, as the cumulative time covers the rest.
+    total = 0
+    modules = []
+    stack = []
+    for l in reversed(res.stderr.splitlines()):
+        mo = IMPORTTIME_RE.match(l)
+        if not mo:
+            continue
+        cumulative, level, name = int(mo.group(2)), len(mo.group(3)), mo.group(4)
+
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        nested = any( n.startswith('multiqc_edgen') for _, n in stack )
+        stack.append( (level, name) )
+
+        if name.startswith('multiqc_edgen'):
+            modules.append(name)
+            if not nested:
+                total += cumulative
+
+    return total, modules
+
+def main(runs=10):
+    times = []
+    for _ in range(runs):
+        t, modules = plugin_import_time()
+        times.append(t)
+
+    print("Plugin modules imported: {}".format(", ".join(sorted(modules))))
+    print("Plugin import time over {} runs: median {:.1f} ms, best {:.1f} ms".format(
+                runs, median(times) / 1000, min(times) / 1000 ))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Make a synthetic run folder with the files the plugin looks for, at any size.
+
+   The layout is loosely like an Illuminatus QC directory:
+
+     run_info.1.yml, run_info.2.yml          - metadata, including LaneCount
+     SampleSheet.csv                         - linked from the metadata
+     interop/*.interop_plot                  - GNUPlot scripts as from the InterOp tools
+     interop/flowcell_all.interop_plot       - one flowcell plot per cycle
+     lane{N}/*.cutadapt.log                  - several samples per log
+     lane{N}/lane{N}_unassigned_table.txt
+     lane{N}/fastqc/*_fastqc.zip and .html   - two reads per sample
+
+   Everything is made from a fixed random seed, so the same sizes always give the
+   same files.
+
+   $ python3 -m benchmarks.synthetic_run out_dir [--lanes 8] [--samples 96] [--cycles 151]
+"""
+import os
+import argparse
+import random
+import zipfile
+
+BASES = 'ACGT'
+
+def write_lines(filename, lines):
+    with open(filename, 'w') as fh:
+        for l in lines:
+            print(l, file=fh)
+
+def run_info_yaml(run_id, lanes, cycles, sample_sheet):
+    """Two run_info files, as the pipeline writes them at different stages.
+    """
+    yield 'run_info.1.yml', [ "Run Info:",
+                              "  Run ID: {}".format(run_id),
+                              "  LaneCount: {}".format(lanes),
+                              "  Cycles: {}".format(cycles),
+                              "  t1//Instrument: NovaSeq",
+                              "  Pipeline Start Timestamp: 1600000000",
+                              "  Sample Sheet: ['SampleSheet.csv [{}]', '{}']".format(run_id, sample_sheet),
+                              "  Run Folder: ['[{0}]', 'https://example.com/runs/{0}']".format(run_id) ]
+    yield 'run_info.2.yml', [ "post_demux_info:",
+                              "  Demultiplexing: Complete",
+                              "  z1//Barcode mismatches: 1" ] + \
+                            [ "  Lane {} Project: ['[Project {}]', 'https://example.com/projects/{}']".format(l, l, l)
+                              for l in range(1, lanes + 1) ]
+
+def gnuplot_header(run_id, output, title, terminal="set terminal png crop size 800,400"):
+    return [ "# Version: v1.1.10",
+             "# Run Folder: {}".format(run_id),
+             terminal,
+             "set output '{}'".format(output),
+             'set title "{}"'.format(title) ]
+
+def by_cycle_plot(run_id, cycles, rng):
+    """Intensity by cycle - a line per base, with one point per cycle.
+    """
+    lines = gnuplot_header(run_id, "{}_intensity-by-cycle_Intensity.png".format(run_id), "{} Intensity".format(run_id))
+    lines += [ 'set xrange [0 : {}]'.format(cycles + 1),
+               'set xlabel "Cycle"',
+               'set ylabel "Intensity"',
+               'set key outside',
+               'plot ' + ', '.join( '"-" using 1:2 title "{}" with lines lt rgb "{}"'.format(b, c)
+                                    for b, c in zip(BASES, ['red', 'blue', 'green', 'black']) ) ]
+    for b in BASES:
+        level = rng.uniform(800, 1200)
+        for c in range(1, cycles + 1):
+            lines.append("{}\t{:.1f}".format(c, level * (1 - c / (2.0 * cycles)) + rng.gauss(0, 20)))
+        lines.append("e")
+    return lines
+
+def qscore_histogram(run_id, rng):
+    lines = gnuplot_header(run_id, "{}_qscore-histogram_Q-Histogram.png".format(run_id), "{} Q-Score Histogram".format(run_id))
+    lines += [ 'set xlabel "Q-Score"',
+               'set ylabel "Total (million)"',
+               'plot "-" using 1:2 title "Q-Score" with boxes lt rgb "blue"' ]
+    for q in range(2, 42):
+        lines.append("{}\t{:.2f}".format(q, max(0, rng.gauss(q * q / 10.0, 5))))
+    lines.append("e")
+    return lines
+
+def qscore_heatmap(run_id, cycles, rng):
+    lines = gnuplot_header(run_id, "{}_q-heatmap_Q-Heatmap.png".format(run_id), "{} Q-Score Heat Map".format(run_id))
+    lines += [ 'set xlabel "Cycle"',
+               'set ylabel "Q-Score"',
+               'set view map',
+               'plot "-" matrix with image' ]
+    for q in range(42):
+        lines.append(' '.join( "{:.1f}".format(max(0, rng.gauss(q, 3))) for c in range(cycles) ))
+    lines.append("e")
+    lines.append("e")
+    return lines
+
+def flowcell_all_plot(run_id, cycles, lanes, rng, swaths=6, tiles=14):
+    """A flowcell heat map for every cycle. The InterOp tools leave a stray header
+       on the end, so we do too.
+    """
+    lines = []
+    for c in range(1, cycles + 1):
+        lines += gnuplot_header(run_id, "{}_flowcell-Intensity.png".format(run_id), "{} Intensity".format(run_id))
+        lines += [ 'set cbrange [50 : 300]',
+                   'set view map',
+                   'plot "-" matrix with image' ]
+        for l in range(lanes):
+            for t in range(tiles):
+                lines.append(' '.join( str(int(rng.gauss(200, 30))) for s in range(swaths) ))
+        lines.append("e")
+        lines.append("e")
+    lines.append("# Version: v1.1.10")
+    return lines
+
+def cutadapt_log(s_names, read_length, rng):
+    """A cutadapt log covering several samples, as our pipeline concatenates them.
+    """
+    lines = []
+    for s_name in s_names:
+        reads = rng.randint(1000000, 10000000)
+        dimers = rng.randint(0, reads // 100)
+        lines += [ "This is cutadapt 1.16 with Python 3.6.3",
+                   "Command line parameters: -a AGATCGGAAGAGC -O 5 -o /dev/null {}.fastq.gz".format(s_name),
+                   "Trimming 1 adapter(s) with at most 10.0% errors in single-end mode ...",
+                   "",
+                   "=== Summary ===",
+                   "",
+                   "Total reads processed:           {:,}".format(reads),
+                   "Reads with adapters:             {:,} (1.2%)".format(dimers * 3),
+                   "Reads written (passing filters): {:,} (100.0%)".format(reads),
+                   "",
+                   "Total basepairs processed:   {:,} bp".format(reads * read_length),
+                   "Quality-trimmed:                   0 bp (0.0%)",
+                   "Total written (filtered):    {:,} bp (99.3%)".format(reads * read_length - dimers * 100),
+                   "",
+                   "=== Adapter 1 ===",
+                   "",
+                   "Sequence: AGATCGGAAGAGC; Type: regular 3'; Length: 13; Trimmed: {} times.".format(dimers * 3),
+                   "",
+                   "Overview of removed sequences",
+                   "length\tcount\texpect\tmax.err\terror counts" ]
+        for l in range(3, read_length + 1):
+            # Mostly short trims, with a bump of adapter dimers at full length
+            count = rng.randint(0, dimers // l + 1)
+            if l >= read_length - 1:
+                count += dimers
+            if count:
+                lines.append("{}\t{}\t{:.1f}\t{}\t{}".format(l, count, reads / 4.0**min(l, 10), l // 10, count))
+        lines.append("")
+    return lines
+
+def unassigned_table(lane, barcodes, rng):
+    lines = [ "Lane {}: unassigned barcodes".format(lane),
+              "Count\tBarcode\tGuess" ]
+    counts = sorted( (int(rng.paretovariate(1.2) * 1000) for _ in range(barcodes)), reverse=True )
+    for c in counts:
+        bc = ''.join( rng.choice(BASES) for _ in range(8) ) + '+' + ''.join( rng.choice(BASES) for _ in range(8) )
+        lines.append("{:,}\t{}\t{}".format(c, bc, rng.choice(['', '', 'revcomp of known index'])))
+    return lines
+
+def fastqc_pair(out_dir, s_name, rng):
+    """A FastQC zip and HTML report. The zip holds a minimal fastqc_data.txt.
+    """
+    base = os.path.join(out_dir, s_name + '_fastqc')
+    with zipfile.ZipFile(base + '.zip', 'w') as zfh:
+        zfh.writestr(s_name + '_fastqc/fastqc_data.txt',
+                     "##FastQC\t0.11.8\n>>Basic Statistics\tpass\n#Measure\tValue\n"
+                     "Filename\t{}.fastq.gz\nTotal Sequences\t{}\n>>END_MODULE\n".format(s_name, rng.randint(1000, 100000)))
+    with open(base + '.html', 'w') as hfh:
+        # Real reports are a few hundred KB, mostly embedded images
+        hfh.write("<html><body><h1>{}</h1>{}</body></html>\n".format(s_name, 'x' * 200000))
+
+def make_run(out_dir, lanes=2, samples=24, cycles=151, barcodes=1000, seed=42):
+    """Make the whole run folder in out_dir. Returns a dict counting what was made.
+    """
+    rng = random.Random(seed)
+    run_id = '200101_A00291_0001_AHSYNTHXX'
+    read_length = cycles // 2
+    counts = dict(lanes=lanes, samples=samples, cycles=cycles, barcodes=barcodes,
+                  interop_plots=0, cutadapt_logs=0, unassigned_tables=0, fastqc_reports=0)
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample_sheet = os.path.join(out_dir, 'SampleSheet.csv')
+    write_lines(sample_sheet, ['[Data]', 'Lane,Sample_ID,index,index2'] +
+                              [ '{},{}_{},ACGTACGT,TGCATGCA'.format(l, l, s) for l in range(1, lanes+1)
+                                                                          for s in range(samples) ])
+    for fn, lines in run_info_yaml(run_id, lanes, cycles, sample_sheet):
+        write_lines(os.path.join(out_dir, fn), lines)
+
+    interop_dir = os.path.join(out_dir, 'interop')
+    os.makedirs(interop_dir, exist_ok=True)
+    for fn, lines in [ ("{}_intensity-by-cycle_Intensity.interop_plot".format(run_id), by_cycle_plot(run_id, cycles, rng)),
+                       ("{}_qscore-histogram_Q-Histogram.interop_plot".format(run_id), qscore_histogram(run_id, rng)),
+                       ("{}_q-heatmap_Q-Heatmap.interop_plot".format(run_id), qscore_heatmap(run_id, cycles, rng)),
+                       ("flowcell_all.interop_plot", flowcell_all_plot(run_id, cycles, lanes, rng)) ]:
+        write_lines(os.path.join(interop_dir, fn), lines)
+        counts['interop_plots'] += 1
+
+    for l in range(1, lanes + 1):
+        lane_dir = os.path.join(out_dir, 'lane{}'.format(l))
+        fastqc_dir = os.path.join(lane_dir, 'fastqc')
+        os.makedirs(fastqc_dir, exist_ok=True)
+
+        s_names = [ '{}_{}_{:04d}'.format(run_id[:6], l, s) for s in range(samples) ]
+
+        # Eight samples per cutadapt log
+        for n in range(0, samples, 8):
+            write_lines( os.path.join(lane_dir, 'part{}.cutadapt.log'.format(n // 8)),
+                         cutadapt_log(s_names[n:n+8], read_length, rng) )
+            counts['cutadapt_logs'] += 1
+
+        write_lines( os.path.join(lane_dir, 'lane{}_unassigned_table.txt'.format(l)),
+                     unassigned_table(l, barcodes, rng) )
+        counts['unassigned_tables'] += 1
+
+        for s_name in s_names:
+            for read in (1, 2):
+                fastqc_pair(fastqc_dir, '{}_R{}'.format(s_name, read), rng)
+                counts['fastqc_reports'] += 1
+
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Make a synthetic run folder for benchmarking.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--lanes', type=int, default=2)
+    parser.add_argument('--samples', type=int, default=24, help="Samples per lane")
+    parser.add_argument('--cycles', type=int, default=151)
+    parser.add_argument('--barcodes', type=int, default=1000, help="Unassigned barcodes per lane")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    counts = make_run(**vars(args))
+    print(", ".join("{} {}".format(v, k) for k, v in counts.items()))
+
+if __name__ == '__main__':
+    main()
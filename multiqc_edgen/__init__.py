@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
-from pkg_resources import get_distribution
 from multiqc.utils import config
 
-__version__ = get_distribution("multiqc_edgen").version
+from .version import __version__
 config.multiqc_edgen_version = __version__
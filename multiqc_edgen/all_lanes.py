@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+""" Make the per-lane reports in the same MultiQC process as the overview, for when
+    MultiQC is run with --all-lanes.
+
+    The file search and the metadata loading are done once, by the main MultiQC run.
+    Before the modules run, the files found are split up: the overview gets the files
+    that are not specific to any lane, and each lane gets the files for that lane plus
+    any listed in edgen_all_lanes.shared_files. Then after the overview is written we
+    re-run the modules for each lane on just the files for that lane, and render another
+    report. The steps that follow multiqc.py are in utils/mqc_internals.py.
+"""
+
+from fnmatch import fnmatch
+import logging
+import os, re
+import shutil
+import tempfile
+
+from multiqc.utils import report, config
+
+from .utils import mqc_internals
+from .utils.timings import timed
+
+log = logging.getLogger('multiqc')
+
+# A lane is identified by a directory or file name like 'lane1', 'lane_1' or 'Lane1'
+DEFAULT_LANE_PATTERN = r'(?<![a-z])lane_?(\d+)(?!\d)'
+
+# What the main run found, saved by split_files() before the overview took its share
+found = dict(files=None, modules=None)
+
+def lanes_config():
+    return getattr(config, 'edgen_all_lanes', None) or dict()
+
+def lane_pattern():
+    return re.compile(lanes_config().get('lane_pattern') or DEFAULT_LANE_PATTERN, re.IGNORECASE)
+
+def file_lane(f, lane_re):
+    """ Which lane does this file from report.files belong to? Returns None for files
+        which are not specific to any lane.
+    """
+    mo = lane_re.search(os.path.join(f['root'], f['fn']))
+    return int(mo.group(1)) if mo else None
+
+def is_shared(f, shared_files):
+    """ Is this file to go in every lane report? shared_files is a list of patterns
+        to match on the file name.
+    """
+    return any( fnmatch(f['fn'], p) for p in shared_files )
+
+def modules_to_run(files):
+    """ Get the names and configs of the modules that the main run searched for files
+        for, in the order MultiQC runs them. This has to be worked out before the modules
+        run, as those that find nothing for the overview will still be wanted for the lanes.
+    """
+    searched = set( k.split('/', 1)[0].lower() for k in files )
+
+    res = []
+    for name, mod_cust_config in mqc_internals.module_order():
+        if name in config.avail_modules and name.lower() in searched and name not in [ r[0] for r in res ]:
+            res.append( (name, mod_cust_config) )
+    return res
+
+def split_files():
+    """ Called before the modules run for the overview. Save all the files found for the
+        lane reports, and leave just the ones that are not specific to a lane for the
+        overview.
+    """
+    lane_re = lane_pattern()
+    found['files'] = report.files
+    found['modules'] = modules_to_run(report.files)
+
+    report.files = { sp_key: [ f for f in files if file_lane(f, lane_re) is None ]
+                     for sp_key, files in found['files'].items() }
+
+class LaneReports():
+    """ Makes a report for each lane after the main report (the overview) is written.
+    """
+    def __init__(self):
+        self.lane_re = lane_pattern()
+        self.report_name = lanes_config().get('report_name') or 'multiqc_report_lane{}'
+        self.shared_files = lanes_config().get('shared_files') or []
+
+        # Everything from the main run that we need to keep hold of
+        self.all_files = found['files'] if found['files'] is not None else report.files
+        self.modules = found['modules'] if found['modules'] is not None else modules_to_run(self.all_files)
+        self.lanes = self.find_lanes()
+
+    def find_lanes(self):
+        """ Lanes come from the LaneCount in the metadata, or else from the file names.
+        """
+        lane_count = report.edgen_run.get('lanes') or 0
+        if lane_count:
+            return list(range(1, lane_count + 1))
+
+        return sorted(set( l for files in self.all_files.values() for f in files
+                             for l in [file_lane(f, self.lane_re)] if l ))
+
+    def lane_files(self, lane):
+        """ The files for this lane, plus any listed in shared_files.
+        """
+        return { sp_key: [ dict(f) for f in files
+                           if file_lane(f, self.lane_re) == lane or is_shared(f, self.shared_files) ]
+                 for sp_key, files in self.all_files.items() }
+
+    def make_all(self, after_each=None):
+        """ Make all the lane reports. If after_each is supplied it will be called
+            after each report is written, while the config still points to it.
+        """
+        saved = dict( lane = config.kwargs.get('lane'),
+                      output_fn = config.output_fn,
+                      data_dir = config.data_dir,
+                      data_dir_name = config.data_dir_name,
+                      data_tmp_dir = config.data_tmp_dir,
+                      title = config.title,
+                      files = report.files )
+
+        log.info("Making reports for lanes {}".format(", ".join(str(l) for l in self.lanes)))
+        j_template = mqc_internals.load_template()
+        try:
+            for lane in self.lanes:
+                with timed('all_lanes.lane_report', 'lane{}'.format(lane)):
+                    made = self.make_lane_report(lane, j_template)
+                if made and after_each:
+                    after_each()
+        finally:
+            config.kwargs['lane'] = saved['lane']
+            config.output_fn = saved['output_fn']
+            config.data_dir = saved['data_dir']
+            config.data_dir_name = saved['data_dir_name']
+            config.data_tmp_dir = saved['data_tmp_dir']
+            config.title = saved['title']
+            report.files = saved['files']
+
+    def make_lane_report(self, lane, j_template):
+        report_name = self.report_name.format(lane)
+        output_fn = os.path.join(config.output_dir, report_name + '.html')
+        data_dir = os.path.join(config.output_dir, report_name + '_data')
+
+        if os.path.exists(output_fn) or (config.make_data_dir and os.path.exists(data_dir)):
+            if not config.force:
+                log.error("Not overwriting the existing report for lane {}. Use -f or --force.".format(lane))
+                return False
+            if os.path.exists(output_fn):
+                os.remove(output_fn)
+            if config.make_data_dir and os.path.exists(data_dir):
+                shutil.rmtree(data_dir)
+
+        log.info("Report      : {}".format(os.path.relpath(output_fn)))
+
+        # MultiQC has already removed its temp dir, and the modules need somewhere fresh
+        # to scratch about for each lane. If there's no data dir wanted, they still need
+        # somewhere to write.
+        if config.make_data_dir:
+            os.makedirs(data_dir)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            mqc_internals.reset_report()
+            report.files = self.lane_files(lane)
+            config.kwargs['lane'] = 'lane{}'.format(lane)
+            config.data_tmp_dir = os.path.join(tmp_dir, 'multiqc_data')
+            os.makedirs(config.data_tmp_dir)
+            config.data_dir = data_dir if config.make_data_dir else config.data_tmp_dir
+            config.data_dir_name = os.path.basename(data_dir)
+            config.output_fn = output_fn
+
+            for name, mod_cust_config in self.modules:
+                mqc_internals.run_module(name, mod_cust_config)
+            mqc_internals.trigger('after_modules')
+            mqc_internals.make_general_stats()
+            mqc_internals.save_report_data()
+
+            # This is where edgen_before_report sets the title and the navbar
+            mqc_internals.trigger('before_report_generation')
+            mqc_internals.trigger('before_template')
+
+            mqc_internals.write_report(j_template, output_fn)
+            return True
+        finally:
+            shutil.rmtree(tmp_dir)
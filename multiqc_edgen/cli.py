@@ -25,6 +25,12 @@ lane = click.option('--lane', 'lane',
     help = 'Say which lane this report relates to.'
 )
 
+# Make the overview and all the lane reports in one go
+all_lanes = click.option('--all_lanes', '--all-lanes', 'all_lanes',
+    is_flag = True,
+    help = 'Make the overview report plus a report for every lane.'
+)
+
 # And this
 pipeline_status = click.option('--pipeline_status', 'pipeline_status',
     type = str,
@@ -3,21 +3,92 @@
 """ MultiQC module to parse output from Cutadapt """
 from __future__ import print_function, division, absolute_import
 import logging
-import re
+import os, re
 from distutils.version import StrictVersion
 
 # python2 doesn't have this!
-from itertools import accumulate
+from itertools import accumulate, repeat
+from operator import mul, truediv
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from multiqc import config
 from multiqc.plots import linegraph
 from multiqc.modules.base_module import BaseMultiqcModule
 
+from ...utils.caching import default_cache_dir, analysis_dirs_key, FileStatCache
+from ...utils.timings import timed
+
 # Initialise the logger, ensuring massages go to the main
 # MultiQC modules log.
 log = logging.getLogger('multiqc.modules.' + __name__)
 
+# Lines in the log that we want to pick up numbers from. They are all of the form
+# "Label:    1,234 bp" so one pattern will do, and we only try it once per line.
+STATS_LABELS = { 'Total basepairs processed': 'bp_processed',
+                 'Total written (filtered)':  'bp_written',
+                 'Quality-trimmed':           'quality_trimmed',
+                 'Total reads processed':     'r_processed',
+                 'Reads with adapters':       'r_with_adapters' }
+STATS_RE = re.compile( r'\s*({}):\s*([\d,]+)'.format('|'.join(re.escape(l) for l in STATS_LABELS)) )
+
+HISTO_HEADER = 'length\tcount\texpect\tmax.err'
+HISTO_RE = re.compile(r'(\d+)\s+(\d+)\s+[\d\.]+')
+
+def read_cutadapt_logs(fh):
+    """ Go through one log file looking for cutadapt output. There may be multiple logs
+        in one file. Returns a list of (s_name, data, trimmed_histo) for each log seen,
+        with the sample name exactly as given on the command line.
+        This is a plain function rather than a method so it can be run anywhere, and it
+        only looks at each line once.
+    """
+    res = []
+    data = histo = None
+    for l in fh:
+        # Most lines are of no interest, so dispatch on how they start.
+        if l.startswith('This is cutadapt'):
+            #We're on a new log, and so a new sample.
+            data = None
+
+        # Get sample name from end of command line params
+        elif l.startswith('Command line parameters'):
+            data = dict(adapter_count=0)
+            histo = defaultdict(int)
+            res.append( (l.split()[-1], data, histo) )
+
+        elif data is None:
+            continue
+
+        # Histogram showing lengths trimmed. We'll ignore expect and max.err as they
+        # are fairly useless but still look for them in the header.
+        elif l.startswith(HISTO_HEADER):
+            # Nested loop to read this section while the regex matches
+            data['adapter_count'] += 1
+            for l in fh:
+                r_seqs = HISTO_RE.match(l)
+                if r_seqs:
+                    #Snag just cols 1 and 2
+                    #Adding up the numbers may not make sense if --times was set >1 when
+                    #running cutadapt, but in that case I don't know what would make sense.
+                    histo[int(r_seqs.group(1))] += int(r_seqs.group(2))
+                else:
+                    break #go back to main loop
+
+        # Overview stats
+        else:
+            match = STATS_RE.match(l)
+            if match:
+                data[STATS_LABELS[match.group(1)]] = int(match.group(2).replace(',', ''))
+
+    return res
+
+def read_cutadapt_file(filename):
+    """ Wrapper for read_cutadapt_logs that opens the file, for use in a process pool.
+    """
+    with open(filename, encoding='utf-8') as fh:
+        return read_cutadapt_logs(fh)
+
 def pct(n, d, nan=0.0, mul=100.0):
     """ Calculate a percentage (or ratio) while avoiding division by zero errors.
         Strictly speaking we should have nan=float('nan') but for practical
@@ -28,6 +99,17 @@ def pct(n, d, nan=0.0, mul=100.0):
     except (ZeroDivisionError, TypeError):
         return nan
 
+def reduced_points(histo, exact=11):
+    """ Pick out which lengths need to be kept to draw the cumulative plot of histo. The
+        first few points are always kept, but after that a point is only needed if the
+        line changes direction there. Where the histogram is flat (most commonly all zeros)
+        the cumulative line is straight, and Highcharts will draw exactly the same line
+        from the two ends. The last point is always kept.
+    """
+    last = len(histo) - 1
+    return [ n for n in range(len(histo))
+             if n < exact or n == last or histo[n] != histo[n+1] ]
+
 class MultiqcModule(BaseMultiqcModule):
     """ Cutadapt module class, parses stdout logs.
         This is a custom version for the EG Run reports. Support for cutadapt <1.7
@@ -49,9 +131,30 @@ class MultiqcModule(BaseMultiqcModule):
         self.cutadapt_data = dict()
         self.cutadapt_trimmed_histo = dict()
 
+        # Settings may be supplied in the MultiQC config under 'edgen_cutadapt'
+        self.mod_config = getattr(config, 'edgen_cutadapt', None) or dict()
+
         #Use the standard configuration when looking for cutadapt files.
-        for f in self.find_log_files('edgen_cutadapt', filehandles=True):
-            self.parse_cutadapt_log(f)
+        #With lots of files it may be worth setting edgen_cutadapt.processes to parse them in parallel.
+        #The results for each file are cached between runs, so only new or changed logs
+        #need to be read.
+        self.log_cache = self.open_log_cache()
+
+        processes = int(self.mod_config.get('processes') or 1)
+        with timed('edgen_cutadapt.parse'):
+            if processes > 1:
+                self.parse_cutadapt_logs_in_pool(processes)
+            else:
+                for f in self.find_log_files('edgen_cutadapt', filehandles=True):
+                    self.parse_cutadapt_log(f)
+
+        if self.log_cache:
+            try:
+                self.log_cache.save()
+                self.log_cache.evict(int(self.mod_config.get('cache_max_mb', 100)) * 1024 * 1024)
+            except OSError as e:
+                log.warning("Could not save the cutadapt results cache: {}".format(e))
+
         self.calculate_extra_numbers()
 
         if len(self.cutadapt_data) == 0:
@@ -60,8 +163,11 @@ class MultiqcModule(BaseMultiqcModule):
 
         log.info("Found {} reports".format(len(self.cutadapt_data)))
 
-        # Write parsed report data to a file
-        self.write_data_file(self.cutadapt_data, 'edgen_cutadapt')
+        # Write parsed report data to a file. The length histograms go in as lists, as they
+        # always have.
+        self.write_data_file( { s_name: dict(d, length_histo=self.length_histo_row(s_name).tolist())
+                                for s_name, d in self.cutadapt_data.items() },
+                              'edgen_cutadapt' )
 
         # Add the percentage of seqs <5bp to the general stats table
         self.cutadapt_general_stats_table()
@@ -73,60 +179,71 @@ class MultiqcModule(BaseMultiqcModule):
         )
 
 
+    def open_log_cache(self):
+        """ Get a FileStatCache for the results from the logs in this run, unless
+            edgen_cutadapt.cache is set to False.
+        """
+        if not self.mod_config.get('cache', True):
+            return None
+
+        cache_file = os.path.join( self.mod_config.get('cache_dir') or default_cache_dir('cutadapt'),
+                                   analysis_dirs_key(config.analysis_dir) + '.pickle' )
+        log.debug("Using cutadapt results cache {}".format(cache_file))
+        return FileStatCache(cache_file)
+
     def parse_cutadapt_log(self, f):
         """ Go through one log file looking for cutadapt output """
-        log.debug("Processing file {}".format(f['fn']))
-        fh = f['f']
-        regexes = {
-                'bp_processed': "Total basepairs processed:\s*([\d,]+) bp",
-                'bp_written': "Total written \(filtered\):\s*([\d,]+) bp",
-                'quality_trimmed': "Quality-trimmed:\s*([\d,]+) bp",
-                'r_processed': "Total reads processed:\s*([\d,]+)",
-                'r_with_adapters': "Reads with adapters:\s*([\d,]+)"
-            }
-        s_name = None
-        cutadapt_version = 'unknown'
-        for l in fh:
-            # Parse a line. Note there may be multiple logs in one file.
-            c_version = re.match(r'^This is cutadapt ([\d\.dev]+)', l)
-            if c_version:
-                #We're on a new log, and so a new sample.
-                s_name = None
-                cutadapt_version = c_version.group(1)
-
-            # Get sample name from end of command line params
-            if l.startswith('Command line parameters'):
-                s_name = l.split()[-1]
-                s_name = self.clean_s_name(s_name, f['root'])
-                self.add_data_source(f, s_name)
-                if s_name in self.cutadapt_data:
-                    log.warning("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                self.cutadapt_data[s_name] = dict(adapter_count=0)
-                self.cutadapt_trimmed_histo[s_name] = defaultdict(int)
-
-            if s_name is not None:
-
-                # Search regexes for overview stats
-                for k, r in regexes.items():
-                    match = re.search(r, l)
-                    if match:
-                        self.cutadapt_data[s_name][k] = int(match.group(1).replace(',', ''))
-
-                # Histogram showing lengths trimmed. We'll ignore expect and max.err as they
-                # are fairly useless but still look for them in the header.
-                if l.startswith('length\tcount\texpect\tmax.err'):
-                    # Nested loop to read this section while the regex matches
-                    self.cutadapt_data[s_name]['adapter_count'] += 1
-                    for l in fh:
-                        r_seqs = re.search("^(\d+)\s+(\d+)\s+([\d\.]+)", l)
-                        if r_seqs:
-                            #Snag just cols 1 and 2
-                            a_len = int(r_seqs.group(1))
-                            #Adding up the numbers may not make sense if --times was set >1 when
-                            #running cutadapt, but in that case I don't know what would make sense.
-                            self.cutadapt_trimmed_histo[s_name][a_len] += int(r_seqs.group(2))
-                        else:
-                            break #go back to main loop
+        log_path = os.path.join(f['root'], f['fn'])
+        logs = self.log_cache.get(log_path) if self.log_cache else None
+
+        if logs is None:
+            log.debug("Processing file {}".format(f['fn']))
+            stat_key = FileStatCache.stat_key(log_path)
+            logs = read_cutadapt_logs(f['f'])
+            if self.log_cache:
+                self.log_cache.put(log_path, logs, stat_key)
+        else:
+            log.debug("Using cached results for {}".format(f['fn']))
+
+        self.add_cutadapt_logs(f, logs)
+
+    def parse_cutadapt_logs_in_pool(self, processes):
+        """ Parse all the log files in worker processes. The results are added in the same
+            order as the files were found, so the outcome is just as if we'd parsed the files
+            one after another.
+        """
+        # We only need the file names, so don't have MultiQC open the files.
+        log_files = list(self.find_log_files('edgen_cutadapt', filecontents=False))
+        log_paths = [ os.path.join(f['root'], f['fn']) for f in log_files ]
+
+        # Anything in the cache doesn't need to go to the pool
+        all_logs = [ self.log_cache.get(p) if self.log_cache else None for p in log_paths ]
+        todo = [ n for n, logs in enumerate(all_logs) if logs is None ]
+        log.debug("Parsing {} of {} files with {} processes".format(len(todo), len(log_files), processes))
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            chunksize = max(1, len(todo) // (processes * 4))
+            stat_keys = [ FileStatCache.stat_key(log_paths[n]) for n in todo ]
+            for n, stat_key, logs in zip( todo, stat_keys,
+                                          pool.map(read_cutadapt_file, [ log_paths[n] for n in todo ], chunksize=chunksize) ):
+                all_logs[n] = logs
+                if self.log_cache:
+                    self.log_cache.put(log_paths[n], logs, stat_key)
+
+        for f, logs in zip(log_files, all_logs):
+            log.debug("Processing file {}".format(f['fn']))
+            self.add_cutadapt_logs(f, logs)
+
+    def add_cutadapt_logs(self, f, logs):
+        """ Add the results from read_cutadapt_logs() for file f to the module data.
+        """
+        for s_name, data, histo in logs:
+            s_name = self.clean_s_name(s_name, f['root'])
+            self.add_data_source(f, s_name)
+            if s_name in self.cutadapt_data:
+                log.warning("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.cutadapt_data[s_name] = data
+            self.cutadapt_trimmed_histo[s_name] = histo
 
     def calculate_extra_numbers(self):
         """Calculate a few extra numbers of our own.
@@ -144,46 +261,70 @@ class MultiqcModule(BaseMultiqcModule):
                                             float(d.get('bp_trimmed', 0)) + float(d.get('quality_trimmed', 0)),
                                             d['bp_processed'] )
 
-            #Re-work the cutadapt_trimmed_histo to be more useful for our purposes, showing
-            #length after trimming and filling in all zeros.
-            #(we don't tot up cumulative values at this point though)
-            lh = self.cutadapt_data[s_name]['length_histo'] = self.get_length_histo(s_name)
+        #Re-work the cutadapt_trimmed_histo to be more useful for our purposes, showing
+        #length after trimming and filling in all zeros.
+        #(we don't tot up cumulative values at this point though)
+        self.make_length_histos()
+
+        for s_name, d in self.cutadapt_data.items():
+            lh = self.length_histo_row(s_name)
 
             #Use this to ask how many of the sequences were less than SIZE_CUTOFF
             self.cutadapt_data[s_name]['percent_short'] = pct(
-                                            sum(lh[:self.SIZE_CUTOFF]), sum(lh[:]) )
-
+                                            sum(lh[:self.SIZE_CUTOFF]), sum(lh) )
 
-    def get_length_histo(self, s_name):
-        """Calculate the lengths of sequences after trimming, by subtracting the trimmed
-           values from the sequence length. For visualising short sequences and dimers this
-           makes more sense than a raw plot of bases trimmed.
-           We assume all the input sequences are the same length - if not, this will still produce
-           an array of numbers but they will be wrong.
+    def get_read_length(self, s_name):
+        """Infer the read length for a sample. If no reads were processed we just have to
+           return None.
+           We assume all the input sequences are the same length - if not, the histogram will
+           still be made but it will be wrong.
         """
         cdata = self.cutadapt_data[s_name]
         cth = self.cutadapt_trimmed_histo[s_name]
 
-        #If no reads were processed we just have to return an empty list
         if not cdata['r_processed']:
-            return []
+            return None
 
-        '''
-        if not cth:
-            # No reads were trimmed. Were any even processed?
-            return [ cdata['r_processed'] ] if cdata['r_processed'] else []
-        '''
+        return max([ (cdata['bp_processed'] // cdata['r_processed']),
+                     *cth.keys() ])
 
-        #Infer read length
-        read_length = max([ (cdata['bp_processed'] // cdata['r_processed']),
-                            *cth.keys() ])
+    def make_length_histos(self):
+        """Calculate the lengths of sequences after trimming, by subtracting the trimmed
+           values from the sequence length. For visualising short sequences and dimers this
+           makes more sense than a raw plot of bases trimmed.
 
-        # Return a list indexed by post_trim_length (tl) from 0 to read_length inclusive.
-        # Missing keys in cth will be replaced with zeros.
-        # The final entry will be all the untrimmed reads which are not in ctl, which we
-        # need to calculate.
-        return [ cth.get(read_length-tl,0) for tl in range(read_length) ] + \
-               [ cdata['r_processed'] - sum( cth.values() ) ]
+           All the histograms go into one array, with a row per sample indexed by post-trim
+           length (tl) from 0 to read_length inclusive. Rows for samples with shorter reads
+           are padded out with zeros, so use length_histo_row() to get the actual histogram.
+        """
+        read_lengths = { s_name: self.get_read_length(s_name) for s_name in self.cutadapt_data }
+
+        self.histo_width = max( [ rl + 1 for rl in read_lengths.values() if rl is not None ] or [0] )
+        self.histo_rows = dict()
+        self.length_histo = array('q', bytes(8 * self.histo_width * len(read_lengths)))
+
+        for row, (s_name, read_length) in enumerate(read_lengths.items()):
+            base = row * self.histo_width
+            if read_length is None:
+                self.histo_rows[s_name] = (base, base)
+                continue
+            self.histo_rows[s_name] = (base, base + read_length + 1)
+
+            # Missing keys in cth will be left as zeros.
+            # The final entry will be all the untrimmed reads which are not in cth, which we
+            # need to calculate.
+            cth = self.cutadapt_trimmed_histo[s_name]
+            for trimmed_len, count in cth.items():
+                if 0 < trimmed_len <= read_length:
+                    self.length_histo[base + read_length - trimmed_len] = count
+            self.length_histo[base + read_length] = self.cutadapt_data[s_name]['r_processed'] - sum( cth.values() )
+
+    def length_histo_row(self, s_name):
+        """Get the post-trim length histogram for one sample, as a memoryview on
+           self.length_histo so nothing is copied.
+        """
+        start, end = self.histo_rows[s_name]
+        return memoryview(self.length_histo)[start:end]
 
     def cutadapt_general_stats_table(self):
         """ Take the parsed stats from the Cutadapt report and add it to the
@@ -234,12 +375,32 @@ class MultiqcModule(BaseMultiqcModule):
 
         #The length_histo needs to be converted to cumulative values.
         #After doing that, we can divide all numbers by the total to get a percentage plot.
-        #Also, the lists need to be supplied as dicts
-        acc_len_10 = { k: dict(enumerate(accumulate(v['length_histo'][:11]))) for k, v in self.cutadapt_data.items() }
-        acc_perc_10 = { k: {k2: pct(l,self.cutadapt_data[k]['r_processed']) for k2, l in v.items()} for k, v in acc_len_10.items() }
+        #This is all done on whole rows at a time, and only at the end do the lists get
+        #supplied as dicts.
+        #For lanes with hundreds of samples the full-length plots get huge, so there is
+        #the option to only send the points needed to draw the lines.
+        reduce_points = self.mod_config.get('reduce_length_plot', False)
 
-        acc_len = { k: dict(enumerate(accumulate(v['length_histo']))) for k, v in self.cutadapt_data.items() }
-        acc_perc = { k: {k2: pct(l,self.cutadapt_data[k]['r_processed']) for k2, l in v.items()} for k, v in acc_len.items() }
+        acc_len_10, acc_perc_10, acc_len, acc_perc = dict(), dict(), dict(), dict()
+        for s_name, d in self.cutadapt_data.items():
+            histo = self.length_histo_row(s_name)
+            acc = array('q', accumulate(histo))
+
+            # Same as calling pct() on every value, but quicker
+            if d['r_processed']:
+                acc_pct = array('d', map(truediv, map(mul, acc, repeat(100.0)), repeat(float(d['r_processed']))))
+            else:
+                acc_pct = array('d', bytes(8 * len(acc)))
+
+            if reduce_points:
+                keep = reduced_points(histo)
+                acc_len[s_name] = { n: acc[n] for n in keep }
+                acc_perc[s_name] = { n: acc_pct[n] for n in keep }
+            else:
+                acc_len[s_name] = dict(enumerate(acc))
+                acc_perc[s_name] = dict(enumerate(acc_pct))
+            acc_len_10[s_name] = dict(enumerate(acc[:11]))
+            acc_perc_10[s_name] = dict(enumerate(acc_pct[:11]))
 
         plot = linegraph.plot([ acc_perc_10, acc_len_10, acc_perc, acc_len ], pconfig)
 
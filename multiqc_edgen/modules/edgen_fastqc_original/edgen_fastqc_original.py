@@ -5,13 +5,15 @@
 """
 import logging
 import sys, os, re
-import shutil
-from collections import namedtuple, OrderedDict
+from collections import namedtuple, OrderedDict, defaultdict
 from distutils.version import StrictVersion
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
 
+from ...utils.placement import data_dir_placer
+from ...utils.timings import timed
+
 from html import escape as html_escape
 from urllib.parse import quote as url_escape
 
@@ -19,6 +21,52 @@ from urllib.parse import quote as url_escape
 # MultiQC modules log.
 log = logging.getLogger('multiqc.modules.' + __name__)
 
+# Note there are maybe two FASTQC reports per fragment, so each report looks like:
+FQCReport = namedtuple('FQCReport', "sample read file".split())
+
+def sample_links(reps):
+    """ Make the HTML linking to the reports for one sample, where reps are already
+        sorted by read. Returns the HTML and a list of the report files to go into
+        the data_dir.
+    """
+    html = "<span class='alt_col_link'>"
+    for n, rep in enumerate(reps):
+
+        # This is a little funky but seems most legible...
+        rep_label = "{}_{}".format(rep.sample, rep.read) if len(reps) > 1 else rep.sample
+        link_label = rep_label if n == 0 else "..._{}".format(rep.read)
+        fname = os.path.basename(rep.file)
+
+        file_relpath = os.path.join( config.data_dir_name, fname )
+
+        html += "<a href='{f}' title='{rl} FastQC Report'>{ll}</a> ".format(
+                                f = url_escape(file_relpath),
+                                rl = html_escape(rep_label),
+                                ll = html_escape(link_label) )
+
+    html += "</span>"
+    return html, [ rep.file for rep in reps ]
+
+def find_missing(paths):
+    """ See which of the paths don't exist, looking at each directory just once rather
+        than calling stat() on every file.
+        Returns a set of the missing paths.
+    """
+    by_dir = defaultdict(list)
+    for p in paths:
+        by_dir[os.path.dirname(p)].append(p)
+
+    missing = set()
+    for d, dir_paths in by_dir.items():
+        try:
+            with os.scandir(d or '.') as it:
+                present = set( e.name for e in it )
+        except OSError:
+            present = set()
+        missing.update( p for p in dir_paths if os.path.basename(p) not in present )
+
+    return missing
+
 class MultiqcModule(BaseMultiqcModule):
     """ Grab FastQC HTML reports. The .zip files are still fed to the regular
         FastQC modules.
@@ -31,57 +79,60 @@ class MultiqcModule(BaseMultiqcModule):
             href='http://www.bioinformatics.babraham.ac.uk/projects/fastqc/',
             info="are the original HTML files produced by FastQC. Paired-end runs have two reports per library.")
 
-        # Find any HTML reports. We have to do this by finding the associated zips! Note there are maybe two FASTQC reports
-        # per fragment, so each report looks like:
-        FQCReport = namedtuple('FQCReport', "sample read file".split())
-        self.html_reports = []
-
-        for zip_report in self.find_log_files('fastqc/zip', filehandles=True):
-
-            self.html_reports.append( FQCReport( zip_report['s_name'],
-                                                 zip_report.get('read_pairs'),
-                                                 re.sub('\.zip$', '.html', zip_report['f'].name) ) )
-
-            zip_report['f'].close()
+        # Find any HTML reports. We have to do this by finding the associated zips!
+        # The zips don't need to be opened, as the file names are all we need.
+        with timed('edgen_fastqc_original.parse'):
+            found_reports = [ FQCReport( zip_report['s_name'],
+                                         zip_report.get('read_pairs'),
+                                         os.path.join( zip_report['root'],
+                                                       re.sub(r'\.zip$', '.html', zip_report['fn']) ) )
+                              for zip_report in self.find_log_files('fastqc/zip', filecontents=False) ]
+
+            # Check all the HTML files are there, and complain just once about any that are not.
+            missing = find_missing( r.file for r in found_reports )
+        if missing:
+            log.warning("{} of {} FastQC HTML reports are missing, eg. {}".format(
+                                len(missing), len(found_reports), sorted(missing)[0] ))
+
+        # The reports are indexed by sample as we go.
+        self.html_reports = defaultdict(list)
+        for r in found_reports:
+            if r.file not in missing:
+                self.html_reports[r.sample].append(r)
 
         if not self.html_reports:
             log.debug("Could not find any reports in {}".format(config.analysis_dir))
             raise UserWarning
 
-        self.samples_list = sorted(set(r.sample for r in self.html_reports))
-        log.info("Found {} reports for {} samples".format(len(self.html_reports), len(self.samples_list)))
+        self.samples_list = sorted(self.html_reports)
+        log.info("Found {} reports for {} samples".format( sum(len(r) for r in self.html_reports.values()),
+                                                           len(self.samples_list) ))
 
         self.add_section( name = "Reports",
                           content = self.tack_on_reports() )
 
     def tack_on_reports(self):
         """ Copy every file into the data_dir and bung in a link to it here.
+            First we work out all the links and where the files go, then do the copying
+            all at once, with edgen_fastqc_original.copy_threads running at a time.
         """
+        mod_config = getattr(config, 'edgen_fastqc_original', None) or dict()
         links = OrderedDict()
+        plan = []
 
         # Go through the already-sorted list of samples.
         for s_name in self.samples_list:
-            links[s_name] = "<span class='alt_col_link'>"
-
-            # Cycle through the reports. Presumably there are one or two.
-            reps = sorted( [ r for r in self.html_reports if r.sample == s_name ],
-                           key = lambda r: r.read )
-            for n, rep in enumerate(reps):
-
-                # This is a little funky but seems most legible...
-                rep_label = "{}_{}".format(rep.sample, rep.read) if len(reps) > 1 else rep.sample
-                link_label = rep_label if n == 0 else "..._{}".format(rep.read)
-                fname = os.path.basename(rep.file)
 
-                shutil.copy(rep.file, os.path.join( config.data_dir, fname ))
-                file_relpath = os.path.join( config.data_dir_name, fname )
+            # Presumably there are one or two reports.
+            reps = sorted( self.html_reports[s_name], key = lambda r: r.read )
+            links[s_name], files = sample_links(reps)
 
-                links[s_name] += "<a href='{f}' title='{rl} FastQC Report'>{ll}</a> ".format(
-                                        f = url_escape(file_relpath),
-                                        rl = html_escape(rep_label),
-                                        ll = html_escape(link_label) )
+            plan.extend( (f, os.path.join( config.data_dir, os.path.basename(f) )) for f in files )
 
-            links[s_name] += "</span>"
+        placer = data_dir_placer(config)
+        with timed('edgen_fastqc_original.place'):
+            placer.place_all(plan, threads=int(mod_config.get('copy_threads', 8)))
+        placer.log_summary("FastQC reports")
 
         #Output in sorted order.
         if not links:
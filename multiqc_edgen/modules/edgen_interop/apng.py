@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+""" A minimal APNG assembler for the flowcell_all cycle animations.
+
+    The frames from GNUPlot are all the same size and mostly the same from one
+    cycle to the next, so rather than storing every frame in full (as apngasm-noopt
+    does) we only store the band of rows that changed since the previous frame.
+    This is done without decoding any pixels - we compare the filtered scanlines
+    straight out of the IDAT data, which is cheap enough to do in pure Python.
+
+    apng-make-sliders.js needs to be able to jump straight to any frame, so every
+    so often a full keyframe is written. The slider renders forward from the last
+    keyframe, so the delta frames are drawn over the correct background.
+
+    Every frame of an APNG is decoded with the palette and colour settings of the
+    first, so frames that differ in any of these are refused and the caller falls
+    back to apngasm-noopt.
+"""
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# APNG frame control values
+DISPOSE_OP_NONE = 0
+BLEND_OP_SOURCE = 0
+
+# Channels for each PNG colour type
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# Chunks that change how the pixel data is turned into colours. These are only written
+# once, so they must be the same in every frame.
+COLOUR_CHUNKS = { b'PLTE', b'tRNS', b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT' }
+
+def read_chunks(filename):
+    """Yield (type, data) for all the chunks in a PNG file.
+    """
+    with open(filename, 'rb') as fh:
+        if fh.read(8) != PNG_SIGNATURE:
+            raise ValueError("{} is not a PNG file".format(filename))
+        while True:
+            head = fh.read(8)
+            if len(head) < 8:
+                raise ValueError("{} is truncated".format(filename))
+            length, ctype = struct.unpack('>I4s', head)
+            data = fh.read(length)
+            fh.read(4) # CRC - trust it
+            yield ctype, data
+            if ctype == b'IEND':
+                break
+
+def make_chunk(ctype, data):
+    """Encode a PNG chunk, with the length and CRC.
+    """
+    return struct.pack('>I', len(data)) + ctype + data + \
+           struct.pack('>I', zlib.crc32(ctype + data) & 0xffffffff)
+
+class PNGFrame():
+    """The bits of a PNG we need to make a frame. The pixel data is left filtered.
+    """
+    def __init__(self, filename):
+        self.extra_chunks = []
+        idat = []
+        for ctype, data in read_chunks(filename):
+            if ctype == b'IHDR':
+                self.ihdr = data
+            elif ctype == b'IDAT':
+                idat.append(data)
+            elif ctype != b'IEND' and not idat:
+                # Things like PLTE, gAMA and sRGB which precede the image data
+                self.extra_chunks.append( (ctype, data) )
+
+        self.colour_chunks = [ c for c in self.extra_chunks if c[0] in COLOUR_CHUNKS ]
+
+        self.width, self.height, bit_depth, colour_type, _, _, interlace = struct.unpack('>IIBBBBB', self.ihdr)
+        if interlace:
+            raise ValueError("{} is interlaced, which is not supported".format(filename))
+
+        self.zdata = b''.join(idat)
+        raw = zlib.decompress(self.zdata)
+
+        # Each scanline has a filter type byte and then the row of (filtered) pixel data.
+        bits_per_pixel = CHANNELS[colour_type] * bit_depth
+        stride = (self.width * bits_per_pixel + 7) // 8 + 1
+        if len(raw) != stride * self.height:
+            raise ValueError("{} has the wrong amount of image data".format(filename))
+
+        self.rows = [ raw[y*stride:(y+1)*stride] for y in range(self.height) ]
+
+    def changed_band(self, prev):
+        """Work out which rows need to be re-drawn to turn prev into this frame, as a
+           (top, bottom) range.
+
+           Comparing filtered rows is safe so long as we allow for the filters that look
+           at the previous row (Up, Average and Paeth). If the previous row changed then so
+           must this one, even if the filtered bytes are the same. Conversely a row may be
+           flagged as changed when it's actually the same, but that's harmless.
+
+           Also the top row of the band will be decoded as if the row above were zeros,
+           so it has to be a row that doesn't depend on the one above (filter None or
+           Sub), or the first row in the image.
+        """
+        top = bottom = None
+        prev_clean = True
+        for y, (row, prev_row) in enumerate(zip(self.rows, prev.rows)):
+            clean = (row == prev_row) and (row[0] in (0, 1) or prev_clean)
+            if not clean:
+                if top is None:
+                    top = y
+                bottom = y + 1
+            prev_clean = clean
+
+        if top is None:
+            # Frames are the same. We still need a frame, so just re-draw the top row.
+            return (0, 1)
+
+        while top > 0 and self.rows[top][0] not in (0, 1):
+            top -= 1
+
+        return (top, bottom)
+
+def assemble_apng(out_filename, frame_filenames, keyframe_interval=10, delay=(1, 10)):
+    """Make an APNG from a list of PNG files, which all need to be the same size and type.
+       Every keyframe_interval frames a full frame is stored. Set keyframe_interval to
+       1 to store every frame in full, or 0 to only store the first one in full.
+       Returns the size of the file written.
+       Raises ValueError if the PNG files are not suitable.
+    """
+    if not frame_filenames:
+        raise ValueError("No frames to assemble")
+    if keyframe_interval < 0:
+        raise ValueError("keyframe_interval must not be negative")
+
+    seq = 0
+    def fctl(width, height, x, y):
+        nonlocal seq
+        res = make_chunk( b'fcTL', struct.pack('>IIIIIHHBB', seq, width, height, x, y,
+                                                             delay[0], delay[1],
+                                                             DISPOSE_OP_NONE, BLEND_OP_SOURCE) )
+        seq += 1
+        return res
+
+    with open(out_filename, 'wb') as ofh:
+        prev = None
+        for n, fn in enumerate(frame_filenames):
+            frame = PNGFrame(fn)
+
+            if prev is None:
+                # The first frame doubles up as the default image, so goes in IDAT.
+                ihdr = frame.ihdr
+                first_colour_chunks = frame.colour_chunks
+                ofh.write(PNG_SIGNATURE)
+                ofh.write(make_chunk(b'IHDR', ihdr))
+                ofh.write(make_chunk(b'acTL', struct.pack('>II', len(frame_filenames), 0)))
+                for ctype, data in frame.extra_chunks:
+                    ofh.write(make_chunk(ctype, data))
+                ofh.write(fctl(frame.width, frame.height, 0, 0))
+                ofh.write(make_chunk(b'IDAT', frame.zdata))
+
+            else:
+                # The IHDR has the size, bit depth and colour type
+                if frame.ihdr != ihdr:
+                    raise ValueError("{} does not match the size and type of the first frame".format(fn))
+                if frame.colour_chunks != first_colour_chunks:
+                    raise ValueError("{} does not have the same palette or colour settings as the first frame".format(fn))
+
+                if keyframe_interval and n % keyframe_interval == 0:
+                    # Full keyframe, and we can keep the existing compressed data.
+                    top, bottom = 0, frame.height
+                    zdata = frame.zdata
+                else:
+                    top, bottom = frame.changed_band(prev)
+                    zdata = zlib.compress(b''.join(frame.rows[top:bottom]), 9)
+
+                ofh.write(fctl(frame.width, bottom - top, 0, top))
+                ofh.write(make_chunk(b'fdAT', struct.pack('>I', seq) + zdata))
+                seq += 1
+
+            prev = frame
+
+        ofh.write(make_chunk(b'IEND', b''))
+        return ofh.tell()
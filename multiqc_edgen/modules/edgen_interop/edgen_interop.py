@@ -3,19 +3,113 @@
 """ MultiQC module to include interop data"""
 from __future__ import print_function, division, absolute_import
 import logging
-import re, os
+import re, os, time, math
+import shutil
 
 import base64
+from itertools import chain
 from html import escape as html_escape
 from subprocess import Popen, PIPE, DEVNULL
+from concurrent.futures import ThreadPoolExecutor
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
 
+from ...utils.caching import default_cache_dir
+from ...utils.timings import timed
+from .render_cache import RenderCache
+from .apng import assemble_apng
+
 # Initialise the logger, ensuring massages go to the main
 # MultiQC modules log.
 log = logging.getLogger('multiqc.modules.' + __name__)
 
+def run_gnuplot(lines, cwd):
+    """Pipe the lines into a new GNUPlot process running in cwd and return
+       the exit status.
+    """
+    try:
+        with timed('edgen_interop.gnuplot', os.path.basename(cwd)), \
+             Popen( "gnuplot",
+                    stdin = PIPE,
+                    stderr = DEVNULL,
+                    cwd = cwd,
+                    bufsize = 1,
+                    universal_newlines = True) as gnuplot_process:
+
+            for line in lines:
+                print(line, file=gnuplot_process.stdin, end='')
+    except FileNotFoundError:
+        # Most likely we're using the internal renderer and it gave up on this one
+        log.error("GNUPlot is not installed, so a plot is missing.")
+        return 127
+
+    # Accessing gnuplot_process outside the context manager looks weird but it
+    # is correct.
+    if gnuplot_process.returncode != 0:
+        log.warning("GNUPlot returned {}.".format(gnuplot_process.returncode))
+
+    return gnuplot_process.returncode
+
+def plot_title_from_file(plot_file):
+    """Make a title from the output file name, which is like RUN_q-heatmap_Q-Heatmap.png
+    """
+    # FIXME - title can maybe be better. For now, here's some string munging
+    return ' '.join([ w.capitalize() for n in plot_file.split('_') if '-' in n for w in n.split('-') ]).split('.')[0]
+
+def number(v):
+    """Whole numbers as int, so the axis labels and data files don't all end in .0
+    """
+    return int(v) if v.is_integer() else v
+
+def linegraph_data(plots):
+    """Turn the Series from gnuplot_script into data for MultiQC's linegraph, as
+       { series_name: { x: y } }, plus a dict of any colours given.
+    """
+    data, colours = dict(), dict()
+    for n, series in enumerate(plots):
+        name = series.title or "Series {}".format(n + 1)
+        data[name] = { number(x): number(y) for x, y in series.data.tolist()
+                       if math.isfinite(x) and math.isfinite(y) }
+        if series.colour:
+            colours[name] = series.colour
+    return data, colours
+
+def heatmap_data(matrix, yreverse=False):
+    """Turn a matrix from gnuplot_script into (data, xcats, ycats) for MultiQC's heatmap.
+       GNUPlot puts row 0 at the bottom, whereas MultiQC puts the first row at the top.
+    """
+    xcats = [ str(x) for x in range(matrix.shape[1]) ]
+    ycats = [ str(y) for y in range(matrix.shape[0]) ]
+    data = [ [ number(v) if math.isfinite(v) else None for v in row ] for row in matrix.tolist() ]
+    if not yreverse:
+        data.reverse()
+        ycats.reverse()
+    return data, xcats, ycats
+
+def palette_colstops(palette, steps=8):
+    """Colour stops for a MultiQC heatmap, from 'set palette defined' or else GNUPlot's
+       default palette (rgbformulae 7,5,15).
+    """
+    palette = sorted(palette or [])
+    if len(palette) > 1 and palette[0][0] != palette[-1][0]:
+        lo, hi = palette[0][0], palette[-1][0]
+        return [ [ (v - lo) / (hi - lo), c ] for v, c in palette ]
+
+    def rgb(x):
+        r, g, b = math.sqrt(x), x ** 3, max(0.0, math.sin(2 * math.pi * x))
+        return '#{:02x}{:02x}{:02x}'.format(*( int(round(c * 255)) for c in (r, g, b) ))
+    return [ [ n / steps, rgb(n / steps) ] for n in range(steps + 1) ]
+
+def b64_chunks(filename, chunk_size=3 * 64 * 1024):
+    """Base64 encode a file a piece at a time, so we never need to hold the
+       raw file in memory. chunk_size must be a multiple of 3 so there is
+       no padding in the middle of the output.
+    """
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            yield base64.b64encode(chunk).decode('ascii')
+
 class MultiqcModule(BaseMultiqcModule):
     """ InterOP module.
 
@@ -35,21 +129,59 @@ class MultiqcModule(BaseMultiqcModule):
         # Prepare to store any interop_plot files found
         self.interop_plots = dict()
         self.interop_plot_files = dict()
+        self.native_plots = dict()
 
+        # Settings may be supplied in the MultiQC config under 'edgen_interop'
+        self.mod_config = getattr(config, 'edgen_interop', None) or dict()
 
         self.tmp_dir = os.path.join(config.data_tmp_dir, 'edgen_interop')
 
-        for n, f in enumerate(self.find_log_files('edgen_interop', filehandles=True)):
-            if f.get('fn','').startswith('flowcell_all'):
-                # Special handling for these
-                self.process_flowcell_all_plot(n, f)
-            else:
-                self.process_interop_plot(n, f)
+        # Rendered plots are kept between runs, as the same scripts are plotted for the
+        # overview and every lane. Set edgen_interop.render_cache to False to bypass this.
+        self.render_cache = None
+        if self.mod_config.get('render_cache', True):
+            try:
+                self.render_cache = RenderCache( self.mod_config.get('render_cache_dir') or
+                                                    default_cache_dir('interop_render'),
+                                                 int(self.mod_config.get('render_cache_max_mb', 500)) * 1024 * 1024 )
+            except OSError as e:
+                log.warning("Not using the render cache: {}".format(e))
+
+        # Plots can be drawn in-process, with GNUPlot only for scripts that the internal
+        # renderer can't handle.
+        self.plot_renderer = self.get_plot_renderer()
+
+        # How often the flowcell_all APNG gets a full frame
+        self.keyframe_interval = self.get_keyframe_interval()
+
+        # The GNUPlot jobs are independent so we run them in a pool. The work is all done
+        # in subprocesses so threads are fine here. Each job returns a (title, file) pair
+        # and the results are collected in the order the files were found.
+        self.render_jobs = []
+        self.gnuplot_threads = int(self.mod_config.get('gnuplot_threads') or os.cpu_count() or 1)
+        log.debug("Rendering plots with up to {} GNUPlot processes".format(self.gnuplot_threads))
+
+        with ThreadPoolExecutor(max_workers=self.gnuplot_threads) as self.gnuplot_pool:
+            for n, f in enumerate(self.find_log_files('edgen_interop', filehandles=True)):
+                # This only times reading the files, as the rendering happens in the pool
+                with timed('edgen_interop.parse', f['fn']):
+                    if f.get('fn','').startswith('flowcell_all'):
+                        # Special handling for these
+                        self.process_flowcell_all_plot(n, f)
+                    else:
+                        self.process_interop_plot(n, f)
+
+            self.collect_render_jobs()
+
+        if self.render_cache:
+            self.render_cache.evict()
 
         # Abort if none found
         log.info("Found {} files".format(len(self.interop_plots)))
         if not self.interop_plots:
-            return
+            # Like the other modules, so there's no empty InterOP section (eg. in the lane
+            # reports made with --all-lanes)
+            raise UserWarning
 
         # Write parsed report data to a file (currently this just lists the file names,
         # but it needs to be a dict of dict (normally sample->factor->value)
@@ -59,6 +191,46 @@ class MultiqcModule(BaseMultiqcModule):
         for sect in self.interop_plots_html():
             self.add_section(**sect)
 
+    def get_plot_renderer(self):
+        """Get the in-process renderer, or None to use GNUPlot for everything.
+           By default GNUPlot is used if it is installed.
+        """
+        renderer = self.mod_config.get('renderer', 'auto')
+        if renderer == 'auto':
+            renderer = 'gnuplot' if shutil.which('gnuplot') else 'internal'
+        if renderer != 'internal':
+            return None
+
+        try:
+            from .plot_render import PlotRenderer
+            return PlotRenderer()
+        except ImportError as e:
+            log.warning("Cannot draw plots in-process, so using GNUPlot: {}".format(e))
+            return None
+
+    def get_keyframe_interval(self):
+        """Check edgen_interop.apng_keyframe_interval, which must be a whole number of
+           cycles. 0 means no keyframes after the first. Anything else gets a warning and
+           the default.
+        """
+        setting = self.mod_config.get('apng_keyframe_interval', 10)
+        try:
+            if int(setting) == float(setting) and int(setting) >= 0:
+                return int(setting)
+        except (TypeError, ValueError):
+            pass
+        log.warning("edgen_interop.apng_keyframe_interval should be a number of cycles, or 0,"
+                    " not {!r}. Using 10.".format(setting))
+        return 10
+
+    def render_in_process(self, lines, cwd):
+        """Try to draw the plot in cwd without GNUPlot. Returns True if this worked.
+        """
+        if not self.plot_renderer:
+            return False
+        with timed('edgen_interop.render', os.path.basename(cwd)):
+            return self.plot_renderer.render(lines, cwd)
+
     def process_flowcell_all_plot(self, plotnum, f):
         """Deals with the multi-plot files found in flowcell_all.interop_plot,
            where I've run interop_plot_flowcell --filter-by-cycle=N in a loop
@@ -70,9 +242,8 @@ class MultiqcModule(BaseMultiqcModule):
         # Start GNUPlot within the new empty dir and to pipe in the commands
         # to make a bunch of files.
         # We can assume gnuplot is in the path (it should be in the TOOLBOX)
+        terminal = "set terminal pngcairo size {},{} enhanced font 'sans,10'\n".format(800, 450)
         def munger(ifh):
-            width = 800
-            height = 450
             cycle = 0
             title_match = re.compile(r'set title "(.*)"')
             for line in ifh:
@@ -88,7 +259,7 @@ class MultiqcModule(BaseMultiqcModule):
                 #    line = "set cbrange [50:300]\n"
                 # Fudge the image size.
                 if line.startswith('set terminal'):
-                    line = "set terminal pngcairo size {},{} enhanced font 'sans,10'\n".format(width, height)
+                    line = terminal
                 # Fudge the file name
                 if line.startswith('set output'):
                     assert cycle
@@ -100,31 +271,117 @@ class MultiqcModule(BaseMultiqcModule):
 
                 yield line
 
-        # Annoyingly I can't see how to get GNUPlot to output multiple plots in one call.
-        # Answers on a postcard, please? In the meantime...
-        eof = False
-        munged_lines = munger(f['f']) # Returns a iterator, not a list.
-        while not eof:
-            with Popen( "gnuplot",
-                        stdin = PIPE,
-                        stderr = DEVNULL,
-                        cwd = tmp_dir,
-                        bufsize = 1,
-                        universal_newlines = True) as gnuplot_process:
-
-                for line in munged_lines:
-                    if line is None:
-                        break # Drops out to return code check
-                    else:
-                        print(line, file=gnuplot_process.stdin, end='')
-                else:
-                    # This only happens when we really run out of lines
-                    eof = True
+        # Split the commands into one list per cycle. The file handle will be closed
+        # once we return, so munge the whole thing now and leave the slow part to the pool.
+        frames = [[]]
+        for line in munger(f['f']):
+            if line is None:
+                frames.append([])
+            else:
+                frames[-1].append(line)
+
+        # Maybe we made this already?
+        cache_key = self.cache_key( frames, 'flowcell_all', terminal,
+                                    self.mod_config.get('flowcell_all_output', 'apng'),
+                                    self.mod_config.get('apng_builder', 'internal'),
+                                    self.keyframe_interval )
+        if self.fetch_cached(cache_key, tmp_dir):
+            self.render_jobs.append( ([], lambda results: self.flowcell_all_result(tmp_dir)) )
+            self.flag_slider()
+            return
 
+        # Annoyingly GNUPlot used to be started afresh for every cycle, which is a lot of
+        # process spawning on a long run. Now by default the frames are fed through a few
+        # long-lived sessions, but the old way is still available.
+        mode = self.mod_config.get('flowcell_all_mode', 'session')
+        start_time = time.time()
+        if mode == 'per_cycle':
+            jobs = [ self.gnuplot_pool.submit(self.render_frames_per_cycle, tmp_dir, frames) ]
+        else:
+            sessions = int(self.mod_config.get('flowcell_all_sessions') or self.gnuplot_threads)
+            shard_size = -(-len(frames) // max(1, sessions))
+            jobs = [ self.gnuplot_pool.submit(self.render_frames_in_session, tmp_dir, frames[i:i+shard_size])
+                     for i in range(0, len(frames), shard_size) ]
+
+        def finisher(results):
+            # Each job says if all its frames were drawn
+            frames_ok = all(results)
+            log.debug("Rendered {} flowcell_all frames in {:.2f}s using {} GNUPlot sessions (mode={})".format(
+                                                len(frames), time.time() - start_time, len(jobs), mode))
+            if mode == 'compare':
+                self.compare_per_cycle_timing(tmp_dir, frames, time.time() - start_time)
+            if self.mod_config.get('flowcell_all_output', 'apng') == 'frames':
+                # The frames go into the report as they are
+                return self.store_cached(cache_key, self.flowcell_all_result(tmp_dir), frames_ok)
+            assembled_ok = self.assemble_flowcell_all_plot(tmp_dir)
+            return self.store_cached(cache_key, self.flowcell_all_result(tmp_dir), frames_ok and assembled_ok)
+
+        self.render_jobs.append( (jobs, finisher) )
+        self.flag_slider()
+
+    def flag_slider(self):
+        """Need to indicate to the report that APNG (or at least the slider code) should
+           be included in the template.
+        """
+        # How to do this?
+        # The hacky way, of course:
+        from multiqc.utils import report
+        report.edgen_run['include_slider'] = True
+        if self.mod_config.get('flowcell_all_output', 'apng') != 'frames':
+            report.edgen_run['include_apng'] = True
+
+    def render_frames_per_cycle(self, tmp_dir, frames):
+        """The original approach, where GNUPlot is run once for every frame.
+           Returns True if every frame was drawn without error.
+        """
+        # Note there is a rogue header on the end so the last frame is normally empty.
+        # Fortunately running gnuplot on an empty command list is fine.
+        all_ok = True
+        for frame in frames:
+            if not self.render_in_process(frame, tmp_dir):
+                all_ok = (run_gnuplot(frame, tmp_dir) == 0) and all_ok
+        return all_ok
+
+    def render_frames_in_session(self, tmp_dir, frames):
+        """Render a run of frames with a single GNUPlot process. Each frame sets its
+           own output file, so all we need to do is stop settings from one cycle
+           leaking into the next.
+           Any frames the internal renderer can do are done first.
+           Returns True if every frame was drawn without error.
+        """
+        frames = [ frame for frame in frames if not self.render_in_process(frame, tmp_dir) ]
+        if not frames:
+            return True
+
+        def session_lines():
+            for frame in frames:
+                yield from frame
+                yield "unset output\n"
+                yield "reset\n"
 
-            if gnuplot_process.returncode != 0:
-                log.warning("GNUPlot returned {}.".format(gnuplot_process.returncode))
+        return run_gnuplot(session_lines(), tmp_dir) == 0
 
+    def compare_per_cycle_timing(self, tmp_dir, frames, session_time):
+        """Re-render the frames the old way in a scratch directory, just to log how
+           long it takes. Only for mode=compare, as this doubles the work.
+        """
+        scratch_dir = tmp_dir + '_per_cycle'
+        os.makedirs(scratch_dir, exist_ok=False)
+        try:
+            start_time = time.time()
+            self.render_frames_per_cycle(scratch_dir, frames)
+            per_cycle_time = time.time() - start_time
+        finally:
+            shutil.rmtree(scratch_dir)
+
+        log.debug("flowcell_all timing for {} frames: {:.2f}s with sessions vs {:.2f}s with one"
+                  " process per cycle ({:.1f}x)".format( len(frames), session_time, per_cycle_time,
+                                                         per_cycle_time / (session_time or 1e-6) ))
+
+    def assemble_flowcell_all_plot(self, tmp_dir):
+        """Makes the frames from process_flowcell_all_plot into an APNG. Returns True
+           if this worked, so the result can be cached.
+        """
         # See what files was made
         gp_output = os.listdir(tmp_dir)
         log.debug(repr(gp_output))
@@ -134,28 +391,62 @@ class MultiqcModule(BaseMultiqcModule):
         if any(not re.match(r'^flowcell_all_cycle_\d\d\d\d.png$', f) for f in gp_output):
             log.error("GNUPlot produced unexpected files not matching the expected name.")
 
+        # By default, make the APNG in-process, only saving the parts of each frame that change.
+        if self.mod_config.get('apng_builder', 'internal') == 'internal':
+            frame_files = sorted( os.path.join(tmp_dir, f) for f in gp_output
+                                  if re.match(r'^flowcell_all_cycle_\d\d\d\d.png$', f) )
+            try:
+                with timed('edgen_interop.apng', tmp_dir):
+                    apng_size = assemble_apng( os.path.join(tmp_dir, "flowcell_all.apng"),
+                                               frame_files,
+                                               keyframe_interval = self.keyframe_interval )
+
+                # apngasm-noopt stores each frame as-is, so the frames add up to about what it
+                # would have made.
+                frames_size = sum( os.path.getsize(f) for f in frame_files )
+                log.info("Assembled {} frames into {} bytes of APNG, vs {} bytes of PNG frames ({:.0f}% saving)".format(
+                                len(frame_files), apng_size, frames_size, 100.0 * (1 - apng_size / (frames_size or 1)) ))
+
+                return True
+            except ValueError as e:
+                log.warning("Falling back to apngasm-noopt: {}".format(e))
+
         # Turn these plots into an APNG using apngasm. This program has funky syntax but
         # here it works well. Note that for our purposes I need the fudged version that
         # disables inter-frame optimisation.
-        apngasm_process = Popen( ["apngasm-noopt", "flowcell_all.apng", "flowcell_all_cycle_0001.png", "-kp", "-kc"],
-                                 stdout = DEVNULL,
-                                 cwd = tmp_dir )
-        apngasm_process.communicate()
+        with timed('edgen_interop.apngasm', tmp_dir):
+            apngasm_process = Popen( ["apngasm-noopt", "flowcell_all.apng", "flowcell_all_cycle_0001.png", "-kp", "-kc"],
+                                     stdout = DEVNULL,
+                                     cwd = tmp_dir )
+            apngasm_process.communicate()
         if apngasm_process.returncode != 0:
             log.warning("apngasm-noopt returned {}.".format(apngasm_process.returncode))
+            return False
+
+        return True
 
+    def flowcell_all_result(self, tmp_dir):
+        """The (plot_title, plot_path) pair for the flowcell_all plot. If we're keeping
+           the individual frames then plot_path is a list of all the frames.
+           Returns None if nothing was made, so the plot is left out of the report.
+        """
         # FIXME - title can maybe be better. For now, here's some string munging
         plot_file = "flowcell_all.apng"
         plot_title = "Flowcell Intensity all Cycles"
 
-        self.interop_plots[plot_title] = dict(plot_file=plot_file)
-        self.interop_plot_files[plot_title] = os.path.join(tmp_dir, plot_file)
+        if self.mod_config.get('flowcell_all_output', 'apng') == 'frames':
+            frame_files = sorted( os.path.join(tmp_dir, f) for f in os.listdir(tmp_dir)
+                                  if re.match(r'^flowcell_all_cycle_\d\d\d\d.png$', f) )
+            if not frame_files:
+                log.error("No flowcell_all frames were made, so leaving out the plot.")
+                return None
+            return plot_title, frame_files
 
-        # Need to indicate to the report that APNG should be included in the template.
-        # How to do this?
-        # The hacky way, of course:
-        from multiqc.utils import report
-        report.edgen_run['include_apng'] = True
+        if not os.path.exists(os.path.join(tmp_dir, plot_file)):
+            log.error("{} was not made, so leaving out the plot.".format(plot_file))
+            return None
+
+        return plot_title, os.path.join(tmp_dir, plot_file)
 
     def process_interop_plot(self, plotnum, f):
         """Needs to deal with a .interop_plot file as produced by the interop tools.
@@ -174,76 +465,273 @@ class MultiqcModule(BaseMultiqcModule):
         # commands.
         # assume gnuplot is in the path
 
-        def munger(ifh, fn=''):
-            # Heat maps want to be wider to align with line graphs
-            width = 890 if 'heatmap' in fn else 800
-            height = 450
+        # Heat maps want to be wider to align with line graphs
+        width = 890 if 'heatmap' in f['fn'] else 800
+        height = 450
+        terminal = "set terminal pngcairo size {},{} enhanced font 'sans,10'\n".format(width, height)
+        def munger(ifh):
             for line in ifh:
                 if line.startswith('set terminal'):
-                    line = "set terminal pngcairo size {},{} enhanced font 'sans,10'\n".format(width, height)
+                    line = terminal
                 yield line
 
-        with Popen( "gnuplot",
-                    stdin = PIPE,
-                    stderr = DEVNULL,
-                    cwd = tmp_dir,
-                    bufsize = 1,
-                    universal_newlines = True) as gnuplot_process:
+        munged_lines = list(munger(f['f']))
 
-            for line in munger(f['f'], f['fn']):
-                print(line, file=gnuplot_process.stdin, end='')
+        # Maybe the data can go into the report rather than a picture of it?
+        if self.mod_config.get('plot_format', 'image') == 'native' and self.add_native_plot(munged_lines):
+            return
 
-        # Accessing gnuplot_process outside the context manager looks weird but it
-        # is correct.
-        retcode = gnuplot_process.returncode
+        cache_key = self.cache_key([munged_lines], 'interop_plot', terminal)
+        if self.fetch_cached(cache_key, tmp_dir):
+            self.render_jobs.append( ([], lambda results: self.find_interop_plot(tmp_dir)) )
+        else:
+            self.render_jobs.append( ( [self.gnuplot_pool.submit(self.render_interop_plot,
+                                                                 tmp_dir, munged_lines, cache_key)],
+                                       None ) )
+
+    def render_interop_plot(self, tmp_dir, munged_lines, cache_key=None):
+        """Draws the plot for process_interop_plot, in-process or with GNUPlot. This is
+           called within the pool and returns a (plot_title, plot_path) pair, or None if
+           no plot was made.
+        """
+        render_ok = self.render_in_process(munged_lines, tmp_dir) or \
+                    run_gnuplot(munged_lines, tmp_dir) == 0
 
-        if retcode != 0:
-            log.warning("GNUPlot returned {}.".format(retcode))
+        # Only a clean render of the one plot we expect is worth keeping
+        res = self.find_interop_plot(tmp_dir)
+        return self.store_cached(cache_key, res, render_ok and len(os.listdir(tmp_dir)) == 1)
 
+    def find_interop_plot(self, tmp_dir):
+        """Work out what plot was made in tmp_dir and what it should be called.
+        """
         # See what file was made
         gp_output = os.listdir(tmp_dir)
 
         if len(gp_output) != 1:
             log.error("GNUPlot produced no files or unexpected files: {}".format(gp_output))
+            if not gp_output:
+                return None
 
-        # FIXME - title can maybe be better. For now, here's some string munging
         plot_file = gp_output[0]
-        plot_title = ' '.join([ w.capitalize() for n in plot_file.split('_') if '-' in n for w in n.split('-') ]).split('.')[0]
 
-        self.interop_plots[plot_title] = dict(plot_file=plot_file)
-        self.interop_plot_files[plot_title] = os.path.join(tmp_dir, plot_file)
+        return plot_title_from_file(plot_file), os.path.join(tmp_dir, plot_file)
+
+    def add_native_plot(self, lines):
+        """Read the data from the GNUPlot script, to be plotted by MultiQC. Returns False
+           if the script can't be read, in which case it should be rendered as usual.
+        """
+        try:
+            # This needs numpy, which is not a requirement of the plugin
+            from .gnuplot_script import parse_script, UnsupportedScript
+        except ImportError as e:
+            log.warning("Cannot read the plot data, so making an image: {}".format(e))
+            return False
+
+        try:
+            pages = [ p for p in parse_script(lines) if p.plots and p.settings['output'] ]
+        except UnsupportedScript as e:
+            log.debug("Making an image as the plot data can't be read: {}".format(e))
+            return False
+        if not pages:
+            return False
+
+        plot_file = pages[-1].settings['output']
+        plot_title = plot_title_from_file(plot_file)
+        self.interop_plots[plot_title] = dict(plot_file=plot_file, plot_format='native')
+        self.native_plots[plot_title] = pages
+        return True
+
+    def cache_key(self, frames, *settings):
+        """Get the key for the render cache, or None if the cache is off.
+           frames is a list of lists of GNUPlot commands.
+        """
+        if not self.render_cache:
+            return None
+        # The plots look different if drawn in-process
+        if self.plot_renderer:
+            settings += ('internal',)
+        return self.render_cache.key( (l for frame in frames for l in frame), *settings )
+
+    def fetch_cached(self, cache_key, tmp_dir):
+        """Try to get a rendered plot from the cache into tmp_dir.
+        """
+        if not cache_key:
+            return False
+        return bool(self.render_cache.fetch(cache_key, tmp_dir))
+
+    def store_cached(self, cache_key, res, render_ok=True):
+        """Save the plot from a (plot_title, plot_path) pair into the cache, and
+           return the same pair. If render_ok is False, or any of the files are missing,
+           nothing is saved, as we don't want to keep serving up a broken plot.
+        """
+        if cache_key and res and render_ok:
+            plot_paths = res[1] if isinstance(res[1], list) else [res[1]]
+            if not plot_paths or not all( os.path.exists(p) for p in plot_paths ):
+                log.debug("Not caching render {} as files are missing".format(cache_key))
+                return res
+            self.render_cache.store( cache_key, os.path.dirname(plot_paths[0]),
+                                     [ os.path.basename(p) for p in plot_paths ] )
+        return res
+
+    def collect_render_jobs(self):
+        """Wait for all the jobs in the pool and record the plots that were made.
+           The jobs are collected in the order they were submitted, so the outcome
+           does not depend on which GNUPlot finishes first.
+           Each entry in self.render_jobs is a list of futures plus an optional
+           finisher function that turns their results into a (title, file) pair.
+        """
+        for jobs, finisher in self.render_jobs:
+            results = [ j.result() for j in jobs ]
+            res = finisher(results) if finisher else results[0]
+            if not res:
+                continue
+            plot_title, plot_path = res
+
+            if isinstance(plot_path, list):
+                # A series of frames
+                plot_file = "{} .. {}".format(os.path.basename(plot_path[0]), os.path.basename(plot_path[-1]))
+            else:
+                plot_file = os.path.basename(plot_path)
+
+            self.interop_plots[plot_title] = dict(plot_file=plot_file)
+            self.interop_plot_files[plot_title] = plot_path
+        self.render_jobs = []
 
     def interop_plots_html(self):
         """ Get the plots into the report. Sort order is by title.
         """
-        for ipt, ipf in sorted(self.interop_plot_files.items()):
+        template_mod = config.avail_templates[config.template].load()
+
+        for ipt in sorted( set(self.interop_plot_files) | set(self.native_plots) ):
 
             # Code adapted from multiqc/plots/linegraph.py
             pid = "".join([c for c in ipt if c.isalpha() or c.isdigit() or c == '_' or c == '-'])
             hidediv = ''
+
+            if ipt in self.native_plots:
+                yield dict(name=ipt, plot=self.native_plot_html(pid, self.native_plots[ipt]))
+                continue
+            ipf = self.interop_plot_files[ipt]
+
+            if isinstance(ipf, list):
+                yield dict(name=ipt, plot=self.frames_html(pid, ipf, template_mod))
+                continue
             file_extn = ipf.split('.')[-1]
 
-            # Output the figure to a base64 encoded string
+            # Output the figure to a base64 encoded string. The file is encoded in chunks which
+            # are joined straight into the HTML, so we only ever have the one full copy of
+            # the (potentially huge) image data in memory. But MultiQC needs the section as
+            # a string, so that one copy is unavoidable. Anything over embed_max_mb is
+            # linked instead.
             html = ""
-            template_mod = config.avail_templates[config.template].load()
-            if getattr(template_mod, 'base64_plots', True) is True:
-                with open(ipf, "rb") as f:
-                    b64_img = base64.b64encode(f.read()).decode('utf8')
-
-                    if file_extn == 'apng':
-                        # FIXME - If more apng options are added I'll need to make slider_label and zero_image dynamic.
-                        html = (('<div id="{}" class="apng_slider" slider_label="Show cycle"' + \
-                                 'zero_image="" apng_data="{}"{}></div>').format(pid, b64_img,  hidediv))
-                    else:
-                        html = ('<div id="{}"{}><img style="border:none" src="data:image/png;base64,{}" />' +
-                                 '</div>').format(pid, hidediv, b64_img)
+            if self.embed_plot(template_mod, [ipf]):
+                if file_extn == 'apng':
+                    # FIXME - If more apng options are added I'll need to make slider_label and zero_image dynamic.
+                    html_head = ('<div id="{}" class="apng_slider" slider_label="Show cycle"' + \
+                                 'zero_image="" apng_data="').format(pid)
+                    html_tail = '"{}></div>'.format(hidediv)
+                else:
+                    html_head = '<div id="{}"{}><img style="border:none" src="data:image/png;base64,'.format(pid, hidediv)
+                    html_tail = '" /></div>'
+
+                with timed('edgen_interop.base64', ipt):
+                    html = ''.join(chain([html_head], b64_chunks(ipf), [html_tail]))
 
             # Or else move it to a file we want to keep and link <img>
             else:
-                plot_savpath = os.path.join(config.data_dir, 'multiqc_plots', '{}.{}'.format(pid, file_extn))
-                plot_relpath = os.path.join(config.data_dir_name, 'multiqc_plots', '{}.{}'.format(pid, file_extn))
-                #Not sure about this...
-                os.rename(ipf, plot_savpath)
+                plot_relpath = self.keep_plot_file(ipf, '{}.{}'.format(pid, file_extn))
                 html = '<div id="{}"{}><img style="border:none" src="{}" /></div>'.format(pid, hidediv, plot_relpath)
 
             yield dict(name=ipt, plot=html)
+
+    def embed_plot(self, template_mod, plot_files):
+        """ Should these files be embedded in the report? Yes if the template wants that,
+            unless they add up to more than edgen_interop.embed_max_mb.
+        """
+        if getattr(template_mod, 'base64_plots', True) is not True:
+            return False
+
+        # 0 (or None) means no limit
+        embed_max_mb = self.mod_config.get('embed_max_mb', 50)
+        if embed_max_mb:
+            total_size = sum( os.path.getsize(f) for f in plot_files )
+            if total_size > float(embed_max_mb) * 1024 * 1024:
+                log.info("Linking rather than embedding {} as it is {:.1f} MB".format(
+                            os.path.basename(plot_files[0]), total_size / (1024 * 1024) ))
+                return False
+        return True
+
+    def keep_plot_file(self, plot_file, save_name):
+        """ Move a plot into multiqc_plots in the data dir and return the path to link to.
+        """
+        plot_savpath = os.path.join(config.data_dir, 'multiqc_plots', save_name)
+        os.makedirs(os.path.dirname(plot_savpath), exist_ok=True)
+        shutil.move(plot_file, plot_savpath)
+
+        return os.path.join(config.data_dir_name, 'multiqc_plots', save_name)
+
+    def native_plot_html(self, pid, pages):
+        """ Make MultiQC plots from the data read by add_native_plot, and save the
+            numbers for each one to a data file named after the plot.
+        """
+        from multiqc.plots import linegraph, heatmap
+
+        html = []
+        for n, page in enumerate(pages):
+            settings = page.settings
+            plot_id = 'edgen_interop_{}'.format(pid) + ('_{}'.format(n) if n else '')
+
+            if page.plots[0].style == 'image':
+                data, xcats, ycats = heatmap_data(page.plots[0].data, settings['yreverse'])
+                self.write_data_file( { y: dict(zip(xcats, row)) for y, row in zip(ycats, data) }, plot_id )
+
+                pconfig = dict( id = plot_id,
+                                title = settings['title'],
+                                xTitle = settings['xlabel'],
+                                yTitle = settings['ylabel'],
+                                colstops = palette_colstops(settings['palette']),
+                                square = False,
+                                datalabels = False )
+                for k, v in zip(['min', 'max'], settings['cbrange']):
+                    if v is not None:
+                        pconfig[k] = v
+                html.append(heatmap.plot(data, xcats, ycats, pconfig))
+            else:
+                data, colours = linegraph_data(page.plots)
+                self.write_data_file(data, plot_id)
+
+                pconfig = dict( id = plot_id,
+                                title = settings['title'],
+                                xlab = settings['xlabel'],
+                                ylab = settings['ylabel'],
+                                xLog = 'x' in settings['logscale'],
+                                yLog = 'y' in settings['logscale'],
+                                colors = colours )
+                for k, v in zip(['xmin', 'xmax', 'ymin', 'ymax'], settings['xrange'] + settings['yrange']):
+                    if v is not None:
+                        pconfig[k] = v
+                html.append(linegraph.plot(data, pconfig))
+
+        return ''.join(html)
+
+    def frames_html(self, pid, frame_files, template_mod):
+        """ Put a series of frames into the report for frame_slider in apng-make-sliders.js,
+            which only loads the frames as they are viewed. Each frame is either a data: URL
+            or a file under multiqc_plots.
+        """
+        html = [ '<div id="{}" class="frame_slider" slider_label="Show cycle" zero_image="">'.format(pid) ]
+
+        embed = self.embed_plot(template_mod, frame_files)
+        for n, ff in enumerate(frame_files):
+            if embed:
+                with timed('edgen_interop.base64', ff):
+                    html.extend([ '<span class="slider_frame" frame_src="data:image/png;base64,',
+                                  *b64_chunks(ff),
+                                  '"></span>' ])
+            else:
+                plot_relpath = self.keep_plot_file(ff, '{}_{:04}.png'.format(pid, n))
+                html.append('<span class="slider_frame" frame_src="{}"></span>'.format(plot_relpath))
+
+        html.append('</div>')
+
+        return ''.join(html)
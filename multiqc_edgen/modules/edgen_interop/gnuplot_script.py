@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+"""Reads the GNUPlot scripts made by the InterOp tools, so we can get at the data
+   without running GNUPlot.
+
+   The scripts are simple: a few 'set' commands and then a 'plot' command where all
+   the data comes inline ("-") in blocks ending with 'e'. Anything fancier than that
+   raises UnsupportedScript, so the caller can fall back to running the real thing.
+
+   This needs numpy, which is not a requirement of the plugin, so only import it when
+   it is wanted and be ready for an ImportError.
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+
+class UnsupportedScript(ValueError):
+    """The script uses some feature of GNUPlot that we don't handle.
+    """
+    pass
+
+# One plot command. settings is a dict of the 'set' commands in force when the plot
+# was made, and plots is a list of Series.
+Page = namedtuple('Page', "settings plots")
+
+# One "-" in the plot command. data is a 2D array, which for a matrix is the matrix
+# itself and otherwise has the x and y values as its two columns.
+Series = namedtuple('Series', "style title colour data")
+
+DEFAULT_SETTINGS = dict( output = None,
+                         size = (640, 480),
+                         title = None,
+                         xlabel = None,
+                         ylabel = None,
+                         cblabel = None,
+                         xrange = (None, None),
+                         yrange = (None, None),
+                         yreverse = False,
+                         cbrange = (None, None),
+                         logscale = (),
+                         key = 'inside',
+                         palette = None,
+                         boxwidth = None )
+
+# These only change the look of the plot, so we can ignore them.
+COSMETIC = { 'style', 'xtics', 'ytics', 'mxtics', 'mytics', 'cbtics', 'tics', 'grid', 'border',
+             'format', 'label', 'lmargin', 'rmargin', 'tmargin', 'bmargin', 'colorbox', 'view',
+             'encoding', 'autoscale', 'datafile', 'offsets', 'bars', 'size', 'termoption' }
+
+STYLES = { 'l': 'lines', 'lines': 'lines',
+           'lp': 'linespoints', 'linespoints': 'linespoints',
+           'p': 'points', 'points': 'points',
+           'boxes': 'boxes',
+           'image': 'image' }
+
+RANGE_RE = re.compile(r'\[\s*([^:\]]*?)\s*:\s*([^\]]*?)\s*\]\s*(.*)')
+SIZE_RE = re.compile(r'\bsize\s+(\d+)\s*,\s*(\d+)')
+TOKEN_RE = re.compile(r'''"((?:[^"\\]|\\.)*)"|'([^']*)'|([^\s"',]+)|(,)''')
+
+class Quoted(str):
+    """A string that was in quotes, so ',' or 'title' in quotes are not mistaken for
+       the real thing.
+    """
+    pass
+
+def tokenize(line):
+    """Split a command into words, where quoted strings are single words (with the
+       quotes removed) and commas are words by themselves.
+    """
+    res = []
+    for mo in TOKEN_RE.finditer(line):
+        dq, sq, word, comma = mo.groups()
+        if dq is not None:
+            res.append(Quoted(dq.replace('\\"', '"')))
+        elif sq is not None:
+            res.append(Quoted(sq))
+        else:
+            res.append(word or comma)
+    return res
+
+def parse_range(spec):
+    """Parse '[0 : 100 ] reverse' to ((0.0, 100.0), True). '*' or nothing means autoscale.
+    """
+    mo = RANGE_RE.match(spec)
+    if not mo:
+        raise UnsupportedScript("Cannot parse range {!r}".format(spec))
+
+    def _num(s):
+        if s in ('', '*'):
+            return None
+        try:
+            return float(s)
+        except ValueError:
+            raise UnsupportedScript("Cannot parse range {!r}".format(spec))
+
+    return (_num(mo.group(1)), _num(mo.group(2))), ('reverse' in mo.group(3))
+
+def parse_palette(words):
+    """Only 'set palette defined (0 "black", 1 "red", ...)' is supported. Anything else
+       leaves the default.
+    """
+    if len(words) < 2 or words[0] != 'defined':
+        return None
+    spec = ' '.join(w if not isinstance(w, Quoted) else '"{}"'.format(w) for w in words[1:])
+    points = re.findall(r'([-\d.eE+]+)\s+"([^"]+)"', spec)
+    try:
+        return tuple( (float(v), c) for v, c in points ) or None
+    except ValueError:
+        return None
+
+def parse_set(words, settings):
+    """Apply one 'set' command to the settings.
+    """
+    what, rest = words[0], words[1:]
+    if what in ('terminal', 'term'):
+        mo = SIZE_RE.search(' '.join(rest))
+        if mo:
+            settings['size'] = (int(mo.group(1)), int(mo.group(2)))
+    elif what == 'output':
+        settings['output'] = rest[0] if rest else None
+    elif what in ('title', 'xlabel', 'ylabel', 'cblabel'):
+        settings[what] = rest[0] if rest else None
+    elif what in ('xrange', 'yrange', 'cbrange'):
+        rng, reverse = parse_range(' '.join(rest))
+        settings[what] = rng
+        if what == 'yrange':
+            settings['yreverse'] = reverse
+        elif reverse:
+            raise UnsupportedScript("Reversed {} is not supported".format(what))
+    elif what == 'logscale':
+        axes = rest[0] if rest else 'xy'
+        if set(axes) - set('xy'):
+            raise UnsupportedScript("Log scale on {} is not supported".format(axes))
+        settings['logscale'] = tuple(sorted(set(settings['logscale']) | set(axes)))
+    elif what == 'key':
+        settings['key'] = 'outside' if 'outside' in rest else 'off' if 'off' in rest else 'inside'
+    elif what == 'nokey':
+        settings['key'] = 'off'
+    elif what == 'palette':
+        settings['palette'] = parse_palette(rest) or settings['palette']
+    elif what == 'boxwidth':
+        try:
+            settings['boxwidth'] = float(rest[0])
+        except (IndexError, ValueError):
+            raise UnsupportedScript("Cannot parse boxwidth {!r}".format(rest))
+    elif what not in COSMETIC:
+        raise UnsupportedScript("'set {}' is not supported".format(what))
+
+def parse_unset(words, settings):
+    what = words[0]
+    if what == 'key':
+        settings['key'] = 'off'
+    elif what in DEFAULT_SETTINGS:
+        settings[what] = DEFAULT_SETTINGS[what]
+    elif what not in COSMETIC:
+        raise UnsupportedScript("'unset {}' is not supported".format(what))
+
+def parse_plot(words):
+    """Parse the plot command into a list of (style, title, colour, columns, matrix)
+       for each "-" to be read.
+    """
+    specs = []
+    # Split on the commas between the things to plot
+    parts = [[]]
+    for w in words:
+        if w == ',' and not isinstance(w, Quoted):
+            parts.append([])
+        else:
+            parts[-1].append(w)
+
+    for part in parts:
+        if not part or not isinstance(part[0], Quoted) or part[0] not in ('-', ''):
+            raise UnsupportedScript("Only inline data can be plotted, not {!r}".format(' '.join(part)))
+        style, title, colour, columns, matrix = 'points', None, None, None, False
+        n = 1
+        while n < len(part):
+            w = part[n]
+            n += 1
+            if isinstance(w, Quoted):
+                # Not a keyword, whatever it says
+                continue
+            elif n == len(part) and w in ('u', 'using', 't', 'title', 'ti', 'w', 'with', 'rgb'):
+                raise UnsupportedScript("Missing value after {!r}".format(w))
+            elif w in ('u', 'using'):
+                columns = part[n]
+                n += 1
+                if not re.match(r'^\d+(:\d+)*$', columns):
+                    raise UnsupportedScript("Cannot plot using {!r}".format(columns))
+                columns = [ int(c) - 1 for c in columns.split(':') ]
+            elif w == 'matrix':
+                matrix = True
+            elif w in ('t', 'title', 'ti'):
+                title = part[n]
+                n += 1
+            elif w == 'notitle':
+                title = None
+            elif w in ('w', 'with'):
+                if part[n] not in STYLES:
+                    raise UnsupportedScript("Cannot plot with {!r}".format(part[n]))
+                style = STYLES[part[n]]
+                n += 1
+            elif w == 'rgb':
+                colour = part[n]
+                n += 1
+            # Everything else (line types and widths, point sizes, fill style) is just
+            # the look of the plot. Numbers will be their arguments.
+
+        if matrix != (style == 'image'):
+            raise UnsupportedScript("Images must be plotted from a matrix")
+        if columns and not matrix and len(columns) > (3 if style == 'boxes' else 2):
+            raise UnsupportedScript("Cannot plot using {} columns with {}".format(len(columns), style))
+        specs.append( (style, title, colour, columns, matrix) )
+
+    # A matrix ends with two 'e' lines, and I'm not sure how GNUPlot reads what follows.
+    if len(specs) > 1 and any( s[4] for s in specs ):
+        raise UnsupportedScript("A matrix must be plotted by itself")
+
+    return specs
+
+def read_block(lines_iter):
+    """Read the data up to the line 'e' and make it into an array. A matrix ends with
+       two 'e' lines, and parse_script skips over the second one.
+    """
+    rows = []
+    for l in lines_iter:
+        l = l.strip()
+        if l == 'e':
+            break
+        if l and not l.startswith('#'):
+            rows.append(l.replace(',', ' ').split())
+    else:
+        raise UnsupportedScript("Data block was not terminated")
+
+    try:
+        # Ragged rows make this fail, as they should
+        return np.array(rows, dtype=float).reshape(len(rows), -1)
+    except ValueError as e:
+        raise UnsupportedScript("Cannot read the data: {}".format(e))
+
+def make_series(spec, block):
+    style, title, colour, columns, matrix = spec
+    if matrix:
+        return Series(style, title, colour, block)
+
+    if not columns:
+        # One column is y values by position, otherwise the first two are x and y
+        columns = [0, 1] if block.shape[1] > 1 else [None, 0]
+    if len(columns) == 1:
+        columns = [None] + columns
+    if any( c is not None and c >= block.shape[1] for c in columns[:2] ):
+        raise UnsupportedScript("Not enough columns in the data")
+
+    x = block[:, columns[0]] if columns[0] is not None else np.arange(block.shape[0], dtype=float)
+    return Series(style, title, colour, np.column_stack([x, block[:, columns[1]]]))
+
+def parse_script(lines):
+    """Read a GNUPlot script (an iterable of lines) and return a list of Pages, one
+       for each plot command. Raises UnsupportedScript for anything we can't deal with.
+    """
+    pages = []
+    settings = dict(DEFAULT_SETTINGS)
+
+    lines_iter = iter(lines)
+    for line in lines_iter:
+        line = line.strip()
+        # Follow any continuation lines
+        while line.endswith('\\'):
+            line = line[:-1] + next(lines_iter, '').strip()
+
+        if not line or line.startswith('#') or line == 'e':
+            # Stray 'e' lines are the end of a matrix
+            continue
+        if ';' in re.sub(r'"[^"]*"|\'[^\']*\'', '', line):
+            raise UnsupportedScript("Multiple commands on one line are not supported")
+
+        # A line like '"' has no words at all, and a command must be a bare word
+        words = tokenize(line)
+        if not words or isinstance(words[0], Quoted) or words[0] == ',':
+            raise UnsupportedScript("Cannot parse {!r}".format(line))
+        cmd = words[0]
+        if cmd == 'set' and len(words) > 1:
+            parse_set(words[1:], settings)
+        elif cmd == 'unset' and len(words) > 1:
+            parse_unset(words[1:], settings)
+        elif cmd == 'reset':
+            # Like GNUPlot, this leaves the terminal and output alone
+            settings = dict(DEFAULT_SETTINGS, output=settings['output'], size=settings['size'])
+        elif cmd in ('plot', 'p'):
+            specs = parse_plot(words[1:])
+            series = [ make_series(spec, read_block(lines_iter)) for spec in specs ]
+            pages.append(Page(dict(settings), series))
+        else:
+            raise UnsupportedScript("{!r} is not supported".format(cmd))
+
+    return pages
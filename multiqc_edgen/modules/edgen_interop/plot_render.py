@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""Draws the InterOp plots in-process with matplotlib, rather than piping the scripts
+   into GNUPlot. This saves starting GNUPlot (and cairo) for every plot, and means the
+   module works where GNUPlot is not installed. The plots look a little different, and
+   anything in the script that gnuplot_script.py doesn't understand is left to GNUPlot.
+   This needs matplotlib and numpy, which are not requirements of the plugin, so it is
+   only imported when wanted and GNUPlot is used if the import fails.
+"""
+import os
+import logging
+from threading import Lock
+
+from .gnuplot_script import parse_script, UnsupportedScript
+
+log = logging.getLogger('multiqc.modules.' + __name__)
+
+DPI = 100
+
+# GNUPlot's default palette is 'rgbformulae 7,5,15', which matplotlib has under this name
+DEFAULT_CMAP = 'gnuplot'
+
+# matplotlib is not thread safe, and the GNUPlot pool runs in threads. The drawing is
+# all under the GIL anyway so there's little to lose by doing one plot at a time.
+draw_lock = Lock()
+
+class PlotRenderer():
+    """Renders GNUPlot scripts to PNG files, for as much of GNUPlot as we support.
+       Raises ImportError if matplotlib is not available.
+    """
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.colors import LinearSegmentedColormap, is_color_like
+
+        self.Figure = Figure
+        self.FigureCanvas = FigureCanvasAgg
+        self.LinearSegmentedColormap = LinearSegmentedColormap
+        self.is_color_like = is_color_like
+
+        # The flowcell_all frames all have the same layout, so the last figure is kept and
+        # just the image data and title are swapped in for the next frame.
+        self.last_figure = None
+
+    def render(self, lines, cwd):
+        """Render the script in lines into cwd, writing the files named in 'set output'.
+           Returns False, having made nothing, if the script needs to go to GNUPlot.
+        """
+        try:
+            pages = parse_script(lines)
+        except UnsupportedScript as e:
+            log.debug("Leaving the plot to GNUPlot: {}".format(e))
+            return False
+
+        for page in pages:
+            if page.plots and page.settings['output']:
+                with draw_lock:
+                    try:
+                        self.draw(page, os.path.join(cwd, page.settings['output']))
+                    except Exception as e:
+                        # GNUPlot will overwrite anything made so far
+                        log.warning("Leaving {} to GNUPlot as drawing it failed: {!r}".format(page.settings['output'], e))
+                        self.last_figure = None
+                        return False
+        return True
+
+    def draw(self, page, filename):
+        settings = page.settings
+
+        # Can we re-use the last figure?
+        layout = None
+        if all( s.style == 'image' for s in page.plots ):
+            layout = ( tuple(sorted( (k, v) for k, v in settings.items() if k not in ('title', 'output') )),
+                       tuple( s.data.shape for s in page.plots ) )
+
+        if layout and self.last_figure and self.last_figure[0] == layout:
+            fig, ax, images = self.last_figure[1:]
+            for im, series in zip(images, page.plots):
+                im.set_data(series.data)
+                if settings['cbrange'] == (None, None):
+                    im.autoscale()
+            ax.set_title(settings['title'] or '')
+        else:
+            fig, ax, images = self.new_figure(page)
+            self.last_figure = (layout, fig, ax, images) if layout else None
+
+        # Not fig.savefig(), as with a colour bar that draws everything twice
+        fig.canvas.print_png(filename)
+
+    def new_figure(self, page):
+        settings = page.settings
+        width, height = settings['size']
+        fig = self.Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+        self.FigureCanvas(fig)
+        ax = fig.add_subplot(111)
+
+        images = []
+        for series in page.plots:
+            colour = series.colour if series.colour and self.is_color_like(series.colour) else None
+
+            if series.style == 'image':
+                # GNUPlot puts the matrix element [row, col] at x=col, y=row
+                m = series.data
+                im = ax.imshow( m, origin='lower', aspect='auto', interpolation='nearest',
+                                cmap = self.colormap(settings['palette']),
+                                extent = (-0.5, m.shape[1] - 0.5, -0.5, m.shape[0] - 0.5),
+                                vmin = settings['cbrange'][0],
+                                vmax = settings['cbrange'][1] )
+                cbar = fig.colorbar(im, ax=ax)
+                if settings['cblabel']:
+                    cbar.set_label(settings['cblabel'])
+                images.append(im)
+                continue
+
+            x, y = series.data[:,0], series.data[:,1]
+            if series.style == 'boxes':
+                width = settings['boxwidth'] or 1.0
+                ax.bar(x, y, width=width, color=colour, edgecolor='black', linewidth=0.5, label=series.title)
+            elif series.style == 'lines':
+                ax.plot(x, y, color=colour, linewidth=1, label=series.title)
+            elif series.style == 'linespoints':
+                ax.plot(x, y, color=colour, linewidth=1, marker='+', label=series.title)
+            else:
+                ax.plot(x, y, color=colour, linestyle='none', marker='+', label=series.title)
+
+        if 'x' in settings['logscale']:
+            ax.set_xscale('log')
+        if 'y' in settings['logscale']:
+            ax.set_yscale('log')
+        if settings['xrange'] != (None, None):
+            ax.set_xlim(*settings['xrange'])
+        if settings['yrange'] != (None, None):
+            ax.set_ylim(*settings['yrange'])
+        if settings['yreverse']:
+            ax.invert_yaxis()
+
+        ax.set_title(settings['title'] or '')
+        ax.set_xlabel(settings['xlabel'] or '')
+        ax.set_ylabel(settings['ylabel'] or '')
+
+        if settings['key'] != 'off' and any( s.title for s in page.plots if s.style != 'image' ):
+            if settings['key'] == 'outside':
+                ax.legend(loc='upper left', bbox_to_anchor=(1.01, 1), fontsize='small')
+            else:
+                ax.legend(loc='upper right', fontsize='small')
+
+        fig.tight_layout()
+        return fig, ax, images
+
+    def colormap(self, palette):
+        """Make a colour map from 'set palette defined', or else use the GNUPlot default.
+        """
+        if not palette:
+            return DEFAULT_CMAP
+        points = sorted( (v, c) for v, c in palette if self.is_color_like(c) )
+        if len(points) < 2 or points[0][0] == points[-1][0]:
+            return DEFAULT_CMAP
+        lo, hi = points[0][0], points[-1][0]
+        return self.LinearSegmentedColormap.from_list( 'palette', [ ((v - lo) / (hi - lo), c) for v, c in points ] )
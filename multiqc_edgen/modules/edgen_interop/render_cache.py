@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+""" On-disk cache of rendered interop plots, so that the overview report and all
+    the per-lane reports for a run don't each have to run GNUPlot on the same
+    scripts.
+"""
+import logging
+import os, shutil
+import hashlib
+from uuid import uuid4
+
+log = logging.getLogger('multiqc.modules.' + __name__)
+
+class RenderCache():
+    """Each entry is a directory named by the hash of the GNUPlot commands (plus anything
+       else that affects the output), containing the rendered files. The mtime of the
+       directory is bumped whenever the entry is used, so that evict() can discard the
+       least recently used entries once the cache gets too big.
+    """
+    def __init__(self, cache_dir, max_bytes):
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(lines, *settings):
+        """Make a cache key from the munged GNUPlot commands, plus any other settings.
+        """
+        h = hashlib.sha256()
+        for s in settings:
+            h.update(repr(s).encode('utf-8'))
+            h.update(b'\0')
+        for line in lines:
+            h.update(line.encode('utf-8'))
+
+        return h.hexdigest()
+
+    def fetch(self, key, dest_dir):
+        """Copy the files for this key into dest_dir. Returns the list of files, or
+           None if there is nothing in the cache.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            files = sorted(os.listdir(entry_dir))
+            for f in files:
+                shutil.copy(os.path.join(entry_dir, f), dest_dir)
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            return None
+
+        log.debug("Using cached render {}".format(key))
+        return files
+
+    def store(self, key, src_dir, files):
+        """Save a copy of the files under this key. Things are copied to a temporary
+           directory first then renamed so we should never see a partial entry, even
+           if two reports are being made at once.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = os.path.join(self.cache_dir, '.tmp_{}'.format(uuid4().hex))
+        try:
+            os.makedirs(tmp_dir)
+            for f in files:
+                shutil.copy(os.path.join(src_dir, f), tmp_dir)
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # Most likely someone else just saved the same thing, which is fine.
+            log.debug("Not caching render {}: {}".format(key, e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the total size is within
+           self.max_bytes.
+        """
+        entries = []
+        total_size = 0
+        for de in os.scandir(self.cache_dir):
+            if de.name.startswith('.') or not de.is_dir():
+                continue
+            size = sum( f.stat().st_size for f in os.scandir(de.path) )
+            entries.append( (de.stat().st_mtime, size, de.path) )
+            total_size += size
+
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            log.debug("Evicting cached render {}".format(os.path.basename(path)))
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
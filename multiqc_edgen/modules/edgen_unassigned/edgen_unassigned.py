@@ -5,18 +5,96 @@ from __future__ import print_function, division, absolute_import
     the report and link to it.
 """
 import logging
-import os
+import os, re
 
-import shutil
+import heapq
 from glob import glob
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
 
+from ...utils.placement import data_dir_placer
+from ...utils.timings import timed
+
 # Initialise the logger, ensuring massages go to the main
 # MultiQC modules log.
 log = logging.getLogger('multiqc.modules.' + __name__)
 
+# The table has a title, then a header line naming the columns (one being 'Count'), then
+# one row per barcode. The count is a number, maybe with commas, and the barcode is bases
+# with the two indexes joined by '+' (or '-').
+COUNT_RE = re.compile(r'^\d[\d,]*$')
+BARCODE_RE = re.compile(r'^[ACGTN]{4,}(?:[+-][ACGTN]{4,})?$', re.IGNORECASE)
+
+def split_fields(l):
+    return l.split('\t') if '\t' in l else l.split()
+
+def row_count(fields, count_col):
+    """ Get the count from a row of the table, or None if this is not a row. Each row
+        must have a barcode. If we've not seen the header, the count is the first number.
+    """
+    if not any( BARCODE_RE.match(f.strip()) for f in fields ):
+        return None
+    if count_col is not None:
+        counts = fields[count_col:count_col+1]
+    else:
+        counts = [ f for f in fields if COUNT_RE.match(f.strip()) ][:1]
+    if not counts or not COUNT_RE.match(counts[0].strip()):
+        return None
+    return int(counts[0].strip().replace(',', ''))
+
+def read_unassigned_table(fh, top_n, copy_to=None):
+    """ Read through an unassigned barcodes table one line at a time, keeping just the
+        top_n rows with the highest counts. Anything before the first row is taken to
+        be a header, and the line naming the Count column says where to find the counts.
+        If copy_to is a file handle then every line is also written there.
+        Returns a dict with the header lines, the top rows as (count, line) in order
+        of count, and the number of rows and total count over the whole table.
+    """
+    res = dict(header=[], rows=0, total=0)
+    heap = []
+    count_col = None
+    for n, l in enumerate(fh):
+        if copy_to:
+            copy_to.write(l)
+        l = l.rstrip()
+
+        fields = split_fields(l)
+        count = row_count(fields, count_col)
+        if count is None:
+            if not res['rows'] and l:
+                res['header'].append(l)
+                # Is this the line with the column names?
+                names = [ f.strip().lower() for f in fields ]
+                if 'count' in names:
+                    count_col = names.index('count')
+            continue
+
+        res['rows'] += 1
+        res['total'] += count
+
+        # Ties go to whichever row came first.
+        if len(heap) < top_n:
+            heapq.heappush(heap, (count, -n, l))
+        elif top_n:
+            heapq.heappushpop(heap, (count, -n, l))
+
+    res['top'] = [ (count, l) for count, _, l in sorted(heap, reverse=True) ]
+    return res
+
+def table_lines(ub):
+    """ The lines to show for a table read by read_unassigned_table(): the header, the
+        top rows, and then the total count over all the barcodes, which is always shown
+        whether or not any rows were left out.
+    """
+    lines = ub['header'] + [ l for count, l in ub['top'] ]
+    total = "{:,} reads in all {:,} barcodes.".format(ub['total'], ub['rows'])
+    if ub['rows'] > len(ub['top']):
+        lines.append( "... {:,} more barcodes not shown. {}".format(ub['rows'] - len(ub['top']), total) )
+    else:
+        lines.append(total)
+    return lines
+
 class MultiqcModule(BaseMultiqcModule):
     """ Unassigned barcodes report linkerer.
     """
@@ -37,29 +115,41 @@ class MultiqcModule(BaseMultiqcModule):
         analysis_dir = config.analysis_dir[0] if config.analysis_dir else "."
         legacy_reports = sorted(glob( analysis_dir + '/*.unassigned' ) ) # May be 0?
         log.info("Found {} legacy reports".format(len(legacy_reports)))
+        placer = data_dir_placer(config)
         for n, f in enumerate(legacy_reports):
             log.info("Found legacy report {}".format(f))
             rep_savpath = os.path.join(config.data_dir, 'unassigned{}.html'.format(n))
             rep_relpath = os.path.join(config.data_dir_name, 'unassigned{}.html'.format(n))
 
-            # Copy the file
-            shutil.copy(f, rep_savpath)
+            # Copy (or link) the file
+            with timed('edgen_unassigned.place_legacy', f):
+                placer.place(f, rep_savpath)
             html += '<a href="{}">View tables of unassigned barcodes</a><br />'.format(rep_relpath)
         #html += '</div>'
+        placer.log_summary("legacy reports")
 
         if legacy_reports:
             self.add_section(name='Legacy Report', plot=html)
 
         # Now the unassigned_table.txt which is just a basic text file emitted by the pipeline.
-        # We expect just one.
+        # We expect just one. These can get very big if the barcodes were wrong, so only the
+        # top few are shown in the report and the full table is saved alongside.
+        self.mod_config = getattr(config, 'edgen_unassigned', None) or dict()
+        top_n = int(self.mod_config.get('top_barcodes', 50))
+
         html = ''
         for n, f in enumerate(self.find_log_files('edgen_unassigned', filehandles=True)):
-            ub = f['f'].read()
+            tab_name = 'unassigned_table{}.txt'.format(n)
+            with timed('edgen_unassigned.parse', f['fn']), \
+                    open(os.path.join(config.data_dir, tab_name), 'w') as tfh:
+                ub = read_unassigned_table(f['f'], top_n, copy_to=tfh)
 
             html += '<p>The counts generated by bcl2fastq are approximate.</p>\n'
             html += '<textarea rows="8" cols="100" readonly="true" style="font-family: monospace,monospace;">\n'
-            html += ub.strip() or '---'
+            html += '\n'.join(table_lines(ub))
             html += '</textarea>'
+            html += '<p><a href="{}">Full table of unassigned barcodes</a></p>'.format(
+                                os.path.join(config.data_dir_name, tab_name) )
 
         # Assume there was at least one report, or we'd not have been called at all.
         if html:
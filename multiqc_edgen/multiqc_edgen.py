@@ -1,18 +1,20 @@
 #!/usr/bin/env python
 """ MultiQC hook functions - we tie into the MultiQC
     core here to add in extra functionality and logic for EdGen run reports.
+
+    This gets imported on every MultiQC run, whether or not the report has anything
+    to do with us, so anything not needed by every hook is imported when needed.
 """
 
 from collections import OrderedDict
 import logging
 import os, sys, re
 from glob import glob
-import yaml, yamlloader
-from base64 import b64encode
-from cgi import escape
+from functools import lru_cache
+from html import escape as html_escape
+from urllib.parse import quote as url_escape
 
-from pkg_resources import get_distribution
-__version__ = get_distribution("multiqc_edgen").version
+from .version import __version__
 
 import multiqc # We do need this! Import before getting logger.
 from multiqc.utils import report, config
@@ -22,16 +24,110 @@ from .Formatters import fmt_time, fmt_duration
 
 log = logging.getLogger('multiqc')
 
-#Container for the meta-data etc. Add keys that match things in the HTML template(s).
-report.edgen_run = dict()
+# Allowed values for edgen_run_info.attachments
+ATTACHMENT_MODES = ('embed', 'shared')
+
+#With --all-lanes the YAML gets loaded for every lane, so hang on to the cache.
+yaml_caches = dict()
+
+def escape(s):
+    """Escape like the old cgi.escape(), which leaves quotes alone.
+    """
+    return html_escape(s, quote=False)
+
+#Patterns for linkify. Labels may be like "prefix [link text] suffix".
+LABEL_RE = re.compile(r'(.*)\[(.*)\](.*)')
+URL_RE = re.compile(r'https?://')
+
+def order_keys(orig_keys):
+    """Put the (printable_heading, yaml_key) pairs in the order they are to be shown.
+       Key names may be in the form x//y in which case order on x and use y as the label,
+       overriding any previous ordering and structuring. Those with x < 'n0' go to the
+       front of the list and the rest to the back. Others stay in the order given.
+    """
+    early_keys, plain_keys, late_keys = [], [], []
+    for xy, k in orig_keys:
+        x, sep, y = xy.partition('//')
+        if not sep:
+            plain_keys.append( (xy, k) )
+        elif x < 'n0':
+            early_keys.append( (x, y, k) )
+        else:
+            late_keys.append( (x, y, k) )
+
+    return [ (y, k) for (x, y, k) in sorted(early_keys) ] + \
+           plain_keys + \
+           [ (y, k) for (x, y, k) in sorted(late_keys) ]
+
+@lru_cache(maxsize=16)
+def yaml_key_order(yaml_keys):
+    """order_keys() for a tuple of YAML keys used as their own labels. With --all-lanes
+       the same keys are shown in every report, so the ordering is only worked out once.
+    """
+    return tuple(order_keys( (n, n) for n in yaml_keys ))
+
+@lru_cache(maxsize=None)
+def file_data_uri(filename, stat_key):
+    """Read a file and make it into a data: URI. The stat_key is just there so that
+       the cached result is not used if the file changes.
+    """
+    from base64 import b64encode
+    from .utils.timings import timed
+
+    with timed('run_info.base64', filename), open(filename, "rb") as f:
+        return "data:text/plain;charset=utf-8;base64," + b64encode(f.read()).decode('utf-8')
+
+@lru_cache(maxsize=None)
+def attachments_mode(mode):
+    """Check the edgen_run_info.attachments setting. Anything unknown is treated as 'embed',
+       with a warning. Being cached, the warning only comes out once.
+    """
+    if mode in ATTACHMENT_MODES:
+        return mode
+    log.warning("Unknown edgen_run_info.attachments setting {!r}. Should be one of {}. Using 'embed'.".format(
+                    mode, ", ".join(ATTACHMENT_MODES) ))
+    return 'embed'
+
+@lru_cache(maxsize=None)
+def share_file(filename, stat_key, shared_dir, output_dir):
+    """Put a copy of a file into shared_dir (under output_dir) and return the
+       relative path to it. Each file goes into a sub-directory named after the full
+       path, so different files with the same name don't collide. output_dir is in the
+       cache key so if the reports go somewhere else the files get copied there too.
+    """
+    import hashlib
+    from .utils.placement import FilePlacer
+    from .utils.timings import timed
+
+    subdir = hashlib.sha1(os.path.realpath(filename).encode('utf-8')).hexdigest()[:12]
+    rel_path = os.path.join(shared_dir, subdir, os.path.basename(filename))
+
+    dest = os.path.join(output_dir, rel_path)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with timed('run_info.share', filename):
+        FilePlacer(getattr(config, 'edgen_file_placement', None)).place(filename, dest)
+
+    return rel_path
 
 class edgen_before_modules():
     """Blacklist some modules so that replacement ones can be provided
        by this plugin.
     """
     def __init__(self):
+        #Container for the meta-data etc. Add keys that match things in the HTML template(s).
+        #This needs to be set before any modules run.
+        report.edgen_run = dict()
+
         self.blacklist_modules()
 
+        if config.kwargs.get('all_lanes'):
+            self.name_overview()
+
+            # The overview only gets the files that are not for a specific lane. The rest
+            # are kept back for the lane reports.
+            from .all_lanes import split_files
+            split_files()
+
     def blacklist_modules(self):
 
         blacklist = ['cutadapt', 'vcftools', 'rsem']
@@ -42,6 +138,18 @@ class edgen_before_modules():
 
                 del(config.run_modules[m])
 
+    def name_overview(self):
+        """In --all-lanes mode the main report is the overview, and the lane reports
+           go alongside. Unless a name was given with -n, name it to match the navbar.
+        """
+        if config.kwargs.get('lane'):
+            log.warning("Ignoring --lane {} as --all-lanes was given.".format(config.kwargs['lane']))
+            config.kwargs['lane'] = None
+
+        if config.output_fn_name == 'multiqc_report.html':
+            config.output_fn_name = 'multiqc_report_overview.html'
+            config.data_dir_name = 'multiqc_report_overview_data'
+
 
 class edgen_before_report():
     """ Custom code to run after the modules have finished but before the report.
@@ -97,6 +205,7 @@ class edgen_before_report():
         # How many lanes are there in this run? And which are we reporting on?
         self.lanes = int(self.yaml_flat.get('LaneCount') or 0)
         self.set_lane()
+        report.edgen_run['lanes'] = self.lanes
 
         # Fix the report title to be correct based on the metadata
         self.run_id = config.kwargs.get('rid') or self.yaml_flat.get('Run ID', '[unknown run]')
@@ -176,21 +285,9 @@ class edgen_before_report():
         """
         if orig_keys is None:
             # Just use the YAML keys as printable labels
-            orig_keys = [ (n, n) for n in self.yaml_flat.keys() ]
-
-        # Key names may be in the form x//y in which case order on x and use y as the label,
-        # overriding any previous ordering and structuring. Convert the pairs into triplets and see which are going
-        # to the front of the list and which to the back.
-        early_keys = [ (x, y, k) for ((x, y), k) in
-                       [ (xy.split('//', 1), k) for (xy, k) in orig_keys if '//' in xy ]
-                       if x < 'n0' ]
-        late_keys =  [ (x, y, k) for ((x, y), k) in
-                       [ (xy.split('//', 1), k) for (xy, k) in orig_keys if '//' in xy ]
-                       if x >= 'n0' ]
-
-        keys = [ (y, k) for (x, y, k) in sorted(early_keys) ] + \
-               [ (y, k) for y, k in orig_keys if '//' not in y ] + \
-               [ (y, k) for (x, y, k) in sorted(late_keys) ]
+            keys = yaml_key_order(tuple(self.yaml_flat.keys()))
+        else:
+            keys = order_keys(orig_keys)
 
         # Filter out anything to be hidden/skipped
         keys = [ k for k in keys if k[0] not in skip and k[1] not in skip ]
@@ -221,14 +318,14 @@ class edgen_before_report():
             return escape(str(val[0]))
 
         # See if the label has [brackets]
-        mo = re.match(r'(.*)\[(.*)\](.*)', val[0])
+        mo = LABEL_RE.match(val[0])
         if mo:
             label_bits = [ escape(p) for p in mo.groups() ]
         else:
             label_bits = [ '', escape(val[0]), '' ]
 
         # Normal hyperlink is simple
-        if re.match('https?://', val[1]):
+        if URL_RE.match(val[1]):
             return "{lb[0]}<a href='{link}'>{lb[1]}</a>{lb[2]}".format(lb=label_bits, link=val[1])
 
         # File upload is trickier, partly due to:
@@ -238,13 +335,32 @@ class edgen_before_report():
         else:
             # Make a fake extension to keep Windows happy
             fake_extn = '.csv' if '.csv.' in val[0] else ''
-            # Embed the file
-            with open(val[1], "rb") as f:
-                fdata = "data:text/plain;charset=utf-8;base64," + b64encode(f.read()).decode('utf-8')
-                return "{lb[0]}<a download='{lb[1]}{extn}' target='_blank' href='{fdata}'>{lb[1]}</a>{lb[2]}".format(
+            # Embed the file, or link to a shared copy
+            return "{lb[0]}<a download='{lb[1]}{extn}' target='_blank' href='{fdata}'>{lb[1]}</a>{lb[2]}".format(
                             lb = label_bits,
                             extn = fake_extn,
-                            fdata = fdata )
+                            fdata = self.attachment_link(val[1]) )
+
+    def attachment_link(self, filename):
+        """Get the href for a file linked from the metadata. Normally the file is embedded,
+           but with edgen_run_info.attachments set to 'shared' it is put in a directory
+           alongside the reports, once for all the reports in the run. Also files bigger
+           than edgen_run_info.embed_max_kb are always shared rather than embedded.
+        """
+        from .utils.caching import FileStatCache
+
+        run_info_config = getattr(config, 'edgen_run_info', None) or dict()
+        stat_key = FileStatCache.stat_key(filename)
+
+        embed_max_kb = run_info_config.get('embed_max_kb')
+        if attachments_mode(run_info_config.get('attachments', 'embed')) == 'embed':
+            if not embed_max_kb or stat_key[0] <= embed_max_kb * 1024:
+                return file_data_uri(filename, stat_key)
+            log.warning("Not embedding {} as it is over {} KB".format(filename, embed_max_kb))
+
+        return url_escape(share_file( filename, stat_key,
+                                      run_info_config.get('attachments_dir') or 'multiqc_attachments',
+                                      config.output_dir ))
 
     def textify(self, val):
         """Like linkify, but just gets the text, ensuring it's quoted properly
@@ -258,6 +374,10 @@ class edgen_before_report():
         """Finds all files matching run_info.*.yml and loads them in order.
            Get the data into self.yaml_data.
         """
+        import yaml, yamlloader
+        from .utils.caching import FileStatCache
+        from .utils.timings import timed
+
         # TODO - am I just looking in the CWD?? Or do I really have to explicitly say config.analysis_dir?
         def _getnum(filename):
             #Extract the number from the penultimate part of the filename.
@@ -270,16 +390,54 @@ class edgen_before_report():
                             for y in glob(d + '/run_info.*.yml') ),
                         key = _getnum )
 
+        # We get run many times on the same run as it progresses, so the parsed files are
+        # cached and only new or changed files are loaded.
+        yaml_cache = self.open_yaml_cache()
+
         for y in yamls:
-            with open(y) as yfh:
-                log.info("Loading metadata from {}".format(y))
-                # The point of this is to allow new sections to replace old ones,
-                # including removing keys.
-                self.yaml_data.update( yaml.load(yfh, Loader=yamlloader.ordereddict.CSafeLoader) )
+            y_data = yaml_cache.get(y) if yaml_cache else None
+            if y_data is None:
+                with timed('run_info.yaml_load', y), open(y) as yfh:
+                    log.info("Loading metadata from {}".format(y))
+                    stat_key = FileStatCache.stat_key(y)
+                    y_data = yaml.load(yfh, Loader=yamlloader.ordereddict.CSafeLoader)
+                if yaml_cache:
+                    yaml_cache.put(y, y_data, stat_key)
+            else:
+                log.info("Loading metadata from {} (cached)".format(y))
+
+            # The point of this is to allow new sections to replace old ones,
+            # including removing keys.
+            self.yaml_data.update( y_data )
+
+        if yaml_cache:
+            try:
+                yaml_cache.save()
+                run_info_config = getattr(config, 'edgen_run_info', None) or dict()
+                yaml_cache.evict(int(run_info_config.get('cache_max_mb', 100)) * 1024 * 1024)
+            except OSError as e:
+                log.warning("Could not save the run_info cache: {}".format(e))
 
         for sk, sv in self.yaml_data.items():
             self.yaml_flat.update(sv.items())
 
+    def open_yaml_cache(self):
+        """Get a FileStatCache for the run_info files, unless edgen_run_info.cache is
+           set to False. By default this goes in the user cache dir, but it can be put
+           in the run directory by setting edgen_run_info.cache_dir.
+        """
+        from .utils.caching import default_cache_dir, analysis_dirs_key, FileStatCache
+
+        run_info_config = getattr(config, 'edgen_run_info', None) or dict()
+        if not run_info_config.get('cache', True):
+            return None
+
+        cache_file = os.path.join( run_info_config.get('cache_dir') or default_cache_dir('run_info'),
+                                   analysis_dirs_key(config.analysis_dir) + '.pickle' )
+        if cache_file not in yaml_caches:
+            yaml_caches[cache_file] = FileStatCache(cache_file)
+        return yaml_caches[cache_file]
+
 
 class edgen_finish():
 
@@ -287,6 +445,33 @@ class edgen_finish():
 
             log.debug("Running MultiQC_EdGen v{} (finish)".format(__version__))
 
-            # Save the version if this module into config.data_dir
+            # Save the version if this module, and the timings, into config.data_dir
+            self.save_data_files()
+
+            # In --all-lanes mode the main report was the overview, and now we do the lanes.
+            if config.kwargs.get('all_lanes'):
+                from .all_lanes import LaneReports
+                lane_reports = LaneReports()
+                lane_reports.make_all(after_each=self.save_data_files)
+
+    def save_data_files(self):
+        self.save_version()
+        self.save_timings()
+
+    def save_version(self):
+        if config.data_dir:
             with open(os.path.join(config.data_dir, "multiqc_edgen.version"), "w") as vfh:
                 print(__version__, file=vfh)
+
+    def save_timings(self):
+        """Save where the time went. In --all-lanes mode each lane report gets the timings
+           since the last report was saved.
+        """
+        from .utils import timings
+
+        if config.data_dir:
+            try:
+                timings.save( os.path.join(config.data_dir, "multiqc_edgen_timings.json"),
+                              reset_after = True )
+            except OSError as e:
+                log.warning("Could not save the timings: {}".format(e))
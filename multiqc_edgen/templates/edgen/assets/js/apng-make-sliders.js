@@ -1,16 +1,73 @@
 /* Animate any apng elements found.
  * These should have class="apng_slider" and apng_data="<data>" where <data> is the
  * apng file in base64 format.
+ * Alternatively, class="frame_slider" elements contain one element per frame, each with
+ * class="slider_frame" and frame_src="<url>", where the url may be a data: URL. In this
+ * case only the frame being shown (and a few either side) are ever loaded.
  */
 function sliderize(div_elem) {
-  //Load up the APNG image...
-  var apng_frames = parseAPNG(
-        new Uint8Array(atob(div_elem.attr('apng_data')).split("").map(function(c) {
-            return c.charCodeAt(0); })) );
+  //Load up the APNG image. Getting the browser to decode the base64 via fetch() is
+  //far kinder than building an array of characters in JavaScript.
+  fetch("data:application/octet-stream;base64," + div_elem.attr('apng_data')).then(
+    function(res){ return res.arrayBuffer() }).then(
+    function(buf){ sliderize_apng(div_elem, parseAPNG(new Uint8Array(buf))) } );
+}
 
+function sliderize_apng(div_elem, apng_frames) {
   //Use a closure to identify the player (when we get it)
   var player_handle = [];
 
+  //Frames that cover the whole image can be shown directly. Others only hold the
+  //part that changed since the frame before, so need to be drawn on top of the
+  //preceding frames, starting from a full one.
+  var keyframes = apng_frames.frames.map(function(f) {
+        return f.left == 0 && f.top == 0 &&
+               f.width == apng_frames.width && f.height == apng_frames.height; });
+
+  add_slider_controls(div_elem, apng_frames.frames.length,
+                      '<canvas width="100" height="100" style="padding-left: 50px"></canvas>',
+                      function(n){ frame_change(n, player_handle, keyframes) });
+
+  // Fix the canvas size based on the first frame size.
+  div_elem.find("canvas").attr("width", apng_frames.frames[0].width);
+  div_elem.find("canvas").attr("height", apng_frames.frames[0].height);
+
+  //And play it
+  apng_frames.getPlayer(div_elem.find("canvas").get()[0].getContext("2d"), false).then(
+    function(p){ player_handle[0] = p } );
+};
+
+function frame_sliderize(div_elem) {
+  //Get the list of frames before the controls replace them
+  var frame_srcs = div_elem.find(".slider_frame").map(function(){
+                        return $(this).attr('frame_src') }).get();
+
+  //Images we have asked the browser to load, by frame number
+  var loaded = {};
+  var prefetch = 2;
+
+  var show_frame = function(n){
+      div_elem.find("img").attr("src", frame_srcs[n]);
+
+      //Keep a few frames either side ready to go, and let go of the rest.
+      for(var i in loaded){
+        if(Math.abs(i - n) > prefetch){ delete loaded[i] }
+      }
+      for(var i = Math.max(0, n - prefetch); i <= Math.min(frame_srcs.length - 1, n + prefetch); i++){
+        if(!(i in loaded)){
+          loaded[i] = new Image();
+          loaded[i].src = frame_srcs[i];
+        }
+      }
+  };
+
+  add_slider_controls(div_elem, frame_srcs.length,
+                      '<img style="border:none; padding-left: 50px" />',
+                      show_frame);
+  show_frame(0);
+}
+
+function add_slider_controls(div_elem, num_frames, display_html, on_change) {
   //Allow the label on the slider to be specified
   var slider_label = div_elem.attr('slider_label') || 'Frame to show';
   var zero_image = "Base";
@@ -21,7 +78,7 @@ function sliderize(div_elem) {
   }
 
   //Add the required elements into the div
-  div_elem.html('<canvas width="100" height="100" style="padding-left: 50px"></canvas>' +
+  div_elem.html(display_html +
                 '<div style="width: 90%">' +
                 '<div style="padding: 6px; width: 100%">' +
                 '<label for="frame_select">' + slider_label + '</label>' +
@@ -29,22 +86,22 @@ function sliderize(div_elem) {
                 '</select></div><div id="frame_slider"></div></div>'
                )
 
-  //Meld the slider and the selector, setting the range to the number of frames
-  //in the APNG. The slider will start at zero even if the first frame is labelled as 1.
+  //Meld the slider and the selector, setting the range to the number of frames.
+  //The slider will start at zero even if the first frame is labelled as 1.
   div_elem.find("#frame_slider").slider({
       min: 0,
-      max: apng_frames.frames.length - 1,
+      max: num_frames - 1,
       range: "min",
       value: div_elem.find("#frame_select")[0].selectedIndex,
       slide: function(event, ui) {
         div_elem.find("#frame_select")[0].selectedIndex = ui.value;
-        frame_change(div_elem.find("#frame_select")[0].selectedIndex, player_handle);
+        on_change(div_elem.find("#frame_select")[0].selectedIndex);
       }
     });
   div_elem.find("#frame_select").on("change", function() {
     div_elem.find("#frame_slider").slider("value", this.selectedIndex);
 
-    frame_change(this.selectedIndex, player_handle);
+    on_change(this.selectedIndex);
   });
 
   //Add items to the selector list to match the slider.
@@ -58,22 +115,14 @@ function sliderize(div_elem) {
     opt.text = String(zero_image);
     fs.add(opt, null)
   }
-  while(fs.length < apng_frames.frames.length){
+  while(fs.length < num_frames){
     var opt = document.createElement('option');
     opt.text = String(zero_image ? fs.length : fs.length + 1);
     fs.add(opt, null)
   }
+}
 
-  // Fix the canvas size based on the first frame size.
-  div_elem.find("canvas").attr("width", apng_frames.frames[0].width);
-  div_elem.find("canvas").attr("height", apng_frames.frames[0].height);
-
-  //And play it
-  apng_frames.getPlayer(div_elem.find("canvas").get()[0].getContext("2d"), false).then(
-    function(p){ player_handle[0] = p } );
-};
-
-function frame_change(n, player_handle){
+function frame_change(n, player_handle, keyframes){
     //My understanding is that we can't just tell the player to go to
     //an arbitrary frame, but we can render all the frames to HTMLImageElements
     //and then flip through those. I think.
@@ -101,12 +150,24 @@ function frame_change(n, player_handle){
     // Try 2 - fuxing the code to render a frame by number.
     // But this could corrupt the image as we can only get a frame correct by rendering it over
     // the previous version. May work for our use case, though!
-
-    player_handle[0].renderFrame(n);
+    // Try 3 - as above, but render forwards from the last full frame. If we're already
+    // part way there we can carry on from the current frame.
+    var current = player_handle[0].currentFrameNumber;
+    var start = n;
+    while(start > 0 && !keyframes[start] && start != current){
+        start--;
+    }
+    if(start == current && start != n){
+        start++;
+    }
+    for(var i = start; i <= n; i++){
+        player_handle[0].renderFrame(i);
+    }
 
     //console.log("Frame is now " + player_handle[0].currentFrameNumber);
 }
 
 $( function(){
     $(".apng_slider").each( function(){ sliderize( $(this) ) } );
+    $(".frame_slider").each( function(){ frame_sliderize( $(this) ) } );
 });
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Helpers for the various things the plugin keeps between runs of MultiQC.
+   Since we make the same reports over and over for a run as the pipeline
+   progresses there is a lot to be saved by not re-doing work.
+"""
+import os, re
+import pickle
+import hashlib
+import logging
+
+log = logging.getLogger('multiqc')
+
+# The cache files are named by analysis_dirs_key(), so we know which ones are ours
+CACHE_FILE_RE = re.compile(r'^[0-9a-f]{40}\.pickle$')
+
+def default_cache_dir(*subdirs):
+    """Where to keep the cache if the config doesn't say otherwise. This follows the
+       XDG convention, so it will normally be ~/.cache/multiqc_edgen/...
+    """
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base_dir, 'multiqc_edgen', *subdirs)
+
+def analysis_dirs_key(analysis_dirs):
+    """A short name for a list of directories, to keep the caches for different runs apart.
+    """
+    dirs = sorted( os.path.realpath(d) for d in analysis_dirs )
+
+    return hashlib.sha1('\0'.join(dirs).encode('utf-8')).hexdigest()
+
+class FileStatCache():
+    """A pickle file holding results derived from other files, each keyed on the path,
+       size and mtime of the file it came from, so anything that changed is re-done.
+
+       Several reports are made from the same run (the overview and each lane, whether
+       by --all-lanes or by separate MultiQC runs) and each only looks at some of the
+       files, so saving merges with whatever is in the file by then. Entries for files
+       that have gone away or changed are dropped when saving.
+
+       There is one cache file per run (or set of analysis dirs), so the mtime of the
+       file is bumped whenever it is used and evict() removes the least recently used
+       ones, as RenderCache.evict() does for rendered plots.
+    """
+    # Bump this if the format of what callers store changes
+    VERSION = 1
+
+    def __init__(self, cache_file, version=0):
+
+        self.cache_file = cache_file
+        self.version = (self.VERSION, version)
+        self.entries = self.load_entries()
+        self.added = dict()
+
+    def load_entries(self):
+        """Read what is in the cache file now.
+        """
+        try:
+            with open(self.cache_file, 'rb') as cfh:
+                saved_version, entries = pickle.load(cfh)
+            if saved_version == self.version:
+                return entries
+        except Exception:
+            # Missing or corrupt or whatever - just start afresh
+            pass
+        return dict()
+
+    @staticmethod
+    def stat_key(filename):
+        st = os.stat(filename)
+        return (st.st_size, st.st_mtime_ns)
+
+    def get(self, filename):
+        """Get the saved result for filename, or None if there is nothing saved or the
+           file has changed.
+        """
+        filename = os.path.abspath(filename)
+        try:
+            saved_stat, value = self.entries[filename]
+            if saved_stat != self.stat_key(filename):
+                return None
+        except (KeyError, OSError):
+            return None
+
+        return value
+
+    def put(self, filename, value, stat_key=None):
+        """Save a result for filename, based on the file as it is now. If the file might
+           have changed while the value was being worked out, get stat_key() beforehand
+           and pass it in.
+        """
+        filename = os.path.abspath(filename)
+        self.entries[filename] = self.added[filename] = (stat_key or self.stat_key(filename), value)
+
+    def save(self):
+        """Write out the cache if anything was added, merged with anything another report
+           saved since we loaded it. Otherwise just mark it as used.
+        """
+        if not self.added:
+            if os.path.exists(self.cache_file):
+                os.utime(self.cache_file)
+            return
+
+        entries = dict(self.entries)
+        entries.update(self.load_entries())
+        entries.update(self.added)
+
+        # Drop anything for files that have gone or changed. This is one stat per entry,
+        # which is nothing next to re-reading the files.
+        for filename in list(entries):
+            try:
+                if entries[filename][0] != self.stat_key(filename):
+                    del entries[filename]
+            except OSError:
+                del entries[filename]
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        tmp_file = "{}.tmp{}".format(self.cache_file, os.getpid())
+        with open(tmp_file, 'wb') as cfh:
+            pickle.dump((self.version, entries), cfh)
+        os.replace(tmp_file, self.cache_file)
+
+        self.entries = entries
+        self.added = dict()
+
+    def evict(self, max_bytes):
+        """Remove the least recently used cache files alongside this one until the total
+           size is within max_bytes. This one is always kept.
+        """
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        if not os.path.isdir(cache_dir):
+            # Nothing has been saved yet
+            return
+        entries = []
+        total_size = 0
+        for de in os.scandir(cache_dir):
+            if not CACHE_FILE_RE.match(de.name) or not de.is_file():
+                continue
+            st = de.stat()
+            total_size += st.st_size
+            if de.path != os.path.abspath(self.cache_file):
+                entries.append( (st.st_mtime, st.st_size, de.path) )
+
+        for mtime, size, path in sorted(entries):
+            if total_size <= max_bytes:
+                break
+            log.debug("Evicting cache file {}".format(path))
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Someone else got there first
+                pass
+            total_size -= size
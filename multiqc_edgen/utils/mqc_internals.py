@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+""" The bits of MultiQC's run sequence that --all-lanes needs, all in one place.
+
+    MultiQC 1.9 has no way to make a second report in the same process: multiqc.py
+    does everything inline in run(), and run() can only be called once. So to make
+    the lane reports we repeat the steps multiqc.py takes between running the modules
+    and writing the report. Each function here says which step it stands in for.
+    Nothing else in this plugin should reach into MultiQC's report or template
+    machinery, so if MultiQC changes this is the file that needs to follow suit, and
+    tests/test_all_lanes.py should show where.
+"""
+
+import importlib
+import io
+import logging
+import os, re
+import shutil
+import traceback
+from base64 import b64encode
+
+import jinja2
+
+from multiqc.utils import report, config, plugin_hooks
+from multiqc.plots import table
+
+log = logging.getLogger('multiqc')
+
+def module_order():
+    """ All the modules MultiQC knows about, with any custom config, in the order
+        multiqc.py runs them: top_modules, then any not in module_order, then
+        module_order. Returns a list of (name, mod_cust_config).
+    """
+    ordered = [ m if isinstance(m, dict) else {m: {}} for m in config.top_modules ]
+    ordered_names = [ n for m in config.module_order for n in (m if isinstance(m, dict) else [m]) ]
+    ordered.extend( {m: {}} for m in config.avail_modules if m not in ordered_names )
+    ordered.extend( m if isinstance(m, dict) else {m: {}} for m in config.module_order )
+
+    return [ list(m.items())[0] for m in ordered ]
+
+def reset_report():
+    """ Put the report back to how it was before any modules ran, by re-loading it.
+        Anything added to the report module from outside survives this, so the module
+        output (added by multiqc.py) and edgen_run (added by us) are cleared here.
+    """
+    importlib.reload(report)
+    report.modules_output = list()
+    report.edgen_run = dict()
+
+def run_module(name, mod_cust_config):
+    """ Run one module and add the output to the report, as the main loop in multiqc.py
+        does. A module that finds nothing raises UserWarning. A module that breaks is
+        logged with the traceback and left out, so the other modules and the other lanes
+        still get reported. Returns True if the module added anything.
+    """
+    try:
+        mod = config.avail_modules[name].load()
+        mod.mod_cust_config = mod_cust_config
+        output = mod()
+        report.modules_output.extend( output if type(output) == list else [output] )
+        return True
+    except UserWarning:
+        log.debug("No samples found: {}".format(name))
+    except Exception:
+        log.error( "The '{}' module broke for the {} report. The last file found was:\n"
+                   "    {}\n{}\n{}{}".format( name, config.kwargs.get('lane') or 'current',
+                                              getattr(report, 'last_found_file', None),
+                                              '=' * 60, traceback.format_exc(), '=' * 60 ) )
+    return False
+
+def trigger(hook):
+    """ Run the plugin hooks for this stage, as multiqc.py does.
+    """
+    plugin_hooks.mqc_trigger(hook)
+
+def make_general_stats():
+    """ Make the General Statistics table, as multiqc.py does.
+    """
+    for i in reversed(range(len(report.general_stats_data))):
+        if not report.general_stats_data[i]:
+            del report.general_stats_data[i]
+            del report.general_stats_headers[i]
+
+    for h in report.general_stats_headers:
+        for k in h:
+            if 'rid' not in h[k]:
+                h[k]['rid'] = re.sub(r'\W+', '_', k).strip().strip('_')
+            ns_html = re.sub(r'\W+', '_', h[k]['namespace']).strip().strip('_').lower()
+            h[k]['rid'] = report.save_htmlid('mqc-generalstats-{}-{}'.format(ns_html, h[k]['rid']))
+
+    if report.general_stats_data:
+        config.skip_generalstats = False
+        report.general_stats_html = table.plot( report.general_stats_data,
+                                                report.general_stats_headers,
+                                                { 'id': 'general_stats_table',
+                                                  'table_title': 'General Statistics',
+                                                  'save_file': True,
+                                                  'raw_data_fn':'multiqc_general_stats' } )
+    else:
+        config.skip_generalstats = True
+
+def save_report_data():
+    """ Write out the data sources (and the DOIs, for versions of MultiQC that collect
+        them) and compress the plot data for the template, as multiqc.py does.
+    """
+    report.data_sources_tofile()
+    if hasattr(report, 'dois_tofile'):
+        report.dois_tofile()
+    report.plot_compressed_json = report.compress_json(report.plot_data)
+
+def template_dirs():
+    """ The directories for the report template, the parent template first as that is
+        the order multiqc.py copies them in.
+    """
+    template_mod = config.avail_templates[config.template].load()
+    res = [template_mod.template_dir]
+    if getattr(template_mod, 'template_parent', None):
+        res.insert(0, config.avail_templates[template_mod.template_parent].load().template_dir)
+    return template_mod, res
+
+def load_template():
+    """ Get the Jinja template for the report. Rather than copying the template files
+        into a temp dir as multiqc.py does, look in our template dir and then the parent.
+    """
+    template_mod, t_dirs = template_dirs()
+    t_dirs = t_dirs[::-1]
+
+    def include_file(name, fdir=None, b64=False):
+        for d in ([fdir] if fdir is not None else t_dirs):
+            try:
+                if b64:
+                    with io.open(os.path.join(d, name), "rb") as f:
+                        return b64encode(f.read()).decode('utf-8')
+                else:
+                    with io.open(os.path.join(d, name), "r", encoding='utf-8') as f:
+                        return f.read()
+            except (OSError, IOError):
+                pass
+        log.error("Could not include file '{}'".format(name))
+
+    env = jinja2.Environment(loader=jinja2.ChoiceLoader([ jinja2.FileSystemLoader(d) for d in t_dirs ]))
+    env.globals['include_file'] = include_file
+    return env.get_template(template_mod.base_fn)
+
+def write_report(j_template, output_fn):
+    """ Render the report and copy over any files the template asks for, as multiqc.py
+        does. The child template's files overwrite the parent's.
+    """
+    with io.open(output_fn, "w", encoding='utf-8') as f:
+        print(j_template.render(report=report, config=config), file=f)
+
+    template_mod, t_dirs = template_dirs()
+    for f in getattr(template_mod, 'copy_files', []):
+        for d in t_dirs:
+            if os.path.exists(os.path.join(d, f)):
+                copy_tree(os.path.join(d, f), os.path.join(os.path.dirname(output_fn), f))
+
+def copy_tree(src, dest):
+    """ Copy src into dest, merging with anything already there and following symlinks,
+        like the distutils copy_tree that multiqc.py uses. distutils is deprecated, so
+        this is done by hand.
+    """
+    if not os.path.isdir(src):
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        shutil.copyfile(src, dest)
+        return
+
+    for root, dirs, files in os.walk(src, followlinks=True):
+        dest_root = os.path.normpath(os.path.join(dest, os.path.relpath(root, src)))
+        os.makedirs(dest_root, exist_ok=True)
+        for fn in files:
+            shutil.copyfile(os.path.join(root, fn), os.path.join(dest_root, fn))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+""" Putting copies of files into the report data directory. A run can have thousands
+    of FastQC reports, so where possible we avoid copying the data more than we have to.
+
+    Note that in a normal MultiQC run config.data_dir is a temporary directory while the
+    modules run, and MultiQC copies everything from there into the real data directory at
+    the end, following any symlinks. So the bytes get copied then whatever we do, and
+    the best we can do is to put a symlink in the temporary directory so they are only
+    copied the once. data_dir_placer() sorts this out. Linking and cloning only pay off
+    when the destination is where the file will stay, as for the lane reports made with
+    --all-lanes and the shared attachments directory.
+"""
+import os
+import shutil
+import logging
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger('multiqc')
+
+# Try these in order. Any that don't work on this system (or between these two
+# filesystems) fall through to the next one.
+DEFAULT_STRATEGIES = ['link', 'reflink', 'copy']
+
+# From linux/fs.h - clone a whole file on filesystems like btrfs and XFS
+FICLONE = 0x40049409
+
+class FilePlacer():
+    """ Puts files in place and keeps count of what was done.
+        Strategies are:
+          link    - hard link, so no data is copied
+          reflink - copy-on-write clone, or failing that copy_file_range() which lets
+                    the kernel (or NFS server) do the copying
+          copy    - plain old copy
+          symlink - only for the temporary data dir, which MultiQC copies at the end
+    """
+    def __init__(self, strategies=None):
+        self.strategies = list(strategies or DEFAULT_STRATEGIES)
+        for s in self.strategies:
+            if not hasattr(self, '_' + s):
+                raise ValueError("Unknown file placement strategy {!r}".format(s))
+
+        self.counts = dict(skipped=0)
+        self.bytes_copied = 0
+        self.lock = Lock()
+
+    def place(self, src, dest):
+        """ Put a copy of src at dest, unless it's already there. Returns dest.
+        """
+        src_stat = os.stat(src)
+
+        # See if the file is already in place, either because it's the same file or a
+        # copy with matching size and mtime. This only happens where dest is kept between
+        # runs, like the shared attachments directory.
+        try:
+            dest_stat = os.stat(dest)
+            if ( os.path.samestat(src_stat, dest_stat) or
+                 (dest_stat.st_size, dest_stat.st_mtime_ns) == (src_stat.st_size, src_stat.st_mtime_ns) ):
+                with self.lock:
+                    self.counts['skipped'] += 1
+                return dest
+            os.unlink(dest)
+        except FileNotFoundError:
+            pass
+
+        for s in self.strategies:
+            try:
+                copied = getattr(self, '_' + s)(src, dest, src_stat)
+            except OSError as e:
+                log.debug("Could not {} {} to {}: {}".format(s, src, dest, e))
+                # Don't leave a partial file for the next strategy to trip over
+                if os.path.lexists(dest):
+                    os.unlink(dest)
+                continue
+
+            if copied is None:
+                # Strategy not available here
+                continue
+
+            with self.lock:
+                self.counts[s] = self.counts.get(s, 0) + 1
+                self.bytes_copied += copied
+            return dest
+
+        raise OSError("Unable to place {} at {}".format(src, dest))
+
+    def place_all(self, plan, threads=1):
+        """ Place all the files in plan, which is a list of (src, dest) pairs. On a
+            shared filesystem the time goes on waiting for the server, so running
+            several at once helps a lot.
+            If two files are planned for the same dest, the last one wins, as it would
+            if they were placed in order.
+        """
+        plan = dict( (dest, src) for src, dest in plan )
+
+        if threads > 1 and len(plan) > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                # list() so any exception is raised here
+                list(pool.map(self.place, plan.values(), plan.keys()))
+        else:
+            for dest, src in plan.items():
+                self.place(src, dest)
+
+    def log_summary(self, what="files"):
+        """ Say what was done, if anything.
+        """
+        total = sum(self.counts.values())
+        if total:
+            log.info("Placed {} {} ({}), copying {} bytes{}".format(
+                        total, what,
+                        ", ".join("{} {}".format(v, k) for k, v in sorted(self.counts.items()) if v),
+                        self.bytes_copied,
+                        " (MultiQC copies the symlinked files later)" if self.counts.get('symlink') else "" ))
+
+    def _symlink(self, src, dest, src_stat):
+        os.symlink(os.path.abspath(src), dest)
+        return 0
+
+    def _link(self, src, dest, src_stat):
+        os.link(src, dest)
+        return 0
+
+    def _reflink(self, src, dest, src_stat):
+        with open(src, 'rb') as sfh, open(dest, 'wb') as dfh:
+            try:
+                import fcntl
+                fcntl.ioctl(dfh.fileno(), FICLONE, sfh.fileno())
+                copied = 0
+            except (ImportError, OSError):
+                if not hasattr(os, 'copy_file_range'):
+                    # Python < 3.8 or not Linux
+                    copied = None
+                else:
+                    copied = 0
+                    while copied < src_stat.st_size:
+                        n = os.copy_file_range(sfh.fileno(), dfh.fileno(), src_stat.st_size - copied)
+                        if not n:
+                            raise OSError("copy_file_range stopped short at {} bytes".format(copied))
+                        copied += n
+
+        if copied is None:
+            os.unlink(dest)
+            return None
+
+        os.utime(dest, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        return copied
+
+    def _copy(self, src, dest, src_stat):
+        # copy2 keeps the mtime so we can spot the file next time
+        shutil.copy2(src, dest)
+        return src_stat.st_size
+
+def data_dir_placer(config):
+    """ Get a FilePlacer for putting files into config.data_dir. If that is MultiQC's
+        temporary directory, which it copies into the real data directory at the end,
+        use symlinks so the files are only copied then. Otherwise use the strategies in
+        edgen_file_placement.
+    """
+    if config.data_dir == config.data_tmp_dir:
+        return FilePlacer(['symlink', 'copy'])
+    return FilePlacer(getattr(config, 'edgen_file_placement', None))
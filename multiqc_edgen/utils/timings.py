@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""Keeping track of where the time goes. Wrap any slow part of the plugin like so:
+
+     with timed('edgen_interop.gnuplot', label=plot_name):
+         ...
+
+   or use @timed('stage') on a function. Every stage is added up over all the times
+   it runs, and edgen_finish saves the totals as multiqc_edgen_timings.json in the
+   report data directory.
+
+   Note that CPU time, child CPU time and I/O are counted for the whole process, so
+   when stages overlap in threads (the GNUPlot and file placement pools) they are
+   counted under every stage that was running. Child CPU is only counted once the
+   child exits. Peak RSS is the high-water mark for the process at the time the stage
+   ends. These are rough numbers, meant for spotting where production runs are slow.
+"""
+import sys
+import time
+import json
+from threading import Lock
+from contextlib import contextmanager
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+# ru_maxrss is in KB on Linux but bytes on a Mac
+MAXRSS_SCALE = 1024 if sys.platform == 'darwin' else 1
+
+COUNTERS = [ 'wall', 'cpu', 'children_cpu', 'bytes_read', 'bytes_written' ]
+
+stages = OrderedDict()
+stages_lock = Lock()
+
+def read_proc_io():
+    """Get (bytes_read, bytes_written) for this process, including reads and writes
+       on pipes, or (0, 0) where /proc is not available.
+    """
+    try:
+        with open('/proc/self/io') as fh:
+            io = dict( l.split(':') for l in fh )
+        return int(io['rchar']), int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+def snapshot():
+    if resource:
+        ru_self = resource.getrusage(resource.RUSAGE_SELF)
+        ru_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        children_cpu = ru_children.ru_utime + ru_children.ru_stime
+        rss = (ru_self.ru_maxrss // MAXRSS_SCALE, ru_children.ru_maxrss // MAXRSS_SCALE)
+    else:
+        children_cpu, rss = 0.0, (0, 0)
+
+    return dict( zip(COUNTERS, (time.perf_counter(), time.process_time(), children_cpu) + read_proc_io()),
+                 rss = rss )
+
+@contextmanager
+def timed(stage, label=None):
+    """Time the code in the with block and add it to the totals for the stage.
+       label, if given, is used to report the slowest call.
+       The dict yielded can be used to add to 'bytes_read' and 'bytes_written' for I/O
+       that the process counters miss, such as files written by a subprocess.
+    """
+    extra = dict(bytes_read=0, bytes_written=0)
+    start = snapshot()
+    try:
+        yield extra
+    finally:
+        end = snapshot()
+        record(stage, label, { k: end[k] - start[k] + extra.get(k, 0) for k in COUNTERS }, end['rss'])
+
+def record(stage, label, counts, rss):
+    with stages_lock:
+        s = stages.get(stage)
+        if s is None:
+            s = stages[stage] = OrderedDict( [('calls', 0)] + [ (k, 0) for k in COUNTERS ] +
+                                             [ ('peak_rss_kb', 0), ('children_peak_rss_kb', 0), ('slowest', None) ] )
+        s['calls'] += 1
+        for k in COUNTERS:
+            s[k] += counts[k]
+        s['peak_rss_kb'] = max(s['peak_rss_kb'], rss[0])
+        s['children_peak_rss_kb'] = max(s['children_peak_rss_kb'], rss[1])
+        if label is not None and (s['slowest'] is None or counts['wall'] > s['slowest']['wall']):
+            s['slowest'] = dict(label=str(label), wall=round(counts['wall'], 4))
+
+def summary():
+    """All the stages so far, as a dict ready to save as JSON.
+    """
+    with stages_lock:
+        res = OrderedDict()
+        for stage, s in stages.items():
+            res[stage] = OrderedDict( (k, round(v, 4) if isinstance(v, float) else v)
+                                      for k, v in s.items() )
+        return res
+
+def reset():
+    with stages_lock:
+        stages.clear()
+
+def save(filename, reset_after=False):
+    """Save the summary to filename. With reset_after, the next save will only have
+       what happened after this one. Returns the number of stages saved.
+    """
+    res = summary()
+    if resource:
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // MAXRSS_SCALE
+    else:
+        peak_rss_kb = None
+
+    with open(filename, 'w') as tfh:
+        json.dump(dict(peak_rss_kb=peak_rss_kb, stages=res), tfh, indent=2)
+        print(file=tfh)
+
+    if reset_after:
+        reset()
+    return len(res)
@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+# The one place the version number lives. This is read by setup.py as well as the plugin,
+# which saves asking pkg_resources for it on every MultiQC run.
+__version__ = '1.5.1'
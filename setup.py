@@ -17,7 +17,11 @@ $ env PYTHONPATH="`python3 -m site --user-site`" python3 ./setup.py --verbose de
 
 from setuptools import setup, find_packages
 
-version = '1.5.1'
+# Get the version without importing the package, which needs MultiQC
+version_info = {}
+with open('multiqc_edgen/version.py') as vfh:
+    exec(vfh.read(), version_info)
+version = version_info['__version__']
 
 setup(
     name = 'multiqc_edgen',
@@ -30,7 +34,7 @@ setup(
     url = 'http://gitlab.genepool.private/production-team/MultiQC_EdGen',
     download_url = 'http://gitlab.genepool.private/production-team/MultiQC_EdGen',
     license = 'MIT',
-    packages = find_packages(),
+    packages = find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data = True,
     package_data = { '': ['utils/*.yaml', '*.html',
                           'templates/*/assets/img/*.*',
@@ -58,6 +62,7 @@ setup(
             'enable = multiqc_edgen.cli:enable_edgen',
             'run_id = multiqc_edgen.cli:run_id',
             'lane   = multiqc_edgen.cli:lane',
+            'all_lanes = multiqc_edgen.cli:all_lanes',
             'pipeline_status = multiqc_edgen.cli:pipeline_status',
         ],
         # Hooks.
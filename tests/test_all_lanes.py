@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""Test splitting a run into the overview and the lane reports for --all-lanes. This
+   needs MultiQC installed. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import unittest
+from unittest.mock import patch
+
+from multiqc.utils import config, report, plugin_hooks
+from multiqc.modules.base_module import BaseMultiqcModule
+
+from multiqc_edgen import all_lanes
+from multiqc_edgen.utils import mqc_internals
+
+# A small run. The interop files are for the whole flowcell, the logs are per lane,
+# and lane 2 has a log that breaks the module.
+RUN_FILES = { 'fake_interop': [ 'interop/run_summary.interop_plot' ],
+              'fake_logs':    [ 'lane1/200101_1_0000.log', 'lane1/200101_1_0001.log',
+                                'lane2/200101_2_0000.log', 'lane2/broken.log' ],
+              'fake_fastqc':  [ 'lane1/fastqc/200101_1_0000_fastqc.zip',
+                                'lane2/fastqc/200101_2_0000_fastqc.zip',
+                                'SampleSheet.csv' ] }
+
+# The config settings the tests change, which are put back afterwards
+CONFIG_KEYS = [ 'kwargs', 'output_dir', 'output_fn', 'data_dir', 'data_dir_name', 'data_tmp_dir',
+                'title', 'force', 'make_data_dir', 'template', 'edgen_all_lanes' ]
+
+class FakeEntryPoint():
+    def __init__(self, mod_class):
+        self.mod_class = mod_class
+
+    def load(self):
+        return self.mod_class
+
+def fake_module(sp_key, seen):
+    """Make a module that notes the files it was given, for each lane.
+    """
+    class FakeModule(BaseMultiqcModule):
+        def __init__(self):
+            super(FakeModule, self).__init__(name=sp_key, anchor=sp_key)
+
+            files = sorted( f['fn'] for f in self.find_log_files(sp_key, filecontents=False) )
+            seen.setdefault(config.kwargs.get('lane') or 'overview', dict())[sp_key] = files
+
+            if 'broken.log' in files:
+                raise RuntimeError("Can't read broken.log")
+            if not files:
+                raise UserWarning
+            self.add_section(content='<p>{} found {}</p>'.format(sp_key, ' '.join(files)))
+    return FakeModule
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.out_dir = tempfile.mkdtemp()
+        self.data_dir = tempfile.mkdtemp()
+
+        self.saved_config = { k: getattr(config, k) for k in CONFIG_KEYS if hasattr(config, k) }
+        config.kwargs = dict(lane=None)
+        config.output_dir = self.out_dir
+        config.output_fn = os.path.join(self.out_dir, 'multiqc_report_overview.html')
+        config.data_dir = config.data_tmp_dir = self.data_dir
+        config.data_dir_name = 'multiqc_report_overview_data'
+        config.title = None
+        config.force = True
+        config.make_data_dir = True
+        config.template = 'default'
+        config.edgen_all_lanes = dict(shared_files=['SampleSheet.csv'])
+
+        # The main run would have found these
+        mqc_internals.reset_report()
+        report.files = dict()
+        for sp_key, paths in RUN_FILES.items():
+            report.files[sp_key] = list()
+            for p in paths:
+                os.makedirs(os.path.join(self.run_dir, os.path.dirname(p)), exist_ok=True)
+                open(os.path.join(self.run_dir, p), 'w').close()
+                report.files[sp_key].append(dict( root = os.path.join(self.run_dir, os.path.dirname(p)),
+                                                   fn = os.path.basename(p) ))
+
+        # Only the fake modules are available, and none of the plugin hooks run
+        self.seen = dict()
+        patchers = [ patch.dict( config.avail_modules,
+                                 { k: FakeEntryPoint(fake_module(k, self.seen)) for k in RUN_FILES },
+                                 clear = True ),
+                     patch.dict(plugin_hooks.hook_functions, clear=True),
+                     patch.dict(all_lanes.found, files=None, modules=None) ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        for k in CONFIG_KEYS:
+            if k in self.saved_config:
+                setattr(config, k, self.saved_config[k])
+            elif hasattr(config, k):
+                delattr(config, k)
+        for d in [self.run_dir, self.out_dir, self.data_dir]:
+            shutil.rmtree(d)
+
+    def run_overview(self):
+        all_lanes.split_files()
+        for name, mod_cust_config in all_lanes.found['modules']:
+            mqc_internals.run_module(name, mod_cust_config)
+
+    def read_report(self, lane):
+        with open(os.path.join(self.out_dir, 'multiqc_report_lane{}.html'.format(lane))) as fh:
+            return fh.read()
+
+    def test_overview_files(self):
+        """The overview only gets the files that are not for any one lane.
+        """
+        self.run_overview()
+
+        self.assertEqual(self.seen['overview'], { 'fake_interop': ['run_summary.interop_plot'],
+                                                  'fake_logs': [],
+                                                  'fake_fastqc': ['SampleSheet.csv'] })
+        self.assertEqual( [ m.name for m in report.modules_output ], ['fake_interop', 'fake_fastqc'] )
+
+    def test_lane_files(self):
+        """Each lane gets its own files plus the shared ones, and nothing from the overview.
+        """
+        self.run_overview()
+        with self.assertLogs('multiqc', level='ERROR'):
+            all_lanes.LaneReports().make_all()
+
+        self.assertEqual(self.seen['lane1'], { 'fake_interop': [],
+                                               'fake_logs': ['200101_1_0000.log', '200101_1_0001.log'],
+                                               'fake_fastqc': ['200101_1_0000_fastqc.zip', 'SampleSheet.csv'] })
+        self.assertEqual(self.seen['lane2'], { 'fake_interop': [],
+                                               'fake_logs': ['200101_2_0000.log', 'broken.log'],
+                                               'fake_fastqc': ['200101_2_0000_fastqc.zip', 'SampleSheet.csv'] })
+
+        # The config and the files are put back for the overview afterwards
+        self.assertEqual(config.kwargs['lane'], None)
+        self.assertEqual(config.output_fn, os.path.join(self.out_dir, 'multiqc_report_overview.html'))
+        self.assertEqual( [ f['fn'] for f in report.files['fake_interop'] ], ['run_summary.interop_plot'] )
+
+    def test_broken_module(self):
+        """A module that breaks in lane 2 is left out of that lane only, and both reports
+           get written.
+        """
+        self.run_overview()
+        with self.assertLogs('multiqc', level='ERROR') as logs:
+            all_lanes.LaneReports().make_all()
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("The 'fake_logs' module broke for the lane2 report", logs.output[0])
+        self.assertIn("RuntimeError: Can't read broken.log", logs.output[0])
+
+        lane1, lane2 = self.read_report(1), self.read_report(2)
+        self.assertIn('fake_logs found 200101_1_0000.log 200101_1_0001.log', lane1)
+        self.assertIn('fake_fastqc found 200101_1_0000_fastqc.zip SampleSheet.csv', lane1)
+        self.assertNotIn('fake_logs found', lane2)
+        self.assertIn('fake_fastqc found 200101_2_0000_fastqc.zip SampleSheet.csv', lane2)
+
+        for lane in [1, 2]:
+            self.assertTrue(os.path.exists(os.path.join( self.out_dir, 'multiqc_report_lane{}_data'.format(lane),
+                                                         'multiqc_sources.txt' )))
+
+    def test_copy_tree(self):
+        """copy_tree() merges into what is there already, like the distutils version.
+        """
+        dest = os.path.join(self.out_dir, 'copy')
+        os.makedirs(os.path.join(dest, 'old'))
+
+        mqc_internals.copy_tree(self.run_dir, dest)
+
+        self.assertTrue(os.path.isdir(os.path.join(dest, 'old')))
+        self.assertTrue(os.path.isfile(os.path.join(dest, 'SampleSheet.csv')))
+        self.assertTrue(os.path.isfile(os.path.join(dest, 'lane2', 'fastqc', '200101_2_0000_fastqc.zip')))
+
+if __name__ == '__main__':
+    unittest.main()
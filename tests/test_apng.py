@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""Test the APNG assembler by decoding what it makes and comparing each frame with the
+   PNG it came from. The frames are drawn by the matplotlib renderer, as in a real run,
+   so this needs matplotlib and numpy. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import struct
+import unittest
+import zlib
+
+from multiqc_edgen.modules.edgen_interop.apng import assemble_apng, read_chunks, make_chunk, PNG_SIGNATURE, CHANNELS
+from multiqc_edgen.modules.edgen_interop.plot_render import PlotRenderer
+
+from test_gnuplot_script import HEATMAP_SCRIPT
+
+def unfilter(raw, width, height, bpp, stride):
+    """Undo the PNG filters, giving a list of rows of pixel bytes.
+    """
+    rows = []
+    prev = bytearray(stride - 1)
+    for y in range(height):
+        ftype, row = raw[y*stride], bytearray(raw[y*stride+1:(y+1)*stride])
+        for i in range(len(row)):
+            a = row[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            if ftype == 1:
+                row[i] = (row[i] + a) & 0xff
+            elif ftype == 2:
+                row[i] = (row[i] + b) & 0xff
+            elif ftype == 3:
+                row[i] = (row[i] + (a + b) // 2) & 0xff
+            elif ftype == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xff
+        rows.append(bytes(row))
+        prev = row
+    return rows
+
+def image_params(ihdr):
+    width, height, bit_depth, colour_type = struct.unpack('>IIBB', ihdr[:10])
+    bpp = max(1, CHANNELS[colour_type] * bit_depth // 8)
+    stride = (width * CHANNELS[colour_type] * bit_depth + 7) // 8 + 1
+    return width, height, bpp, stride
+
+def decode_png(filename):
+    """The unfiltered rows of a PNG.
+    """
+    chunks = list(read_chunks(filename))
+    width, height, bpp, stride = image_params(dict(chunks)[b'IHDR'])
+    raw = zlib.decompress(b''.join( d for t, d in chunks if t == b'IDAT' ))
+    return unfilter(raw, width, height, bpp, stride)
+
+def decode_apng(filename):
+    """The unfiltered rows of each frame of an APNG, composed as a viewer would with
+       no disposal and source blending. Also returns the number of frames stored in full.
+    """
+    chunks = list(read_chunks(filename))
+    width, height, bpp, stride = image_params(dict(chunks)[b'IHDR'])
+    num_frames = struct.unpack('>I', dict(chunks)[b'acTL'][:4])[0]
+
+    canvas = [ bytes(stride - 1) ] * height
+    frames, full_frames = [], 0
+    fctl, zdata = None, []
+
+    def draw():
+        nonlocal canvas, full_frames
+        _, f_width, f_height, x, y = struct.unpack('>IIIII', fctl[:20])
+        assert (f_width, x) == (width, 0)
+        f_stride = (stride - 1) * f_width // width + 1
+        rows = unfilter(zlib.decompress(b''.join(zdata)), f_width, f_height, bpp, f_stride)
+        canvas = canvas[:y] + rows + canvas[y+f_height:]
+        frames.append(canvas)
+        full_frames += (f_height == height)
+
+    for ctype, data in chunks:
+        if ctype in (b'fcTL', b'IEND') and fctl:
+            draw()
+            zdata = []
+        if ctype == b'fcTL':
+            fctl = data
+        elif ctype == b'IDAT':
+            zdata.append(data)
+        elif ctype == b'fdAT':
+            zdata.append(data[4:])
+
+    assert len(frames) == num_frames
+    return frames, full_frames
+
+def write_png(filename, width, rows, colour_type=2, palette=None):
+    """Write a simple 8-bit PNG, with no filtering.
+    """
+    with open(filename, 'wb') as fh:
+        fh.write(PNG_SIGNATURE)
+        fh.write(make_chunk(b'IHDR', struct.pack('>IIBBBBB', width, len(rows), 8, colour_type, 0, 0, 0)))
+        if palette:
+            fh.write(make_chunk(b'PLTE', palette))
+        fh.write(make_chunk(b'IDAT', zlib.compress(b''.join( b'\0' + r for r in rows ))))
+        fh.write(make_chunk(b'IEND', b''))
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def render_frames(self, cycles=7):
+        """Draw a heatmap for each cycle where a few cells change each time.
+        """
+        renderer = PlotRenderer()
+        rows = [ line.split() for line in HEATMAP_SCRIPT.splitlines()[6:8] ]
+        frames = []
+        for cycle in range(cycles):
+            rows[cycle % 2][cycle % 3] = str(cycle)
+            fn = 'flowcell_all_cycle_{:04d}.png'.format(cycle + 1)
+            script = HEATMAP_SCRIPT.splitlines()[:6] + [ ' '.join(r) for r in rows ] + ['e', 'e']
+            script[0] = "set terminal png size 200,150"
+            script[1] = "set output '{}'".format(fn)
+            script[2] = "set title 'Cycle {}'".format(cycle + 1)
+            self.assertTrue(renderer.render(script, self.tmp_dir))
+            frames.append(os.path.join(self.tmp_dir, fn))
+        return frames
+
+    def test_round_trip(self):
+        frame_files = self.render_frames()
+        expected = [ decode_png(f) for f in frame_files ]
+
+        for keyframe_interval, full_frames in [(1, 7), (3, 3), (10, 1), (0, 1)]:
+            with self.subTest(keyframe_interval=keyframe_interval):
+                apng_file = os.path.join(self.tmp_dir, 'flowcell_all.apng')
+                size = assemble_apng(apng_file, frame_files, keyframe_interval=keyframe_interval)
+
+                self.assertEqual(size, os.path.getsize(apng_file))
+                frames, n_full = decode_apng(apng_file)
+                self.assertEqual(n_full, full_frames)
+                for n, (got, want) in enumerate(zip(frames, expected)):
+                    self.assertTrue(got == want, "Frame {} differs".format(n))
+                self.assertEqual(len(frames), len(expected))
+
+    def test_refuse_mismatched_frames(self):
+        """Frames that differ in type or palette from the first are refused, so the module
+           falls back to apngasm-noopt.
+        """
+        first = os.path.join(self.tmp_dir, 'first.png')
+        write_png(first, 2, [b'\0\1', b'\1\0'], colour_type=3, palette=b'\0\0\0\xff\xff\xff')
+
+        other_palette = os.path.join(self.tmp_dir, 'other_palette.png')
+        write_png(other_palette, 2, [b'\0\1', b'\1\0'], colour_type=3, palette=b'\0\0\0\xff\0\0')
+        rgb = os.path.join(self.tmp_dir, 'rgb.png')
+        write_png(rgb, 2, [bytes(6), bytes(6)])
+        bigger = os.path.join(self.tmp_dir, 'bigger.png')
+        write_png(bigger, 3, [b'\0\1\0', b'\1\0\1'], colour_type=3, palette=b'\0\0\0\xff\xff\xff')
+
+        out = os.path.join(self.tmp_dir, 'out.apng')
+        for bad in [other_palette, rgb, bigger]:
+            with self.subTest(bad=bad):
+                with self.assertRaises(ValueError):
+                    assemble_apng(out, [first, first, bad])
+
+        # The same palette is fine
+        same = os.path.join(self.tmp_dir, 'same.png')
+        write_png(same, 2, [b'\1\1', b'\0\0'], colour_type=3, palette=b'\0\0\0\xff\xff\xff')
+        assemble_apng(out, [first, same])
+        self.assertEqual(decode_apng(out)[0], [decode_png(first), decode_png(same)])
+
+        with self.assertRaises(ValueError):
+            assemble_apng(out, [first, same], keyframe_interval=-1)
+
+if __name__ == '__main__':
+    unittest.main()
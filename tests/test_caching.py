@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Test the caches kept between runs of MultiQC. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import unittest
+
+from multiqc_edgen.utils.caching import FileStatCache
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp_dir, 'cache', '0' * 40 + '.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_file(self, name, content='x'):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+        return path
+
+    def test_reports_share_the_cache(self):
+        """The overview and each lane save their own entries without losing the others'.
+        """
+        lane1 = self.make_file('lane1.log')
+        lane2 = self.make_file('lane2.log')
+
+        # The overview has no lane files, so it adds nothing
+        FileStatCache(self.cache_file).save()
+
+        # The lanes each add one in turn
+        for lane_files in [ [lane1], [lane2] ]:
+            cache = FileStatCache(self.cache_file)
+            for f in lane_files:
+                cache.put(f, f + ' parsed')
+            cache.save()
+
+        self.assertEqual(FileStatCache(self.cache_file).get(lane1), lane1 + ' parsed')
+        self.assertEqual(FileStatCache(self.cache_file).get(lane2), lane2 + ' parsed')
+
+        cache1, cache2 = FileStatCache(self.cache_file), FileStatCache(self.cache_file)
+        lane3 = self.make_file('lane3.log')
+        lane4 = self.make_file('lane4.log')
+        cache1.put(lane3, 'three')
+        cache2.put(lane4, 'four')
+        cache1.save()
+        cache2.save()
+
+        cache = FileStatCache(self.cache_file)
+        self.assertEqual( [ cache.get(f) for f in [lane1, lane2, lane3, lane4] ],
+                          [ lane1 + ' parsed', lane2 + ' parsed', 'three', 'four' ] )
+
+    def test_prune_on_save(self):
+        """Entries for files that have gone are dropped when the cache is next saved.
+        """
+        gone = self.make_file('gone.log')
+        kept = self.make_file('kept.log')
+
+        cache = FileStatCache(self.cache_file)
+        cache.put(gone, 1)
+        cache.put(kept, 2)
+        cache.save()
+
+        os.unlink(gone)
+        cache = FileStatCache(self.cache_file)
+        cache.put(self.make_file('new.log'), 3)
+        cache.save()
+
+        self.assertEqual(sorted(FileStatCache(self.cache_file).entries),
+                         sorted( os.path.join(self.tmp_dir, f) for f in ['kept.log', 'new.log'] ))
+
+    def test_invalidate(self):
+        """A saved result is only used while the file has the same size and mtime.
+        """
+        log = self.make_file('lane1.log', 'abc')
+        cache = FileStatCache(self.cache_file)
+        cache.put(log, 'parsed abc')
+        cache.save()
+        self.assertEqual(FileStatCache(self.cache_file).get(log), 'parsed abc')
+
+        # Same size, new mtime
+        st = os.stat(log)
+        self.make_file('lane1.log', 'xyz')
+        os.utime(log, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertIsNone(FileStatCache(self.cache_file).get(log))
+
+        # New size, same mtime
+        self.make_file('lane1.log', 'abcd')
+        os.utime(log, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertIsNone(FileStatCache(self.cache_file).get(log))
+
+        # A stat_key taken before the file changed under us keeps the result from being used
+        cache = FileStatCache(self.cache_file)
+        stat_key = FileStatCache.stat_key(log)
+        self.make_file('lane1.log', 'abcde')
+        cache.put(log, 'parsed abcd', stat_key)
+        self.assertIsNone(cache.get(log))
+
+        # And the file going away
+        cache.put(log, 'parsed abcde')
+        os.unlink(log)
+        self.assertIsNone(cache.get(log))
+
+    def test_bad_cache_file(self):
+        """A cache file from another version, or one that can't be read, is ignored.
+        """
+        log = self.make_file('lane1.log')
+        cache = FileStatCache(self.cache_file, version=1)
+        cache.put(log, 'v1')
+        cache.save()
+
+        self.assertEqual(FileStatCache(self.cache_file, version=1).get(log), 'v1')
+        self.assertIsNone(FileStatCache(self.cache_file, version=2).get(log))
+
+        with open(self.cache_file, 'wb') as fh:
+            fh.write(b'not a pickle')
+        self.assertEqual(FileStatCache(self.cache_file, version=1).entries, {})
+
+    def test_evict(self):
+        """The least recently used cache files are removed first, but never the one in use
+           or anything that isn't a cache file.
+        """
+        cache_dir = os.path.dirname(self.cache_file)
+
+        # Nothing to do if nothing was ever saved
+        FileStatCache(self.cache_file).evict(0)
+
+        os.makedirs(cache_dir)
+        cache_files = []
+        for n in range(1, 5):
+            fn = os.path.join(cache_dir, str(n) * 40 + '.pickle')
+            with open(fn, 'wb') as fh:
+                fh.write(bytes(1000))
+            os.utime(fn, (n * 1000, n * 1000))
+            cache_files.append(fn)
+        with open(os.path.join(cache_dir, 'notes.txt'), 'wb') as fh:
+            fh.write(bytes(10000))
+
+        # Using the oldest one keeps it, and the next oldest goes instead
+        cache = FileStatCache(cache_files[0])
+        cache.save()
+        cache.evict(3000)
+        self.assertEqual(sorted(os.listdir(cache_dir)), [ '1' * 40 + '.pickle', '3' * 40 + '.pickle',
+                                                          '4' * 40 + '.pickle', 'notes.txt' ])
+        cache.evict(0)
+        self.assertEqual(sorted(os.listdir(cache_dir)), [ '1' * 40 + '.pickle', 'notes.txt' ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+"""Test the edgen_cutadapt module. This needs MultiQC installed. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import io
+import unittest
+
+from multiqc.utils import config, report
+
+from multiqc_edgen.modules.edgen_cutadapt.edgen_cutadapt import MultiqcModule, read_cutadapt_logs
+from multiqc_edgen.utils import mqc_internals
+
+# The config settings the tests change, which are put back afterwards
+CONFIG_KEYS = [ 'data_dir', 'edgen_cutadapt' ]
+
+# A log from cutadapt 1.x, with quality trimming
+LOG_1_16 = """\
+This is cutadapt 1.16 with Python 3.6.3
+Command line parameters: -a AGATCGGAAGAGC -q 20 -O 3 -o trimmed/A.fastq.gz A.fastq.gz
+Running on 1 core
+Trimming 1 adapter with at most 10.0% errors in single-end mode ...
+Finished in 0.52 s (52 us/read; 1.15 M reads/minute).
+
+=== Summary ===
+
+Total reads processed:                  10,000
+Reads with adapters:                     1,234 (12.3%)
+Reads written (passing filters):        10,000 (100.0%)
+
+Total basepairs processed:     1,010,000 bp
+Quality-trimmed:                     2,345 bp (0.2%)
+Total written (filtered):      1,000,000 bp (99.0%)
+
+=== Adapter 1 ===
+
+Sequence: AGATCGGAAGAGC; Type: regular 3'; Length: 13; Trimmed: 1234 times.
+
+No. of allowed errors:
+0-9 bp: 0; 10-13 bp: 1
+
+Bases preceding removed adapters:
+  A: 27.6%
+  C: 30.2%
+  G: 23.5%
+  T: 18.6%
+  none/other: 0.1%
+
+Overview of removed sequences
+length	count	expect	max.err	error counts
+3	900	156.2	0	900
+4	200	39.1	0	200
+5	100	9.8	0	100
+101	34	0.0	1	30 4
+
+"""
+
+# A log from cutadapt 2.x, with two adapters and no quality trimming
+LOG_2_10 = """\
+This is cutadapt 2.10 with Python 3.8.5
+Command line parameters: -a AGATCGGAAGAGC -a CTGTCTCTTATA -o trimmed/B.fastq.gz B.fastq.gz
+Processing reads on 1 core in single-end mode ...
+Finished in 0.21 s (21 \u00b5s/read; 2.86 M reads/minute).
+
+=== Summary ===
+
+Total reads processed:                  10,000
+Reads with adapters:                       600 (6.0%)
+Reads written (passing filters):        10,000 (100.0%)
+
+Total basepairs processed:     1,510,000 bp
+Total written (filtered):      1,497,000 bp (99.1%)
+
+=== Adapter 1 ===
+
+Sequence: AGATCGGAAGAGC; Type: regular 3'; Length: 13; Trimmed: 400 times
+
+No. of allowed errors:
+0-9 bp: 0; 10-13 bp: 1
+
+Bases preceding removed adapters:
+  A: 25.0%
+  C: 25.0%
+  G: 25.0%
+  T: 25.0%
+  none/other: 0.0%
+
+Overview of removed sequences
+length	count	expect	max.err	error counts
+3	300	156.2	0	300
+4	70	39.1	0	70
+151	30	0.0	1	28 2
+
+=== Adapter 2 ===
+
+Sequence: CTGTCTCTTATA; Type: regular 3'; Length: 12; Trimmed: 200 times
+
+No. of allowed errors:
+0-9 bp: 0; 10-12 bp: 1
+
+Bases preceding removed adapters:
+  A: 25.0%
+  C: 25.0%
+  G: 25.0%
+  T: 25.0%
+  none/other: 0.0%
+
+Overview of removed sequences
+length	count	expect	max.err	error counts
+3	150	156.2	0	150
+5	50	9.8	0	50
+"""
+
+LOG_1_16_RESULT = ( 'A.fastq.gz',
+                    dict( adapter_count = 1,
+                          r_processed = 10000,
+                          r_with_adapters = 1234,
+                          bp_processed = 1010000,
+                          quality_trimmed = 2345,
+                          bp_written = 1000000 ),
+                    { 3: 900, 4: 200, 5: 100, 101: 34 } )
+
+LOG_2_10_RESULT = ( 'B.fastq.gz',
+                    dict( adapter_count = 2,
+                          r_processed = 10000,
+                          r_with_adapters = 600,
+                          bp_processed = 1510000,
+                          bp_written = 1497000 ),
+                    { 3: 450, 4: 70, 5: 50, 151: 30 } )
+
+# A sample with no reads at all
+LOG_NO_READS = """\
+This is cutadapt 2.10 with Python 3.8.5
+Command line parameters: -a AGATCGGAAGAGC -o trimmed/C.fastq.gz C.fastq.gz
+Processing reads on 1 core in single-end mode ...
+Finished in 0.00 s (0 \u00b5s/read; 0.00 M reads/minute).
+
+=== Summary ===
+
+Total reads processed:                       0
+Reads with adapters:                         0 (0.0%)
+Reads written (passing filters):             0 (0.0%)
+
+Total basepairs processed:             0 bp
+Total written (filtered):              0 bp (0.0%)
+"""
+
+def cutadapt_log(s_name, reads, read_length, histo):
+    """Log text for one sample, as cutadapt 1.16 writes it. histo is a dict of
+       bases removed to number of reads.
+    """
+    trimmed = sum(histo.values())
+    bp_trimmed = sum( l * c for l, c in histo.items() )
+    lines = [ "This is cutadapt 1.16 with Python 3.6.3",
+              "Command line parameters: -a AGATCGGAAGAGC -O 3 -o /dev/null {}".format(s_name),
+              "Running on 1 core",
+              "Trimming 1 adapter with at most 10.0% errors in single-end mode ...",
+              "Finished in 0.05 s (50 us/read; 1.20 M reads/minute).",
+              "",
+              "=== Summary ===",
+              "",
+              "Total reads processed:                 {:>7,}".format(reads),
+              "Reads with adapters:                   {:>7,} ({:.1f}%)".format(trimmed, 100.0 * trimmed / reads),
+              "Reads written (passing filters):       {:>7,} (100.0%)".format(reads),
+              "",
+              "Total basepairs processed:    {:>10,} bp".format(reads * read_length),
+              "Quality-trimmed:                       0 bp (0.0%)",
+              "Total written (filtered):     {:>10,} bp ({:.1f}%)".format( reads * read_length - bp_trimmed,
+                                                                         100.0 - 100.0 * bp_trimmed / (reads * read_length) ),
+              "",
+              "=== Adapter 1 ===",
+              "",
+              "Sequence: AGATCGGAAGAGC; Type: regular 3'; Length: 13; Trimmed: {} times.".format(trimmed),
+              "",
+              "No. of allowed errors:",
+              "0-9 bp: 0; 10-13 bp: 1",
+              "",
+              "Bases preceding removed adapters:",
+              "  A: 27.6%",
+              "  C: 30.2%",
+              "  G: 23.5%",
+              "  T: 18.6%",
+              "  none/other: 0.1%",
+              "",
+              "Overview of removed sequences",
+              "length\tcount\texpect\tmax.err\terror counts" ]
+    for l, c in sorted(histo.items()):
+        lines.append("{}\t{}\t{:.1f}\t{}\t{}".format(l, c, reads / 4.0**l, min(l // 10, 1), c))
+    lines += [ "", "" ]
+    return '\n'.join(lines)
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.data_dir = tempfile.mkdtemp()
+
+        self.saved_config = { k: getattr(config, k) for k in CONFIG_KEYS if hasattr(config, k) }
+        config.data_dir = self.data_dir
+        config.edgen_cutadapt = dict(cache=False)
+        self.log_files = list()
+
+    def tearDown(self):
+        for k in CONFIG_KEYS:
+            if k in self.saved_config:
+                setattr(config, k, self.saved_config[k])
+            elif hasattr(config, k):
+                delattr(config, k)
+        for d in [self.run_dir, self.data_dir]:
+            shutil.rmtree(d)
+
+    def add_log(self, fn, text):
+        """Put a log in the run and have MultiQC find it.
+        """
+        root = os.path.join(self.run_dir, os.path.dirname(fn))
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(self.run_dir, fn), 'w') as fh:
+            fh.write(text)
+        self.log_files.append(dict(root=root, fn=os.path.basename(fn)))
+
+    def run_module(self, **mod_config):
+        config.edgen_cutadapt = dict(config.edgen_cutadapt, **mod_config)
+        mqc_internals.reset_report()
+        report.files = dict(edgen_cutadapt=self.log_files)
+        return MultiqcModule()
+
+    def test_read_logs(self):
+        """Logs from cutadapt 1.x and 2.x give the same numbers.
+        """
+        for text, result in [ (LOG_1_16, LOG_1_16_RESULT), (LOG_2_10, LOG_2_10_RESULT) ]:
+            with self.subTest(version=text.split()[3]):
+                self.assertEqual(read_cutadapt_logs(io.StringIO(text)), [result])
+
+    def test_read_concatenated_logs(self):
+        """Our pipeline puts the logs for several samples in one file. Anything outside a
+           log, or a log with no command line, is skipped.
+        """
+        text = '\n'.join([ "Trimming lane 1",
+                           "Total reads processed: 99",
+                           LOG_2_10,
+                           "This is cutadapt 2.10 with Python 3.8.5",
+                           "cutadapt: error: Character 'X' in adapter sequence is not a valid IUPAC code.",
+                           "Total reads processed: 99",
+                           LOG_1_16 ])
+
+        self.assertEqual(read_cutadapt_logs(io.StringIO(text)), [LOG_2_10_RESULT, LOG_1_16_RESULT])
+
+    def test_length_histos(self):
+        """The histograms of lengths after trimming share one array of 64-bit counts,
+           padded to the longest reads.
+        """
+        self.add_log('cutadapt.log', LOG_1_16 + LOG_2_10 + LOG_NO_READS)
+        self.add_log('big.log', cutadapt_log('D.fastq.gz', 2**40, 51, {3: 2**33, 51: 2**34}))
+        m = self.run_module()
+
+        self.assertEqual(m.length_histo.typecode, 'q')
+        self.assertEqual(m.histo_width, 152)
+        self.assertEqual(len(m.length_histo), 152 * 4)
+
+        # A has 101bp reads, B 151bp. The last count is the reads left untrimmed, and
+        # reads trimmed to nothing count as length 0.
+        expected_a = [0] * 102
+        expected_a[101 - 3], expected_a[101 - 4], expected_a[101 - 5] = 900, 200, 100
+        expected_a[0], expected_a[101] = 34, 10000 - 1234
+        expected_b = [0] * 152
+        expected_b[151 - 3], expected_b[151 - 4], expected_b[151 - 5] = 450, 70, 50
+        expected_b[0], expected_b[151] = 30, 10000 - 600
+        expected_d = [0] * 52
+        expected_d[51 - 3], expected_d[0], expected_d[51] = 2**33, 2**34, 2**40 - 2**33 - 2**34
+
+        for s_name, expected in [ ('A', expected_a), ('B', expected_b), ('C', []), ('D', expected_d) ]:
+            with self.subTest(s_name=s_name):
+                self.assertEqual(m.length_histo_row(s_name).tolist(), expected)
+
+        # The padding is left as zeros
+        start, end = m.histo_rows['A']
+        self.assertEqual(m.length_histo[end:start + 152].tolist(), [0] * 50)
+
+        self.assertAlmostEqual(m.cutadapt_data['A']['percent_short'], 0.34)
+        self.assertAlmostEqual(m.cutadapt_data['B']['percent_short'], 0.3)
+        self.assertEqual(m.cutadapt_data['C']['percent_short'], 0.0)
+        self.assertAlmostEqual(m.cutadapt_data['D']['percent_short'], 100.0 * 2**34 / 2**40)
+
+        # The data file still gets plain lists
+        self.assertEqual(report.saved_raw_data['edgen_cutadapt']['B']['length_histo'], expected_b)
+
+    def test_pool_matches_serial(self):
+        """Parsing in a process pool gives just the same results as one file at a time.
+        """
+        for lane in [1, 2]:
+            for n in range(5):
+                # Two samples per log, with a range of histograms
+                samples = [ (lane * 100 + n * 2 + i, 5000 + 1000 * n, 50 + 25 * i) for i in range(2) ]
+                self.add_log( 'lane{}/cutadapt_{}.log'.format(lane, n),
+                              ''.join( cutadapt_log( '{}_{}.fastq.gz'.format(lane, s), reads, read_length,
+                                                     { l: (s * l) % 97 for l in range(3, read_length + 1, n + 1) } )
+                                       for s, reads, read_length in samples ) )
+
+        serial = self.run_module(processes=1)
+        pooled = self.run_module(processes=2)
+
+        self.assertEqual(len(serial.cutadapt_data), 20)
+        self.assertEqual(list(pooled.cutadapt_data), list(serial.cutadapt_data))
+        self.assertEqual(pooled.cutadapt_data, serial.cutadapt_data)
+        for s_name in serial.cutadapt_data:
+            with self.subTest(s_name=s_name):
+                self.assertEqual( pooled.length_histo_row(s_name).tolist(),
+                                  serial.length_histo_row(s_name).tolist() )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Test reading the unassigned barcode tables. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import unittest
+from io import StringIO
+
+from multiqc_edgen.modules.edgen_unassigned.edgen_unassigned import read_unassigned_table, table_lines
+
+TABLE = """\
+Lane 1
+Count\tBarcode\tGuess
+1,000\tCCCTCCAG+CATTTCTC\trevcomp of known index
+500\tTTGGGTGG+CGGACGCC\t
+1\tTGACGCTG+ATTTTACA\t
+"""
+
+class T(unittest.TestCase):
+
+    def test_title_and_header(self):
+        """The title has a number in it, but it is not a row.
+        """
+        res = read_unassigned_table(StringIO(TABLE), top_n=2)
+
+        self.assertEqual(res['header'], ["Lane 1", "Count\tBarcode\tGuess"])
+        self.assertEqual(res['rows'], 3)
+        self.assertEqual(res['total'], 1501)
+        self.assertEqual(res['top'], [ (1000, "1,000\tCCCTCCAG+CATTTCTC\trevcomp of known index"),
+                                       (500, "500\tTTGGGTGG+CGGACGCC") ])
+
+    def test_count_column(self):
+        """The count is taken from the Count column, wherever that is.
+        """
+        table = "Barcode Count\nCCCTCCAG 20\nTTGGGTGG 300\n"
+        res = read_unassigned_table(StringIO(table), top_n=1)
+
+        self.assertEqual(res['header'], ["Barcode Count"])
+        self.assertEqual(res['rows'], 2)
+        self.assertEqual(res['total'], 320)
+        self.assertEqual(res['top'], [ (300, "TTGGGTGG 300") ])
+
+    def test_total_truncated(self):
+        """The total is shown after the rows that were left out.
+        """
+        lines = table_lines(read_unassigned_table(StringIO(TABLE), top_n=2))
+
+        self.assertEqual(lines[-1], "... 1 more barcodes not shown. 1,501 reads in all 3 barcodes.")
+
+    def test_total_untruncated(self):
+        """The total is shown even when every row fits.
+        """
+        lines = table_lines(read_unassigned_table(StringIO(TABLE), top_n=10))
+
+        self.assertEqual(lines, [ "Lane 1",
+                                  "Count\tBarcode\tGuess",
+                                  "1,000\tCCCTCCAG+CATTTCTC\trevcomp of known index",
+                                  "500\tTTGGGTGG+CGGACGCC",
+                                  "1\tTGACGCTG+ATTTTACA",
+                                  "1,501 reads in all 3 barcodes." ])
+
+    def test_copy_to(self):
+        copy = StringIO()
+        read_unassigned_table(StringIO(TABLE), top_n=0, copy_to=copy)
+
+        self.assertEqual(copy.getvalue(), TABLE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""Test reading the InterOp GNUPlot scripts. This needs numpy. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import unittest
+
+from multiqc_edgen.modules.edgen_interop.gnuplot_script import parse_script, tokenize, UnsupportedScript
+
+LINES_SCRIPT = """\
+# Version: v1.1.10
+set terminal png crop size 800,400
+set output 'run_intensity-by-cycle_Intensity.png'
+set title "run Intensity"
+set xrange [0 : 52]
+set yrange [ * : 100 ] reverse
+set xlabel "Cycle"
+set ylabel "Intensity"
+set key outside
+set logscale y
+set grid
+plot "-" using 1:2 title "A" with lines lt rgb "red", \\
+     "-" using 1:2 title "C, G" with points lt rgb "blue"
+1\t1061.3
+2\t1037.6
+e
+1\t900.5
+2\t880.0
+e
+"""
+
+HEATMAP_SCRIPT = """\
+set terminal png crop size 640,480
+set output 'run_q-heatmap_Q-Heatmap.png'
+set cbrange [0 : 10]
+set palette defined (0 "white", 1 "blue", 2 "red")
+set view map
+plot "-" matrix with image
+0.0 1.0 2.0
+3.0 4.0 5.0
+e
+e
+"""
+
+BOXES_SCRIPT = """\
+set output 'run_qscore-histogram_Q-Histogram.png'
+set boxwidth 0.5
+plot "-" using 1:2 with boxes notitle
+10 200
+20 300
+30 50
+e
+reset
+unset key
+set output 'second.png'
+plot "-" with lines
+5
+6
+7
+e
+"""
+
+class T(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('plot "-" using 1:2 title "A, B" with lines, \'-\''),
+                         ['plot', '-', 'using', '1:2', 'title', 'A, B', 'with', 'lines', ',', '-'])
+        self.assertEqual(tokenize('"'), [])
+
+    def test_lines(self):
+        pages = parse_script(LINES_SCRIPT.splitlines())
+
+        self.assertEqual(len(pages), 1)
+        settings, plots = pages[0]
+        self.assertEqual(settings['output'], 'run_intensity-by-cycle_Intensity.png')
+        self.assertEqual(settings['size'], (800, 400))
+        self.assertEqual(settings['title'], 'run Intensity')
+        self.assertEqual(settings['xrange'], (0.0, 52.0))
+        self.assertEqual(settings['yrange'], (None, 100.0))
+        self.assertTrue(settings['yreverse'])
+        self.assertEqual((settings['xlabel'], settings['ylabel']), ('Cycle', 'Intensity'))
+        self.assertEqual(settings['key'], 'outside')
+        self.assertEqual(settings['logscale'], ('y',))
+
+        self.assertEqual( [ (s.style, s.title, s.colour) for s in plots ],
+                          [ ('lines', 'A', 'red'), ('points', 'C, G', 'blue') ] )
+        self.assertEqual(plots[0].data.tolist(), [[1, 1061.3], [2, 1037.6]])
+        self.assertEqual(plots[1].data.tolist(), [[1, 900.5], [2, 880.0]])
+
+    def test_heatmap(self):
+        pages = parse_script(HEATMAP_SCRIPT.splitlines())
+
+        self.assertEqual(len(pages), 1)
+        settings, plots = pages[0]
+        self.assertEqual(settings['cbrange'], (0.0, 10.0))
+        self.assertEqual(settings['palette'], ((0.0, 'white'), (1.0, 'blue'), (2.0, 'red')))
+        self.assertEqual(len(plots), 1)
+        self.assertEqual(plots[0].style, 'image')
+        self.assertEqual(plots[0].data.tolist(), [[0, 1, 2], [3, 4, 5]])
+
+    def test_boxes_and_reset(self):
+        pages = parse_script(BOXES_SCRIPT.splitlines())
+
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[0].settings['boxwidth'], 0.5)
+        self.assertEqual(pages[0].plots[0].style, 'boxes')
+        self.assertIsNone(pages[0].plots[0].title)
+        self.assertEqual(pages[0].plots[0].data.tolist(), [[10, 200], [20, 300], [30, 50]])
+
+        # reset drops the box width, and a single column is y values by position
+        self.assertEqual(pages[1].settings['output'], 'second.png')
+        self.assertIsNone(pages[1].settings['boxwidth'])
+        self.assertEqual(pages[1].settings['key'], 'off')
+        self.assertEqual(pages[1].plots[0].data.tolist(), [[0, 5], [1, 6], [2, 7]])
+
+    def test_unsupported(self):
+        """Anything beyond the simple scripts InterOp makes is left for GNUPlot.
+        """
+        unsupported = [ 'splot "-" matrix with image',
+                        'set multiplot',
+                        'plot "data.txt" using 1:2 with lines',
+                        'plot "-" using 1:($2*2) with lines',
+                        'plot "-" with errorbars',
+                        'plot "-" matrix with lines',
+                        'plot "-" with image',
+                        'plot "-" using 1:2:3 with lines',
+                        'plot "-" with',
+                        'plot',
+                        'set xrange [0 : 10] reverse',
+                        'set xrange [a : b]',
+                        'set logscale z',
+                        'set boxwidth wide',
+                        'set polar',
+                        'unset polar',
+                        'set title "A"; plot "-"',
+                        'pause -1',
+                        '"',
+                        '"set" output',
+                        ',' ]
+        for line in unsupported:
+            with self.subTest(line=line):
+                with self.assertRaises(UnsupportedScript):
+                    parse_script([line, '1 2', 'e'])
+
+        # Bad data blocks
+        for data in [ ['1 2', '3'], ['1 x'], ['1 2'] ]:
+            with self.subTest(data=data):
+                with self.assertRaises(UnsupportedScript):
+                    parse_script(['plot "-" using 1:2 with lines'] + data)
+
+if __name__ == '__main__':
+    unittest.main()
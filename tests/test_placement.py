@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""Test putting files into the report data directory. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import errno
+import unittest
+from unittest.mock import patch
+
+from multiqc_edgen.utils.placement import FilePlacer, data_dir_placer
+
+def os_error(code):
+    """A side_effect that fails the way the system call would.
+    """
+    def fail(*args, **kwargs):
+        raise OSError(code, os.strerror(code))
+    return fail
+
+class Config():
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, 'lane1_fastqc.html')
+        with open(self.src, 'w') as fh:
+            fh.write('<html>lane 1</html>')
+        os.utime(self.src, ns=(1000000000, 2000000000))
+        self.dest = os.path.join(self.tmp_dir, 'placed.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertPlaced(self, placer, strategy):
+        with open(self.dest) as fh:
+            self.assertEqual(fh.read(), '<html>lane 1</html>')
+        self.assertEqual(placer.counts, { 'skipped': 0, strategy: 1 })
+        self.assertEqual(os.path.islink(self.dest), strategy == 'symlink')
+        self.assertEqual(os.path.samefile(self.src, self.dest), strategy in ['link', 'symlink'])
+        if strategy in ['reflink', 'copy']:
+            self.assertEqual(os.stat(self.dest).st_mtime_ns, 2000000000)
+
+    def test_strategies(self):
+        """Each strategy works on its own, where the system supports it.
+        """
+        for strategy in ['link', 'copy', 'symlink']:
+            with self.subTest(strategy=strategy):
+                placer = FilePlacer([strategy])
+                self.assertEqual(placer.place(self.src, self.dest), self.dest)
+                self.assertPlaced(placer, strategy)
+                os.unlink(self.dest)
+
+        with self.assertRaises(ValueError):
+            FilePlacer(['teleport'])
+
+    def test_fallback(self):
+        """A strategy that fails with EXDEV (across filesystems) or EPERM (not allowed
+           here) falls through to the next one.
+        """
+        # The reflink strategy has two ways to go before it gives up
+        no_reflink = [ patch('fcntl.ioctl', side_effect=os_error(errno.EOPNOTSUPP)),
+                       patch('os.copy_file_range', side_effect=os_error(errno.EXDEV), create=True) ]
+
+        for strategies, fails, placed_by in [
+                ( ['link', 'copy'],      [patch('os.link', side_effect=os_error(errno.EXDEV))],     'copy' ),
+                ( ['link', 'copy'],      [patch('os.link', side_effect=os_error(errno.EPERM))],     'copy' ),
+                ( ['link', 'reflink'],   [patch('os.link', side_effect=os_error(errno.EXDEV))],     'reflink' ),
+                ( ['reflink', 'copy'],   no_reflink,                                                'copy' ),
+                ( ['reflink', 'link'],   no_reflink,                                                'link' ),
+                ( ['copy', 'symlink'],   [patch('shutil.copy2', side_effect=os_error(errno.EPERM))], 'symlink' ),
+                ( ['symlink', 'copy'],   [patch('os.symlink', side_effect=os_error(errno.EPERM))],  'copy' ) ]:
+            with self.subTest(strategies=strategies, placed_by=placed_by):
+                for p in fails:
+                    p.start()
+                try:
+                    placer = FilePlacer(strategies)
+                    placer.place(self.src, self.dest)
+                finally:
+                    for p in fails:
+                        p.stop()
+                self.assertPlaced(placer, placed_by)
+                os.unlink(self.dest)
+
+    def test_reflink_falls_back_to_copy_file_range(self):
+        """Without clone support, reflink has the kernel copy the data.
+        """
+        with patch('fcntl.ioctl', side_effect=os_error(errno.EOPNOTSUPP)):
+            placer = FilePlacer(['reflink'])
+            placer.place(self.src, self.dest)
+
+        if not hasattr(os, 'copy_file_range'):
+            self.skipTest("No copy_file_range on this system")
+        self.assertPlaced(placer, 'reflink')
+        self.assertEqual(placer.bytes_copied, os.path.getsize(self.src))
+
+    def test_partial_copy_removed(self):
+        """A copy that fails part way is removed before the next strategy is tried.
+        """
+        def partial_copy(src_fd, dest_fd, count, *args):
+            os.write(dest_fd, b'<ht')
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        with patch('fcntl.ioctl', side_effect=os_error(errno.EOPNOTSUPP)), \
+             patch('os.copy_file_range', side_effect=partial_copy, create=True):
+            placer = FilePlacer(['reflink', 'link'])
+            placer.place(self.src, self.dest)
+
+        self.assertPlaced(placer, 'link')
+
+    def test_all_fail(self):
+        with patch('os.link', side_effect=os_error(errno.EXDEV)), \
+             patch('shutil.copy2', side_effect=os_error(errno.ENOSPC)):
+            with self.assertRaises(OSError):
+                FilePlacer(['link', 'copy']).place(self.src, self.dest)
+        self.assertFalse(os.path.lexists(self.dest))
+
+    def test_already_placed(self):
+        """A file that is already in place, or an up to date copy, is skipped. An out of
+           date copy is replaced.
+        """
+        for strategy in ['link', 'copy']:
+            with self.subTest(strategy=strategy):
+                FilePlacer([strategy]).place(self.src, self.dest)
+                placer = FilePlacer([strategy])
+                placer.place(self.src, self.dest)
+                self.assertEqual(placer.counts, { 'skipped': 1 })
+                os.unlink(self.dest)
+
+        with open(self.dest, 'w') as fh:
+            fh.write('<html>old</html>')
+        placer = FilePlacer(['copy'])
+        placer.place(self.src, self.dest)
+        self.assertPlaced(placer, 'copy')
+
+    def test_data_dir_placer(self):
+        """MultiQC copies its temporary data dir at the end, so symlinks are enough there.
+        """
+        self.assertEqual(data_dir_placer(Config(data_dir='/tmp/x', data_tmp_dir='/tmp/x')).strategies,
+                         ['symlink', 'copy'])
+        self.assertEqual(data_dir_placer(Config(data_dir='/out/data', data_tmp_dir='/tmp/x')).strategies,
+                         ['link', 'reflink', 'copy'])
+        self.assertEqual(data_dir_placer(Config( data_dir='/out/data', data_tmp_dir='/tmp/x',
+                                                 edgen_file_placement=['copy'] )).strategies,
+                         ['copy'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""Smoke test for drawing the InterOp plots with matplotlib. This needs matplotlib and
+   numpy. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import struct
+import unittest
+
+from multiqc_edgen.modules.edgen_interop.plot_render import PlotRenderer
+
+from test_gnuplot_script import LINES_SCRIPT, HEATMAP_SCRIPT, BOXES_SCRIPT
+
+def png_size(filename):
+    """The width and height from the IHDR chunk, which always comes first.
+    """
+    with open(filename, 'rb') as fh:
+        head = fh.read(24)
+    assert head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR'
+    return struct.unpack('>II', head[16:24])
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.renderer = PlotRenderer()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_render(self):
+        for script, outputs in [ (LINES_SCRIPT, { 'run_intensity-by-cycle_Intensity.png': (800, 400) }),
+                                 (HEATMAP_SCRIPT, { 'run_q-heatmap_Q-Heatmap.png': (640, 480) }),
+                                 (BOXES_SCRIPT, { 'run_qscore-histogram_Q-Histogram.png': (640, 480),
+                                                  'second.png': (640, 480) }) ]:
+            self.assertTrue(self.renderer.render(script.splitlines(), self.tmp_dir))
+            for fn, size in outputs.items():
+                with self.subTest(fn=fn):
+                    self.assertEqual(png_size(os.path.join(self.tmp_dir, fn)), size)
+
+    def test_frames(self):
+        """Frames with the same layout re-use the figure.
+        """
+        for cycle in [1, 2]:
+            script = HEATMAP_SCRIPT.replace('Q-Heatmap.png', 'cycle_{}.png'.format(cycle))
+            self.assertTrue(self.renderer.render(script.splitlines(), self.tmp_dir))
+            if cycle == 1:
+                first_figure = self.renderer.last_figure
+
+        self.assertIs(self.renderer.last_figure, first_figure)
+        for cycle in [1, 2]:
+            self.assertEqual(png_size(os.path.join(self.tmp_dir, 'run_q-heatmap_cycle_{}.png'.format(cycle))),
+                             (640, 480))
+
+    def test_unsupported(self):
+        """A script the parser can't read is left for GNUPlot, and nothing is drawn.
+        """
+        self.assertFalse(self.renderer.render(['set output "x.png"', '"'], self.tmp_dir))
+        self.assertFalse(self.renderer.render(['set output "x.png"', 'splot "-" matrix', '1', 'e'], self.tmp_dir))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
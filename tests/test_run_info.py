@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""Test loading the run_info.*.yml metadata, and the cache kept between runs. This
+   needs MultiQC installed. Run with:
+   $ python3 -m unittest discover -s tests
+"""
+import os, shutil, tempfile
+import unittest
+from collections import OrderedDict
+from unittest.mock import patch
+
+import yaml
+from multiqc.utils import config
+
+from multiqc_edgen import multiqc_edgen
+from multiqc_edgen.multiqc_edgen import edgen_before_report
+
+# The config settings the tests change, which are put back afterwards
+CONFIG_KEYS = [ 'analysis_dir', 'edgen_run_info' ]
+
+RUN_INFO = { 1: "Run Info:\n  Run ID: 200101_A00001_0001_AHXXXXXXXX\n  LaneCount: 2\n",
+             2: "Pipeline Info:\n  Pipeline Version: v1\n",
+             10: "Pipeline Info:\n  Pipeline Version: v2\n  Pipeline Start Timestamp: 1577836800\n" }
+
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+
+        self.saved_config = { k: getattr(config, k) for k in CONFIG_KEYS if hasattr(config, k) }
+        config.analysis_dir = [self.run_dir]
+        config.edgen_run_info = dict(cache_dir=self.cache_dir)
+
+        for n, text in RUN_INFO.items():
+            self.write_run_info(n, text)
+
+        p = patch.dict(multiqc_edgen.yaml_caches, clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def tearDown(self):
+        for k in CONFIG_KEYS:
+            if k in self.saved_config:
+                setattr(config, k, self.saved_config[k])
+            elif hasattr(config, k):
+                delattr(config, k)
+        for d in [self.run_dir, self.cache_dir]:
+            shutil.rmtree(d)
+
+    def write_run_info(self, n, text):
+        with open(os.path.join(self.run_dir, 'run_info.{}.yml'.format(n)), 'w') as fh:
+            fh.write(text)
+
+    def load_all_yaml(self):
+        """Run just the loading part of edgen_before_report, counting the files parsed.
+        """
+        ebr = edgen_before_report.__new__(edgen_before_report)
+        ebr.yaml_data = OrderedDict()
+        ebr.yaml_flat = OrderedDict()
+
+        with patch('yaml.load', side_effect=yaml.load) as yaml_load:
+            ebr.load_all_yaml()
+        self.yaml_loads = yaml_load.call_count
+        return ebr
+
+    def test_load(self):
+        """Files are loaded in number order, and later sections replace earlier ones.
+        """
+        ebr = self.load_all_yaml()
+
+        self.assertEqual(list(ebr.yaml_data), ['Run Info', 'Pipeline Info'])
+        self.assertEqual(ebr.yaml_flat, { 'Run ID': '200101_A00001_0001_AHXXXXXXXX',
+                                          'LaneCount': 2,
+                                          'Pipeline Version': 'v2',
+                                          'Pipeline Start Timestamp': 1577836800 })
+        self.assertEqual(self.yaml_loads, 3)
+
+    def test_cache(self):
+        """Only new or changed files are parsed again, in this process or the next.
+        """
+        first = self.load_all_yaml()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # As for the next lane with --all-lanes
+        self.assertEqual(self.load_all_yaml().yaml_flat, first.yaml_flat)
+        self.assertEqual(self.yaml_loads, 0)
+        self.assertEqual(len(multiqc_edgen.yaml_caches), 1)
+
+        # As for the next run of MultiQC
+        multiqc_edgen.yaml_caches.clear()
+        self.assertEqual(self.load_all_yaml().yaml_flat, first.yaml_flat)
+        self.assertEqual(self.yaml_loads, 0)
+
+        # The pipeline adds a file and changes one
+        self.write_run_info(2, "Pipeline Info:\n  Pipeline Version: v1.1\n")
+        self.write_run_info(3, "Demux Info:\n  Barcodes: 12\n")
+        self.write_run_info(10, "Pipeline Info:\n  Pipeline Version: v3\n")
+        ebr = self.load_all_yaml()
+
+        self.assertEqual(self.yaml_loads, 3)
+        self.assertEqual(list(ebr.yaml_data), ['Run Info', 'Pipeline Info', 'Demux Info'])
+        self.assertEqual(ebr.yaml_flat['Pipeline Version'], 'v3')
+        self.assertNotIn('Pipeline Start Timestamp', ebr.yaml_flat)
+
+    def test_no_cache(self):
+        config.edgen_run_info = dict(cache_dir=self.cache_dir, cache=False)
+
+        for n in range(2):
+            self.load_all_yaml()
+            self.assertEqual(self.yaml_loads, 3)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertEqual(multiqc_edgen.yaml_caches, {})
+
+    def test_separate_runs(self):
+        """Each run has its own cache file.
+        """
+        self.load_all_yaml()
+
+        other_run = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_run)
+        shutil.copy(os.path.join(self.run_dir, 'run_info.1.yml'), other_run)
+        config.analysis_dir = [other_run]
+        ebr = self.load_all_yaml()
+
+        self.assertEqual(self.yaml_loads, 1)
+        self.assertEqual(list(ebr.yaml_data), ['Run Info'])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+if __name__ == '__main__':
+    unittest.main()